@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from omegaconf import DictConfig
+
+from app.api.endpoints.dates_coords_selection import get_config
+from app.api.schemas.climatology import ClimatologySelection
+from app.core.metrics import REQUESTS
+from app.utils.climatology import CUBES_DIR_NAME, MONTHS_FNAME, query_climatology
+
+climatology_router = APIRouter(prefix="/climatology", tags=["climatology"])
+
+
+@climatology_router.get("/")
+async def get_climatology(
+    selection: ClimatologySelection,
+    config: DictConfig = Depends(get_config),
+):
+    """
+    Gridded count/mean/std/max of the observable over the months of the
+    date range in the box, read from the cubes built offline (no tracks
+    are downloaded or read).
+    """
+    REQUESTS.inc(1, "climatology")
+
+    climatology_dir = Path(config.climatology.dir)
+    if not (climatology_dir / CUBES_DIR_NAME / MONTHS_FNAME).is_file():
+        raise HTTPException(
+            status_code=404,
+            detail="The climatology isn't built (python -m scripts.build_climatology)",
+        )
+    try:
+        grids = await run_in_threadpool(
+            query_climatology, climatology_dir, selection, config
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return JSONResponse(grids)
+    # ^ plain floats and None: no need for the (slow) 'jsonable_encoder'
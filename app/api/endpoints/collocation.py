@@ -0,0 +1,138 @@
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from omegaconf import DictConfig
+
+from app.api.endpoints.dates_coords_selection import (
+    get_admission_controller,
+    get_cached_h5_fpaths,
+    get_config,
+    get_fname_to_downsampled_points,
+    get_start_timestamps_to_h5_urls,
+)
+from app.api.schemas.collocation import CollocationPoints
+from app.core.admission import AdmissionController, admit_query, get_client_id
+from app.core.cache_index import SharedCacheIndex
+from app.core.cancellation import raise_if_cancelled, watch_disconnect
+from app.core.metrics import REQUESTS, TRACKS_SELECTED, StageTimings
+from app.utils.collocation import (
+    CollocationResults,
+    collocate_points_with_h5_file,
+    select_candidate_tracks_by_footprints,
+    select_candidate_tracks_by_time,
+    to_datetime64,
+)
+from app.utils.query_cost import estimate_collocation_cost
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    get_h5_fname,
+    remove_cached_h5_files,
+)
+
+collocation_router = APIRouter(prefix="/collocation", tags=["collocation"])
+
+
+@collocation_router.post("/")
+async def post_collocation(
+    points: CollocationPoints,
+    request: Request,
+    response: Response,
+    config: DictConfig = Depends(get_config),
+    fname_to_downsampled_points=Depends(get_fname_to_downsampled_points),
+    start_timestamps_to_h5_urls: dict = Depends(get_start_timestamps_to_h5_urls),
+    cached_h5_fpaths: SharedCacheIndex = Depends(get_cached_h5_fpaths),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+):
+    """
+    For each point (latitude, longitude, timestamp), the nearest footprint
+    or the mean over the footprints within the radius and the time window.
+    """
+    if len(points.latitude) > config.collocation.max_num_points:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config.collocation.max_num_points} points per request",
+        )
+
+    timings = StageTimings()
+    REQUESTS.inc(1, "collocation")
+
+    latitude = np.array(points.latitude)
+    longitude = np.array(points.longitude)
+    timestamps = to_datetime64(points.timestamp)
+    time_window = np.timedelta64(round(points.time_window_minutes * 60_000), "ms")
+
+    with timings.stage("select_by_date"):
+        h5_url_to_point_idxs = await run_in_threadpool(
+            select_candidate_tracks_by_time,
+            timestamps,
+            time_window,
+            start_timestamps_to_h5_urls,
+            config,
+        )
+    with timings.stage("select_by_coords"):
+        h5_url_to_point_idxs = await run_in_threadpool(
+            select_candidate_tracks_by_footprints,
+            h5_url_to_point_idxs,
+            latitude,
+            longitude,
+            points.radius_km,
+            fname_to_downsampled_points,
+            config,
+        )
+    TRACKS_SELECTED.inc(len(h5_url_to_point_idxs), "collocation")
+
+    try:
+        async with watch_disconnect(request) as cancelled, admit_query(
+            admission_controller,
+            get_client_id(request, config),
+            lambda: estimate_collocation_cost(
+                h5_url_to_point_idxs, timestamps, time_window, config, cached_h5_fpaths
+            ),
+        ):
+            if config.remote_reading.enabled:
+                h5_fpaths = list(h5_url_to_point_idxs)
+                # ^ read remotely by 'collocate_points_with_h5_file'
+            else:
+                with timings.stage("download"):
+                    h5_fpaths = await run_in_threadpool(
+                        download_missing_h5_files,
+                        list(h5_url_to_point_idxs),
+                        config,
+                        cached_h5_fpaths,
+                        cancelled,
+                    )
+
+            fname_to_point_idxs = {
+                get_h5_fname(h5_url, config): point_idxs
+                for h5_url, point_idxs in h5_url_to_point_idxs.items()
+            }
+            results = CollocationResults(len(latitude))
+            with timings.stage("collocate"):
+                for h5_fpath in h5_fpaths:
+                    raise_if_cancelled(cancelled)
+                    await run_in_threadpool(
+                        collocate_points_with_h5_file,
+                        h5_fpath,
+                        fname_to_point_idxs[get_h5_fname(h5_fpath, config)],
+                        latitude,
+                        longitude,
+                        timestamps,
+                        points.radius_km,
+                        time_window,
+                        config,
+                        results,
+                    )
+    finally:
+        if config.hdf_caching.remove_cached_files and not config.remote_reading.enabled:
+            remove_cached_h5_files(list(h5_url_to_point_idxs), config, cached_h5_fpaths)
+            # ^ also when the query is cancelled or fails
+
+    response.headers["Server-Timing"] = timings.server_timing_header()
+
+    return {
+        "aggregation": points.aggregation,
+        "num_tracks": len(h5_fpaths),
+        "table": results.to_table(points.aggregation),
+    }
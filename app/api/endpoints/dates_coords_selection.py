@@ -1,22 +1,31 @@
-import base64
-import io
-from collections import deque
+from contextlib import aclosing
+from typing import Literal
 
-import matplotlib.pyplot as plt
-import numpy as np
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from omegaconf import DictConfig
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
-from app.utils.map_drawing_matplotlib import draw_points, prepare_map
-from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.api.schemas.query_cost import QueryCostEstimate
+from app.core.admission import AdmissionController, admit_query, get_client_id
+from app.core.cache_index import SharedCacheIndex
+from app.core.cancellation import raise_if_cancelled, watch_disconnect
+from app.core.metrics import POINTS_RETURNED, REQUESTS, TRACKS_SELECTED, StageTimings
+from app.utils.parallel_extraction import (
+    ExtractionPool,
+    extract_in_order_in_threadpool,
+)
+from app.utils.prefetching import Prefetcher
+from app.utils.query_cost import estimate_query_cost
 from app.utils.track_file_names import (
     download_missing_h5_files,
     extract_start_timestamp_from_h5_url,
     extract_track_number_from_h5_url_or_fpath,
+    remove_cached_h5_files,
     select_h5_urls_by_coords,
-    select_h5_urls_by_date,
+    select_h5_urls_overlapping_dates,
 )
+from app.utils.wire_encoding import encode_h5_data
 
 dates_coords_selection_router = APIRouter(
     prefix="/dates_coords_selection", tags=["dates_coords_selection"]
@@ -35,73 +44,192 @@ async def get_start_timestamps_to_h5_urls(request: Request) -> dict:
     return request.app.state.start_timestamps_to_h5_urls
 
 
-async def get_cached_h5_fpaths(request: Request) -> deque:
+async def get_cached_h5_fpaths(request: Request) -> SharedCacheIndex:
     return request.app.state.cached_h5_fpaths
 
 
+async def get_prefetcher(request: Request) -> Prefetcher | None:
+    return getattr(request.app.state, "prefetcher", None)
+
+
+async def get_admission_controller(request: Request) -> AdmissionController | None:
+    return getattr(request.app.state, "admission_controller", None)
+
+
+async def get_extraction_pool(request: Request) -> ExtractionPool | None:
+    return getattr(request.app.state, "extraction_pool", None)
+
+
 @dates_coords_selection_router.get("/")
 async def get_dates_coords_selection(
     selection: DatesCoordsSelection,
+    request: Request,
+    response: Response,
     config: DictConfig = Depends(get_config),
     fname_to_downsampled_points=Depends(get_fname_to_downsampled_points),
     start_timestamps_to_h5_urls: dict = Depends(get_start_timestamps_to_h5_urls),
-    cached_h5_fpaths: deque = Depends(get_cached_h5_fpaths),
+    cached_h5_fpaths: SharedCacheIndex = Depends(get_cached_h5_fpaths),
+    prefetcher: Prefetcher | None = Depends(get_prefetcher),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+    extraction_pool: ExtractionPool | None = Depends(get_extraction_pool),
+    encoding: Literal["npz", "compact"] = "npz",
 ):
-    h5_urls_selected_by_date = select_h5_urls_by_date(
-        selection.date_start,
-        selection.date_end,
-        start_timestamps_to_h5_urls,
-    )
-    h5_urls_selected_by_coords = select_h5_urls_by_coords(
-        h5_urls_selected_by_date,
-        selection,
-        fname_to_downsampled_points,
-    )
-    h5_fpaths = download_missing_h5_files(
-        h5_urls_selected_by_coords, config, cached_h5_fpaths
-    )
-
-    track_number_to_image = {}
-    track_number_to_start_timestamp = {}
-    track_number_to_h5_data = {}
-
-    for h5_fpath in h5_fpaths:
-        h5_data = extract_segment_from_h5_file(h5_fpath, selection, config)
-
-        if (h5_data.latitude is not None) and (h5_data.latitude.size > 0):
-            track_number = extract_track_number_from_h5_url_or_fpath(h5_fpath, config)
-            start_timestamp = extract_start_timestamp_from_h5_url(h5_fpath, config)
-            track_number_to_start_timestamp[track_number] = start_timestamp
-
-            with io.BytesIO() as buffer:
-                np.savez(
-                    buffer,
-                    latitude=h5_data.latitude,
-                    longitude=h5_data.longitude,
-                    observable=h5_data.observable,
+    timings = StageTimings()
+    REQUESTS.inc(1, "dates_coords_selection")
+
+    with timings.stage("select_by_date"):
+        h5_urls_selected_by_date = await run_in_threadpool(
+            select_h5_urls_overlapping_dates,
+            selection,
+            start_timestamps_to_h5_urls,
+            config,
+        )
+    with timings.stage("select_by_coords"):
+        h5_urls_selected_by_coords = await run_in_threadpool(
+            select_h5_urls_by_coords,
+            h5_urls_selected_by_date,
+            selection,
+            fname_to_downsampled_points,
+        )
+    TRACKS_SELECTED.inc(len(h5_urls_selected_by_date), "date")
+    TRACKS_SELECTED.inc(len(h5_urls_selected_by_coords), "coords")
+
+    try:
+        async with watch_disconnect(request) as cancelled, admit_query(
+            admission_controller,
+            get_client_id(request, config),
+            lambda: estimate_query_cost(
+                h5_urls_selected_by_coords,
+                selection,
+                config,
+                fname_to_downsampled_points,
+                cached_h5_fpaths,
+            ),
+        ):
+            # the blocking stages run in threads, so the event loop keeps serving
+            # other requests and noticing the disconnect of this one
+            if config.remote_reading.enabled:
+                h5_fpaths = h5_urls_selected_by_coords
+                # ^ read remotely by 'extract_segment_from_h5_file'
+            else:
+                with timings.stage("download"):
+                    h5_fpaths = await run_in_threadpool(
+                        download_missing_h5_files,
+                        h5_urls_selected_by_coords,
+                        config,
+                        cached_h5_fpaths,
+                        cancelled,
+                    )
+
+            track_number_to_image = {}
+            track_number_to_start_timestamp = {}
+            track_number_to_h5_data = {}
+
+            if extraction_pool is not None:
+                extracted_segments = extraction_pool.extract_in_order(
+                    h5_fpaths, selection, config, fname_to_downsampled_points
                 )
-                h5_data_npz_base64 = base64.b64encode(buffer.getvalue()).decode()
-
-            track_number_to_h5_data[track_number] = h5_data_npz_base64
-
-            fig, ax = prepare_map(f"Track number {track_number}", selection)
-            draw_points(fig, ax, h5_data.latitude, h5_data.longitude)
-
-            with io.BytesIO() as buffer:
-                plt.savefig(buffer, format="jpg")
-                image_base64 = base64.b64encode(buffer.getvalue()).decode()
-
-            plt.close()
-            track_number_to_image[track_number] = image_base64
-
-    if config.hdf_caching.remove_cached_files:
-        for h5_fpath in h5_fpaths:
-            h5_fpath.unlink()
-            cached_h5_fpaths.pop()
+                # ^ the next tracks are extracted while this one is encoded and rendered
+            else:
+                extracted_segments = extract_in_order_in_threadpool(
+                    h5_fpaths, selection, config, fname_to_downsampled_points
+                )
+            async with aclosing(extracted_segments):
+                for h5_fpath in h5_fpaths:
+                    raise_if_cancelled(cancelled)
+                    with timings.stage("extract"):
+                        h5_data = await anext(extracted_segments)
+
+                    if (h5_data.latitude is not None) and (h5_data.latitude.size > 0):
+                        track_number = extract_track_number_from_h5_url_or_fpath(
+                            h5_fpath, config
+                        )
+                        start_timestamp = extract_start_timestamp_from_h5_url(
+                            h5_fpath, config
+                        )
+                        track_number_to_start_timestamp[track_number] = start_timestamp
+                        POINTS_RETURNED.inc(h5_data.observable.size)
+
+                        with timings.stage("encode"):
+                            track_number_to_h5_data[track_number] = (
+                                await run_in_threadpool(
+                                    encode_h5_data, h5_data, encoding, config
+                                )
+                            )
+
+                        raise_if_cancelled(cancelled)
+                        with timings.stage("render_image"):
+                            from app.utils.map_drawing_matplotlib import (
+                                render_track_image_base64,
+                            )
+
+                            # ^ imported on first use: matplotlib and cartopy are slow to import
+                            track_number_to_image[track_number] = (
+                                await run_in_threadpool(
+                                    render_track_image_base64,
+                                    track_number,
+                                    selection,
+                                    h5_data.latitude,
+                                    h5_data.longitude,
+                                )
+                            )
+    finally:
+        if config.hdf_caching.remove_cached_files and not config.remote_reading.enabled:
+            remove_cached_h5_files(h5_urls_selected_by_coords, config, cached_h5_fpaths)
+            # ^ also when the query is cancelled or fails: by the URLs, since
+            #   'h5_fpaths' is unset when the download is interrupted
+
+    if prefetcher is not None:
+        prefetcher.schedule(selection)
+
+    response.headers["Server-Timing"] = timings.server_timing_header()
 
     return {
+        "encoding": encoding,
         "track_number_to_h5_data": track_number_to_h5_data,
         "track_number_to_start_timestamp": track_number_to_start_timestamp,
         "h5_urls_selected_by_date": h5_urls_selected_by_date,
         "h5_urls_selected_by_coords": h5_urls_selected_by_coords,
     }
+
+
+@dates_coords_selection_router.get("/estimate")
+async def get_dates_coords_selection_estimate(
+    selection: DatesCoordsSelection,
+    config: DictConfig = Depends(get_config),
+    fname_to_downsampled_points=Depends(get_fname_to_downsampled_points),
+    start_timestamps_to_h5_urls: dict = Depends(get_start_timestamps_to_h5_urls),
+    cached_h5_fpaths: SharedCacheIndex = Depends(get_cached_h5_fpaths),
+) -> QueryCostEstimate:
+    """
+    Dry run: the cost of the selection estimated from the catalog, the
+    downsampled swath points and the cache index; nothing is downloaded or read
+    """
+    REQUESTS.inc(1, "dates_coords_selection_estimate")
+
+    h5_urls_selected_by_date = await run_in_threadpool(
+        select_h5_urls_overlapping_dates,
+        selection,
+        start_timestamps_to_h5_urls,
+        config,
+    )
+    h5_urls_selected_by_coords = await run_in_threadpool(
+        select_h5_urls_by_coords,
+        h5_urls_selected_by_date,
+        selection,
+        fname_to_downsampled_points,
+    )
+    query_cost = await run_in_threadpool(
+        estimate_query_cost,
+        h5_urls_selected_by_coords,
+        selection,
+        config,
+        fname_to_downsampled_points,
+        cached_h5_fpaths,
+    )
+    return QueryCostEstimate(
+        num_tracks_by_date=len(h5_urls_selected_by_date),
+        **query_cost.model_dump(),
+    )
@@ -0,0 +1,157 @@
+import threading
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from omegaconf import DictConfig
+
+from app.api.endpoints.dates_coords_selection import (
+    get_admission_controller,
+    get_cached_h5_fpaths,
+    get_config,
+    get_fname_to_downsampled_points,
+    get_start_timestamps_to_h5_urls,
+)
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.admission import (
+    AdmissionController,
+    AdmittedStreamingResponse,
+    get_client_id,
+)
+from app.core.cache_index import SharedCacheIndex
+from app.core.cancellation import QueryCancelled, raise_if_cancelled
+from app.core.metrics import POINTS_RETURNED, REQUESTS, TRACKS_SELECTED
+from app.utils.export import (
+    EXPORT_FORMATS_TO_EXTENSIONS,
+    EXPORT_FORMATS_TO_MEDIA_TYPES,
+    generate_export_chunks,
+)
+from app.utils.query_cost import estimate_query_cost
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    extract_start_timestamp_from_h5_url,
+    extract_track_number_from_h5_url_or_fpath,
+    get_h5_fname,
+    remove_cached_h5_files,
+    select_h5_urls_by_coords,
+    select_h5_urls_overlapping_dates,
+)
+
+export_router = APIRouter(prefix="/export", tags=["export"])
+
+
+@export_router.get("/")
+async def get_export(
+    selection: DatesCoordsSelection,
+    request: Request,
+    config: DictConfig = Depends(get_config),
+    fname_to_downsampled_points=Depends(get_fname_to_downsampled_points),
+    start_timestamps_to_h5_urls: dict = Depends(get_start_timestamps_to_h5_urls),
+    cached_h5_fpaths: SharedCacheIndex = Depends(get_cached_h5_fpaths),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+    export_format: Literal["csv", "parquet", "netcdf"] = "csv",
+):
+    """
+    Streams the selected points of all tracks as a single file; the tracks are
+    downloaded and extracted one at a time, so the memory use doesn't depend
+    on their number. NetCDF is the exception: it is written to a temporary
+    file first and sent once complete (see 'generate_netcdf_chunks').
+    """
+    REQUESTS.inc(1, "export")
+
+    h5_urls = await run_in_threadpool(
+        select_h5_urls_overlapping_dates,
+        selection,
+        start_timestamps_to_h5_urls,
+        config,
+    )
+    h5_urls = await run_in_threadpool(
+        select_h5_urls_by_coords, h5_urls, selection, fname_to_downsampled_points
+    )
+    h5_urls = sorted(
+        h5_urls, key=lambda h5_url: extract_start_timestamp_from_h5_url(h5_url, config)
+    )
+    TRACKS_SELECTED.inc(len(h5_urls), "export")
+
+    ticket = None
+    if admission_controller is not None:
+        query_cost = await run_in_threadpool(
+            estimate_query_cost,
+            h5_urls,
+            selection,
+            config,
+            fname_to_downsampled_points,
+            cached_h5_fpaths,
+        )
+        ticket = await admission_controller.acquire(
+            get_client_id(request, config), query_cost
+        )
+        # ^ released by the response when the streaming ends
+
+    cancelled = threading.Event()
+    # ^ set by the response when the streaming ends (e.g. the client has gone)
+
+    def generate_segments():
+        try:
+            for h5_url in h5_urls:
+                raise_if_cancelled(cancelled)
+                try:
+                    if config.remote_reading.enabled:
+                        h5_fpaths = [h5_url]
+                        # ^ read remotely by 'extract_segment_from_h5_file'
+                    else:
+                        h5_fpaths = download_missing_h5_files(
+                            [h5_url], config, cached_h5_fpaths, cancelled
+                        )
+                    segments = [
+                        (
+                            h5_fpath,
+                            extract_segment_from_h5_file(
+                                h5_fpath,
+                                selection,
+                                config,
+                                fname_to_downsampled_points[
+                                    get_h5_fname(h5_fpath, config)
+                                ],
+                            ),
+                        )
+                        for h5_fpath in h5_fpaths
+                    ]
+                finally:
+                    if (
+                        config.hdf_caching.remove_cached_files
+                        and not config.remote_reading.enabled
+                    ):
+                        remove_cached_h5_files([h5_url], config, cached_h5_fpaths)
+                        # ^ also when the query is cancelled or fails
+                for h5_fpath, h5_data in segments:
+                    if (h5_data.latitude is not None) and (h5_data.latitude.size > 0):
+                        POINTS_RETURNED.inc(h5_data.observable.size)
+                        yield (
+                            int(
+                                extract_track_number_from_h5_url_or_fpath(
+                                    h5_fpath, config
+                                )
+                            ),
+                            extract_start_timestamp_from_h5_url(h5_fpath, config),
+                            h5_data,
+                        )
+        except QueryCancelled:
+            return
+            # ^ nobody reads the rest
+
+    fname = (
+        f"{config.hdf_observable.value_name}_{selection.date_start}_{selection.date_end}"
+        f"{EXPORT_FORMATS_TO_EXTENSIONS[export_format]}"
+    )
+    return AdmittedStreamingResponse(
+        generate_export_chunks(generate_segments(), export_format, config, cancelled),
+        cancelled,
+        admission_controller,
+        ticket,
+        media_type=EXPORT_FORMATS_TO_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{fname}"'},
+    )
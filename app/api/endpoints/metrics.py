@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics_snapshots import MetricsSnapshots
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+async def get_metrics_snapshots(request: Request) -> MetricsSnapshots:
+    return request.app.state.metrics_snapshots
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(
+    metrics_snapshots: MetricsSnapshots = Depends(get_metrics_snapshots),
+):
+    return PlainTextResponse(
+        await run_in_threadpool(metrics_snapshots.render),
+        media_type="text/plain; version=0.0.4",
+    )
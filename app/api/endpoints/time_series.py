@@ -0,0 +1,146 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from omegaconf import DictConfig
+
+from app.api.endpoints.dates_coords_selection import (
+    get_admission_controller,
+    get_cached_h5_fpaths,
+    get_config,
+    get_fname_to_downsampled_points,
+    get_start_timestamps_to_h5_urls,
+)
+from app.api.schemas.time_series import TimeSeriesSelection
+from app.core.admission import (
+    AdmissionController,
+    AdmittedStreamingResponse,
+    get_client_id,
+)
+from app.core.cache_index import SharedCacheIndex
+from app.core.cancellation import QueryCancelled, raise_if_cancelled
+from app.core.metrics import REQUESTS, TRACKS_SELECTED
+from app.utils.query_cost import estimate_time_series_cost
+from app.utils.time_series import (
+    extract_site_overpass,
+    map_in_order,
+    select_h5_urls_near_site,
+)
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    get_h5_fname,
+    remove_cached_h5_files,
+    select_h5_urls_overlapping_dates,
+)
+
+time_series_router = APIRouter(prefix="/time_series", tags=["time_series"])
+
+
+@time_series_router.get("/")
+async def get_time_series(
+    selection: TimeSeriesSelection,
+    request: Request,
+    config: DictConfig = Depends(get_config),
+    fname_to_downsampled_points=Depends(get_fname_to_downsampled_points),
+    start_timestamps_to_h5_urls: dict = Depends(get_start_timestamps_to_h5_urls),
+    cached_h5_fpaths: SharedCacheIndex = Depends(get_cached_h5_fpaths),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+):
+    """
+    Streams one NDJSON record (time, distance, observable, ...) per overpass
+    over the site, ordered by time.
+    """
+    REQUESTS.inc(1, "time_series")
+
+    h5_urls = await run_in_threadpool(
+        select_h5_urls_overlapping_dates,
+        selection,
+        start_timestamps_to_h5_urls,
+        config,
+    )
+    h5_urls = await run_in_threadpool(
+        select_h5_urls_near_site,
+        h5_urls,
+        selection,
+        fname_to_downsampled_points,
+        config,
+    )
+    TRACKS_SELECTED.inc(len(h5_urls), "time_series")
+
+    ticket = None
+    if admission_controller is not None:
+        query_cost = await run_in_threadpool(
+            estimate_time_series_cost,
+            h5_urls,
+            selection,
+            config,
+            fname_to_downsampled_points,
+            cached_h5_fpaths,
+        )
+        ticket = await admission_controller.acquire(
+            get_client_id(request, config), query_cost
+        )
+        # ^ released by the response when the streaming ends
+
+    cancelled = threading.Event()
+    # ^ set by the response when the streaming ends (e.g. the client has gone)
+
+    def download_and_extract(h5_url: str) -> dict | None:
+        raise_if_cancelled(cancelled)
+        try:
+            if config.remote_reading.enabled:
+                h5_fpath = h5_url
+                # ^ read remotely by 'extract_site_overpass'
+            else:
+                h5_fpaths = download_missing_h5_files(
+                    [h5_url], config, cached_h5_fpaths, cancelled
+                )
+                if len(h5_fpaths) == 0:
+                    return None
+                h5_fpath = h5_fpaths[0]
+            return extract_site_overpass(
+                h5_fpath,
+                selection,
+                config,
+                fname_to_downsampled_points[get_h5_fname(h5_fpath, config)],
+            )
+        except FileNotFoundError:
+            return None
+            # ^ evicted from the cache by another request in the meantime
+            #   (or missing on the server)
+        finally:
+            if (
+                config.hdf_caching.remove_cached_files
+                and not config.remote_reading.enabled
+            ):
+                remove_cached_h5_files([h5_url], config, cached_h5_fpaths)
+                # ^ also when the query is cancelled or fails
+
+    def generate_records():
+        num_workers = config.time_series.num_workers
+        executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="time-series"
+        )
+        try:
+            for record in map_in_order(
+                executor, download_and_extract, h5_urls, 2 * num_workers
+            ):
+                if record is not None:
+                    yield json.dumps(record) + "\n"
+        except QueryCancelled:
+            return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            # ^ the running jobs stop at the next check of 'cancelled'
+
+    return AdmittedStreamingResponse(
+        generate_records(),
+        cancelled,
+        admission_controller,
+        ticket,
+        media_type="application/x-ndjson",
+    )
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class CollocationPoints(BaseModel):
+    """
+    The user request contains the points (as columns of equal length),
+    the search radius, the time window and the aggregation method.
+    """
+
+    latitude: list[float] = Field(..., min_length=1, description="Latitudes")
+    longitude: list[float] = Field(..., min_length=1, description="Longitudes")
+    timestamp: list[datetime] = Field(
+        ..., min_length=1, description="UTC timestamps (yyyy-mm-ddThh:mm:ss)"
+    )
+    radius_km: float = Field(25.0, gt=0.0, le=500.0, description="Search radius (km)")
+    time_window_minutes: float = Field(
+        30.0, gt=0.0, le=1440.0, description="Max time difference (minutes)"
+    )
+    aggregation: Literal["nearest", "mean"] = Field(
+        "nearest",
+        description="Value of the nearest footprint or mean over the footprints",
+    )
+
+    @model_validator(mode="after")
+    def check_columns_lengths(self) -> "CollocationPoints":
+        if not (len(self.latitude) == len(self.longitude) == len(self.timestamp)):
+            raise ValueError(
+                "latitude, longitude and timestamp must be of equal length"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_coords_ranges(self) -> "CollocationPoints":
+        if not all(-90.0 <= latitude <= 90.0 for latitude in self.latitude):
+            raise ValueError("latitude must be within [-90, 90]")
+        if not all(-180.0 <= longitude <= 180.0 for longitude in self.longitude):
+            raise ValueError("longitude must be within [-180, 180]")
+        return self
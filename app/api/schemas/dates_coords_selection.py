@@ -6,7 +6,8 @@ from pydantic import BaseModel, Field, model_validator
 class DatesCoordsSelection(BaseModel):
     """
     The user request contains the date range,
-    the latitude range and the longitude range.
+    the latitude range and the longitude range
+    (or a polygon, then the ranges are its bounding box).
     """
 
     date_start: date = Field(..., description="Start date (yyyy-mm-dd)")
@@ -15,6 +16,31 @@ class DatesCoordsSelection(BaseModel):
     latitude_max: float = Field(+90.0, le=+90.0, description="Maximum latitude")
     longitude_min: float = Field(-180.0, ge=-180.0, description="Minimum longitude")
     longitude_max: float = Field(+180.0, le=+180.0, description="Maximum longitude")
+    roi_geometry: dict | None = Field(
+        None,
+        description="ROI polygon or multipolygon (GeoJSON geometry, lon/lat), optional",
+    )
+
+    @model_validator(mode="after")
+    def check_roi_geometry(self) -> "DatesCoordsSelection":
+        if self.roi_geometry is None:
+            return self
+        from app.utils.geometry import get_roi_geometry
+
+        # ^ imported here: 'geometry' imports this module
+        geometry = get_roi_geometry(self.roi_geometry)
+        longitude_min, latitude_min, longitude_max, latitude_max = geometry.bounds
+        if not (
+            (-90.0 <= latitude_min <= latitude_max <= 90.0)
+            and (-180.0 <= longitude_min <= longitude_max <= 180.0)
+        ):
+            raise ValueError("roi_geometry must be within [-180, 180] x [-90, 90]")
+        self.latitude_min = latitude_min
+        self.latitude_max = latitude_max
+        self.longitude_min = longitude_min
+        self.longitude_max = longitude_max
+        # ^ the tracks are pruned by the bounding box
+        return self
 
     @model_validator(mode="after")
     def check_date_start_end(self) -> "DatesCoordsSelection":
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+
+
+class QueryCost(BaseModel):
+    """Cost of a selection estimated before downloading or reading anything"""
+
+    num_tracks_by_footprint: int = Field(
+        ...,
+        description=(
+            "Tracks whose footprint (downsampled swath) reaches the ROI, "
+            "the site or the points, among the tracks selected by date"
+        ),
+    )
+    num_tracks_cached: int = Field(
+        ..., description="Tracks selected by footprint already in the cache"
+    )
+    bytes_to_download: int = Field(..., description="Estimated bytes to fetch")
+    estimated_points: int = Field(..., description="Estimated points in the ROI")
+    estimated_seconds: float = Field(..., description="Estimated processing time")
+
+
+class QueryCostEstimate(QueryCost):
+    """Response of the dry run: the cost and the tracks selected by date only"""
+
+    num_tracks_by_date: int = Field(
+        ..., description="Tracks whose time span overlaps the date range"
+    )
@@ -0,0 +1,27 @@
+from datetime import date
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class TimeSeriesSelection(BaseModel):
+    """
+    The user request contains the site coordinates, the search radius and
+    the date range (not limited to 31 days, may span the whole archive).
+    """
+
+    latitude: float = Field(..., ge=-90.0, le=90.0, description="Site latitude")
+    longitude: float = Field(..., ge=-180.0, le=180.0, description="Site longitude")
+    date_start: date = Field(..., description="Start date (yyyy-mm-dd)")
+    date_end: date = Field(..., description="End date (yyyy-mm-dd)")
+    radius_km: float = Field(10.0, gt=0.0, le=500.0, description="Search radius (km)")
+    aggregation: Literal["nearest", "mean"] = Field(
+        "nearest",
+        description="Value of the nearest footprint or mean over the footprints",
+    )
+
+    @model_validator(mode="after")
+    def check_date_start_end(self) -> "TimeSeriesSelection":
+        if self.date_end < self.date_start:
+            raise ValueError("date_end must be greater or equal to date_start")
+        return self
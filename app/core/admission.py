@@ -0,0 +1,242 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from omegaconf import DictConfig
+
+from app.api.schemas.query_cost import QueryCost
+from app.core.cancellation import CancellableStreamingResponse
+from app.core.metrics import ADMISSION_DECISIONS
+
+DURATION_SMOOTHING = 0.2
+# ^ weight of the last query in the moving average of the query durations
+
+
+class AdmissionTicket:
+    def __init__(self, client_id: str, num_bytes: int, bypassed: bool):
+        self.client_id = client_id
+        self.num_bytes = num_bytes
+        self.bypassed = bypassed
+        self.time_start = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Limits the number of the expensive queries running at once and the bytes
+    they download (per worker process). The waiting queries are queued per
+    client and the clients are served in turn, so a client sending many heavy
+    queries delays mostly itself. The cheap queries (everything cached, few
+    points and a short estimated time) are never queued. A query that cannot be queued is rejected with
+    429 (too many queries of this client) or 503 (the server is busy), with
+    the 'Retry-After' header estimated from the recent query durations.
+
+    Must be used from the event loop (not thread-safe).
+    """
+
+    def __init__(self, config: DictConfig):
+        self.max_concurrent_queries = config.admission.max_concurrent_queries
+        self.max_inflight_bytes = config.admission.max_inflight_bytes
+        self.max_queued_queries = config.admission.max_queued_queries
+        self.max_queued_per_client = config.admission.max_queued_per_client
+        self.max_queue_wait_seconds = config.admission.max_queue_wait_seconds
+        self.cheap_max_points = config.admission.cheap_max_points
+        self.cheap_max_seconds = config.admission.cheap_max_seconds
+        self.num_running = 0
+        self.inflight_bytes = 0
+        self.client_queues = OrderedDict()
+        # ^ {client id: deque of (future, bytes)}, in the order of serving
+        self.mean_duration_seconds = 1.0
+
+    def is_cheap(self, cost: QueryCost) -> bool:
+        return (
+            (cost.bytes_to_download == 0)
+            and (cost.estimated_points <= self.cheap_max_points)
+            and (cost.estimated_seconds <= self.cheap_max_seconds)
+        )
+
+    def can_start(self, num_bytes: int) -> bool:
+        return (self.num_running < self.max_concurrent_queries) and (
+            self.inflight_bytes + num_bytes <= self.max_inflight_bytes
+        )
+
+    def has_spare_budget(self, num_bytes: int) -> bool:
+        """
+        No query waits and one more download of 'num_bytes' fits in the
+        budgets; only reads the counters, so it can be called from other
+        threads (as a hint, e.g. by the prefetcher)
+        """
+        return (not self.client_queues) and self.can_start(num_bytes)
+
+    def num_queued(self) -> int:
+        return sum(len(queue) for queue in self.client_queues.values())
+
+    def retry_after_seconds(self) -> int:
+        return max(
+            math.ceil(
+                self.mean_duration_seconds
+                * (self.num_queued() + 1)
+                / self.max_concurrent_queries
+            ),
+            1,
+        )
+
+    def reject(self, status_code: int, detail: str, decision: str):
+        ADMISSION_DECISIONS.inc(1, decision)
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after_seconds())},
+        )
+
+    def start(self, num_bytes: int) -> None:
+        self.num_running += 1
+        self.inflight_bytes += num_bytes
+
+    def stop(self, num_bytes: int) -> None:
+        self.num_running -= 1
+        self.inflight_bytes -= num_bytes
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """Start the queued queries in turn while the budgets allow"""
+        while self.client_queues:
+            client_id, queue = next(iter(self.client_queues.items()))
+            future, num_bytes = queue[0]
+            if future.done():
+                queue.popleft()
+                # ^ timed out or cancelled while waiting
+            elif self.can_start(num_bytes):
+                queue.popleft()
+                self.start(num_bytes)
+                future.set_result(None)
+                self.client_queues.move_to_end(client_id)
+            else:
+                return
+                # ^ the next client in turn waits for the budget, no overtaking
+            if not queue:
+                del self.client_queues[client_id]
+
+    def remove_waiter(self, client_id: str, future: asyncio.Future) -> None:
+        queue = self.client_queues.get(client_id)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is future:
+                queue.remove(item)
+                break
+        if not queue:
+            del self.client_queues[client_id]
+        self.dispatch()
+        # ^ the removed query may have blocked the others
+
+    async def acquire(self, client_id: str, cost: QueryCost) -> AdmissionTicket:
+        if self.is_cheap(cost):
+            ADMISSION_DECISIONS.inc(1, "bypassed")
+            return AdmissionTicket(client_id, 0, bypassed=True)
+
+        num_bytes = min(cost.bytes_to_download, self.max_inflight_bytes)
+        # ^ a query above the budget runs alone
+        if not self.client_queues and self.can_start(num_bytes):
+            ADMISSION_DECISIONS.inc(1, "admitted")
+            self.start(num_bytes)
+            return AdmissionTicket(client_id, num_bytes, bypassed=False)
+
+        if len(self.client_queues.get(client_id, ())) >= self.max_queued_per_client:
+            raise self.reject(
+                429,
+                "Too many queries of this client are waiting, retry later",
+                "rejected_client",
+            )
+        if self.num_queued() >= self.max_queued_queries:
+            raise self.reject(503, "The server is busy, retry later", "rejected_busy")
+
+        future = asyncio.get_running_loop().create_future()
+        self.client_queues.setdefault(client_id, deque()).append((future, num_bytes))
+        try:
+            await asyncio.wait_for(future, self.max_queue_wait_seconds)
+        except asyncio.TimeoutError:
+            self.remove_waiter(client_id, future)
+            raise self.reject(
+                503, "The query waited too long in the queue", "timed_out"
+            ) from None
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.stop(num_bytes)
+                # ^ admitted just before the request was cancelled
+            else:
+                self.remove_waiter(client_id, future)
+            raise
+
+        ADMISSION_DECISIONS.inc(1, "queued")
+        return AdmissionTicket(client_id, num_bytes, bypassed=False)
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        if ticket.bypassed:
+            return
+        self.mean_duration_seconds += DURATION_SMOOTHING * (
+            time.monotonic() - ticket.time_start - self.mean_duration_seconds
+        )
+        self.stop(ticket.num_bytes)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, cost: QueryCost):
+        ticket = await self.acquire(client_id, cost)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+
+def get_client_id(request: Request, config: DictConfig) -> str:
+    """The configured header (e.g. set by a reverse proxy) or the client address"""
+    header_name = config.admission.client_id_header
+    if header_name and (client_id := request.headers.get(header_name)):
+        return client_id
+    return request.client.host if request.client is not None else "unknown"
+
+
+@asynccontextmanager
+async def admit_query(
+    admission_controller: AdmissionController | None,
+    client_id: str,
+    estimate_cost: Callable[[], QueryCost],
+):
+    """
+    No-op if the admission control is disabled (the cost isn't estimated);
+    the cost is estimated in a thread (it may take a while for many tracks)
+    """
+    if admission_controller is None:
+        yield None
+        return
+    cost = await run_in_threadpool(estimate_cost)
+    async with admission_controller.admit(client_id, cost) as ticket:
+        yield ticket
+
+
+class AdmittedStreamingResponse(CancellableStreamingResponse):
+    """Holds the admission ticket until the streaming ends (in any way)"""
+
+    def __init__(
+        self,
+        content,
+        cancelled: threading.Event,
+        admission_controller: AdmissionController | None,
+        ticket: AdmissionTicket | None,
+        **kwargs,
+    ):
+        super().__init__(content, cancelled, **kwargs)
+        self.admission_controller = admission_controller
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.admission_controller.release(self.ticket)
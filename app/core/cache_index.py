@@ -0,0 +1,116 @@
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+CACHE_INDEX_FNAME = ".cache_index.sqlite"
+
+
+class SharedCacheIndex:
+    """
+    FIFO index of the cached track files shared by all processes that use
+    the same cache directory (a SQLite table, every operation is a transaction).
+    Has the deque-like methods 'append', 'popleft' and 'remove'.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_fpath = self.cache_dir / CACHE_INDEX_FNAME
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cached_files "
+                "(seq INTEGER PRIMARY KEY AUTOINCREMENT, fname TEXT UNIQUE NOT NULL)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        connection = sqlite3.connect(self.db_fpath, timeout=60, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def append(self, fpath: Path) -> None:
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO cached_files (fname) VALUES (?)",
+                (Path(fpath).name,),
+            )
+
+    def popleft(self) -> Path:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT seq, fname FROM cached_files ORDER BY seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                raise IndexError("pop from an empty cache index")
+            connection.execute("DELETE FROM cached_files WHERE seq = ?", (row[0],))
+        return self.cache_dir / row[1]
+
+    def remove(self, fpath: Path) -> None:
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM cached_files WHERE fname = ?", (Path(fpath).name,)
+            )
+
+    def evict_over_limit(self, max_num_files: int) -> list[Path]:
+        """Remove the oldest entries above the limit, return their file paths"""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT seq, fname FROM cached_files ORDER BY seq DESC LIMIT -1 OFFSET ?",
+                (max_num_files,),
+            ).fetchall()
+            connection.executemany(
+                "DELETE FROM cached_files WHERE seq = ?", [(seq,) for seq, _ in rows]
+            )
+        return [self.cache_dir / fname for _, fname in rows]
+
+    def reconcile(self, fname_suffix: str) -> None:
+        """Drop the entries of the missing files, add the unindexed files"""
+        with self._transaction() as connection:
+            fnames = [
+                row[0] for row in connection.execute("SELECT fname FROM cached_files")
+            ]
+            connection.executemany(
+                "DELETE FROM cached_files WHERE fname = ?",
+                [(fname,) for fname in fnames if not (self.cache_dir / fname).exists()],
+            )
+            fpaths_on_disk = sorted(
+                self.cache_dir.glob(f"*{fname_suffix}"),
+                key=lambda fpath: fpath.stat().st_mtime,
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO cached_files (fname) VALUES (?)",
+                [(fpath.name,) for fpath in fpaths_on_disk],
+            )
+
+    def fnames(self) -> list[str]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT fname FROM cached_files ORDER BY seq"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def select_cached(self, fnames: list[str]) -> set[str]:
+        """The given file names that are in the index (a single query)"""
+        with self._transaction() as connection:
+            connection.execute("CREATE TEMP TABLE fnames_to_look_up (fname TEXT)")
+            connection.executemany(
+                "INSERT INTO fnames_to_look_up (fname) VALUES (?)",
+                [(fname,) for fname in fnames],
+            )
+            rows = connection.execute(
+                "SELECT fname FROM cached_files "
+                "WHERE fname IN (SELECT fname FROM fnames_to_look_up)"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def __len__(self) -> int:
+        with self._transaction() as connection:
+            return connection.execute("SELECT COUNT(*) FROM cached_files").fetchone()[0]
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+DISCONNECT_POLL_INTERVAL_SECONDS = 0.1
+CLIENT_CLOSED_REQUEST = 499
+# ^ the nginx status code for the requests abandoned by the client
+
+
+class QueryCancelled(Exception):
+    """The client has disconnected, the rest of the query is skipped"""
+
+
+def raise_if_cancelled(cancelled: threading.Event | None) -> None:
+    if (cancelled is not None) and cancelled.is_set():
+        raise QueryCancelled()
+
+
+@asynccontextmanager
+async def watch_disconnect(request: Request):
+    """
+    Polls 'request.is_disconnected()' while in the context, the yielded event
+    is set once the client has gone; the blocking stages run in threads check
+    it between the tracks (and the downloads between the chunks)
+    """
+    cancelled = threading.Event()
+
+    async def poll() -> None:
+        while not cancelled.is_set():
+            if await request.is_disconnected():
+                cancelled.set()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL_SECONDS)
+
+    poll_task = asyncio.create_task(poll())
+    try:
+        yield cancelled
+    finally:
+        poll_task.cancel()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """
+    Sets 'cancelled' when the streaming ends in any way (e.g. the client
+    has disconnected), so the generator running in a thread stops early
+    """
+
+    def __init__(self, content, cancelled: threading.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cancelled = cancelled
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await super().listen_for_disconnect(receive)
+        self.cancelled.set()
+        # ^ right away: the streaming itself stops only when the current
+        #   chunk (computed in a thread) is ready
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cancelled.set()
@@ -0,0 +1,95 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def choose_content_encoding(accept_encoding: str) -> str | None:
+    """Pick the best supported compression among the accepted ones"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0.0:
+            accepted.add(coding.lower())
+
+    if (zstandard is not None) and ("zstd" in accepted):
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, content_encoding: str) -> bytes:
+    if content_encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    Compress the response bodies with zstd or gzip according to
+    the 'Accept-Encoding' request header. Streaming responses
+    (sent in several chunks) are passed through as they are.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_encoding = choose_content_encoding(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if content_encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or ("content-encoding" in headers)
+                or (len(body) < self.minimum_size)
+            ):
+                await send(start_message)
+            else:
+                body = compress(body, content_encoding)
+                headers["Content-Encoding"] = content_encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                await send(start_message)
+                message = {**message, "body": body}
+
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
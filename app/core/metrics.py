@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+
+def format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonically increasing value (per combination of the label values)"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[tuple(labelvalues)] += amount
+
+    def get(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(labelvalues), 0.0)
+
+    def snapshot(self) -> list:
+        """[[label values, value], ...] (JSON-serializable)"""
+        with self._lock:
+            return [
+                [list(labelvalues), value]
+                for labelvalues, value in self._values.items()
+            ]
+
+    def drain(self) -> list:
+        """The snapshot, then the values are reset (counts sent to another process)"""
+        with self._lock:
+            snapshot = [
+                [list(labelvalues), value]
+                for labelvalues, value in self._values.items()
+            ]
+            self._values.clear()
+        return snapshot
+
+    def add(self, snapshot: list) -> None:
+        """Add the values of a snapshot (e.g. drained in another process)"""
+        for labelvalues, value in snapshot:
+            self.inc(value, *labelvalues)
+
+    def render_samples(self, snapshots: list) -> list[str]:
+        """The sums over the snapshots (of the worker processes)"""
+        values = defaultdict(float)
+        for snapshot in snapshots:
+            for labelvalues, value in snapshot:
+                values[tuple(labelvalues)] += value
+        if not self.labelnames:
+            values.setdefault((), 0.0)
+
+        return [
+            f"{self.name}{format_labels(self.labelnames, labelvalues)} {value}"
+            for labelvalues, value in sorted(values.items())
+        ]
+
+
+class Histogram:
+    """Distribution of the observed values over the cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets=DEFAULT_DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._bucket_counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        labelvalues = tuple(labelvalues)
+        with self._lock:
+            bucket_counts = self._bucket_counts[labelvalues]
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[idx] += 1
+            self._sums[labelvalues] += value
+            self._counts[labelvalues] += 1
+
+    def snapshot(self) -> list:
+        """[[label values, bucket counts, sum, count], ...] (JSON-serializable)"""
+        with self._lock:
+            return [
+                [
+                    list(labelvalues),
+                    list(bucket_counts),
+                    self._sums[labelvalues],
+                    self._counts[labelvalues],
+                ]
+                for labelvalues, bucket_counts in self._bucket_counts.items()
+            ]
+
+    def render_samples(self, snapshots: list) -> list[str]:
+        """The sums over the snapshots (of the worker processes)"""
+        bucket_counts = defaultdict(lambda: [0] * len(self.buckets))
+        sums, counts = defaultdict(float), defaultdict(int)
+        for snapshot in snapshots:
+            for labelvalues, snapshot_bucket_counts, value_sum, count in snapshot:
+                labelvalues = tuple(labelvalues)
+                for idx, bucket_count in enumerate(snapshot_bucket_counts):
+                    bucket_counts[labelvalues][idx] += bucket_count
+                sums[labelvalues] += value_sum
+                counts[labelvalues] += count
+
+        samples = []
+        for labelvalues, labels_bucket_counts in sorted(bucket_counts.items()):
+            for upper_bound, bucket_count in zip(self.buckets, labels_bucket_counts):
+                labels = format_labels(
+                    self.labelnames + ("le",), labelvalues + (str(upper_bound),)
+                )
+                samples.append(f"{self.name}_bucket{labels} {bucket_count}")
+
+            labels = format_labels(self.labelnames + ("le",), labelvalues + ("+Inf",))
+            samples.append(f"{self.name}_bucket{labels} {counts[labelvalues]}")
+            labels = format_labels(self.labelnames, labelvalues)
+            samples.append(f"{self.name}_sum{labels} {sums[labelvalues]}")
+            samples.append(f"{self.name}_count{labels} {counts[labelvalues]}")
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        """{metric name: metric snapshot} of this process"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots: list[dict] | None = None) -> str:
+        """
+        All metrics in the Prometheus text exposition format, summed over
+        the registry snapshots (by default, only this process)
+        """
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(
+                metric.render_samples(
+                    [snapshot.get(metric.name, []) for snapshot in snapshots]
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION_SECONDS = REGISTRY.register(
+    Histogram(
+        "gpm_stage_duration_seconds",
+        "Duration of each stage of the request processing",
+        labelnames=("stage",),
+    )
+)
+REQUESTS = REGISTRY.register(
+    Counter("gpm_requests_total", "Processed requests", labelnames=("endpoint",))
+)
+TRACKS_SELECTED = REGISTRY.register(
+    Counter(
+        "gpm_tracks_selected_total",
+        "Tracks selected by date and by coordinates",
+        labelnames=("criterion",),
+    )
+)
+DOWNLOADED_BYTES = REGISTRY.register(
+    Counter("gpm_downloaded_bytes_total", "Bytes of the downloaded track files")
+)
+PREFETCHED_FILES = REGISTRY.register(
+    Counter("gpm_prefetched_files_total", "Track files downloaded by the prefetcher")
+)
+RANGE_REQUESTS = REGISTRY.register(
+    Counter("gpm_range_requests_total", "Byte-range requests for the remote reads")
+)
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "gpm_cache_lookups_total",
+        "Lookups of the track files in the local cache",
+        labelnames=("result",),
+    )
+)
+POINTS_RETURNED = REGISTRY.register(
+    Counter("gpm_points_returned_total", "Points returned in the responses")
+)
+ADMISSION_DECISIONS = REGISTRY.register(
+    Counter(
+        "gpm_admission_decisions_total",
+        "Admission decisions for the queries (bypassed, admitted, queued, rejected)",
+        labelnames=("decision",),
+    )
+)
+
+
+class StageTimings:
+    """
+    Per-request durations of the stages; each measured duration
+    is also observed by the STAGE_DURATION_SECONDS histogram.
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - time_start
+            self.durations[name] += duration
+            STAGE_DURATION_SECONDS.observe(duration, name)
+
+    def server_timing_header(self) -> str:
+        """E.g. 'select_by_date;dur=1.2, download;dur=3456.7' (in milliseconds)"""
+        return ", ".join(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.durations.items()
+        )
@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from omegaconf import DictConfig
+
+from app.core.metrics import REGISTRY
+from app.core.shared_state import get_launch_id, write_atomically
+
+
+class MetricsSnapshots:
+    """
+    The metrics live in each worker process (uvicorn --workers N), so each
+    process writes a snapshot of its registry to '<shared_state.dir>/metrics/'
+    every 'snapshot_interval_seconds' (and on shutdown), and '/metrics' sums
+    the snapshots of all the processes of the launch: the own snapshot is
+    fresh, the others are at most the interval old. The snapshots of the
+    processes that exited are kept, so the sums don't drop when one restarts.
+    """
+
+    def __init__(self, config: DictConfig):
+        self.metrics_dir = Path(config.shared_state.dir) / "metrics"
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        self.launch_id = get_launch_id()
+        self.snapshot_fpath = self.metrics_dir / f"{self.launch_id}_{os.getpid()}.json"
+        self.snapshot_interval_seconds = config.metrics.snapshot_interval_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="metrics-snapshots", daemon=True
+        )
+        self.thread.start()
+
+    def write_snapshot(self) -> None:
+        snapshot = REGISTRY.snapshot()
+        write_atomically(
+            self.snapshot_fpath,
+            lambda fpath: fpath.write_text(json.dumps(snapshot)),
+        )
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.snapshot_interval_seconds):
+            self.write_snapshot()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.write_snapshot()
+
+    def render(self) -> str:
+        """The metrics summed over the worker processes of the launch"""
+        self.write_snapshot()
+        snapshots = []
+        for fpath in sorted(self.metrics_dir.glob(f"{self.launch_id}_*.json")):
+            try:
+                snapshots.append(json.loads(fpath.read_text()))
+            except (OSError, ValueError):
+                continue
+        return REGISTRY.render(snapshots)
@@ -0,0 +1,140 @@
+import hmac
+import os
+import sys
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_TOKEN_HEADER = "x-profile-token"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+def format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """
+    Samples the call stacks of all threads (except its own) at a fixed interval
+    and counts them in the 'collapsed stack' format ('root;caller;callee count'),
+    which can be opened in speedscope or converted to a flame graph. The root
+    of each stack is the name of its thread (e.g. 'MainThread' for the event
+    loop, 'AnyIO worker thread' for the threadpool, 'prefetcher').
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.stack_counts = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval_seconds):
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(format_frame(frame))
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_id, str(thread_id)))
+                self.stack_counts[";".join(reversed(frames))] += 1
+
+    def write_collapsed(self, fpath: Path) -> None:
+        with open(fpath, "w") as fd:
+            for stack, count in self.stack_counts.most_common():
+                fd.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request if profiling is enabled in the config
+    ('profiling.enabled') and the request has the 'profile=1' query parameter
+    and the admin token (env. variable PROFILING_TOKEN) in the
+    'X-Profile-Token' header (never in the URL, which ends up in the access
+    logs). The profile is written to 'profiling.output_dir', its id is
+    returned in the 'X-Profile-Id' header.
+    When profiling is disabled, requests are passed through untouched.
+
+    The profile covers the whole process while the request runs: the request
+    shares the event loop and the threadpool with the other requests, whose
+    stacks can't be told apart from its own, and the background threads are
+    sampled too (their stacks are rooted at their names). For a clean profile,
+    send the request to an otherwise idle worker. The worker processes of the
+    parallel extraction are not sampled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def get_profiling_config(self, scope: Scope):
+        config = getattr(scope["app"].state, "config", None)
+        if (config is None) or (not config.profiling.enabled):
+            return None
+        return config.profiling
+
+    @staticmethod
+    def is_profiling_requested(scope: Scope) -> bool:
+        admin_token = os.getenv("PROFILING_TOKEN")
+        if not admin_token:
+            return False
+
+        query_params = parse_qs(scope.get("query_string", b"").decode())
+        if query_params.get(PROFILE_QUERY_PARAM) != ["1"]:
+            return False
+
+        request_token = Headers(scope=scope).get(PROFILE_TOKEN_HEADER)
+        return (request_token is not None) and hmac.compare_digest(
+            request_token.encode("latin-1"), admin_token.encode()
+        )
+        # ^ compared as bytes ('compare_digest' rejects non-ASCII strings): the
+        #   raw header bytes (decoded as latin-1 by Starlette) with the UTF-8
+        #   token
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiling_config = self.get_profiling_config(scope)
+        if (profiling_config is None) or (not self.is_profiling_requested(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        sampler = StackSampler(profiling_config.sampling_interval_seconds)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            output_dir = Path(profiling_config.output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            sampler.write_collapsed(output_dir / f"{profile_id}.collapsed")
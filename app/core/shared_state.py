@@ -0,0 +1,171 @@
+import fcntl
+import json
+import multiprocessing
+import os
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import requests
+from omegaconf import DictConfig
+
+from app.core.cache_index import SharedCacheIndex
+from app.utils.track_file_names import (
+    get_all_links_to_hdf5,
+    get_cached_fname_suffix,
+    map_h5_urls_to_start_timestamps,
+    map_start_timestamps_to_h5_urls,
+)
+
+
+@contextmanager
+def file_lock(lock_fpath: Path):
+    """Exclusive lock shared between the processes (held while in the context)"""
+    lock_fpath.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_fpath, "w") as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def write_atomically(fpath: Path, write_func) -> None:
+    """Write to a temporary file first, so that readers never see partial files"""
+    tmp_fpath = fpath.with_name(f".{fpath.name}.{os.getpid()}.tmp")
+    write_func(tmp_fpath)
+    os.replace(tmp_fpath, fpath)
+
+
+def get_launch_id() -> int:
+    """
+    Same for all the workers started by one server process
+    (uvicorn --workers N), different for each standalone process.
+    """
+    parent_process = multiprocessing.parent_process()
+    if parent_process is not None:
+        return parent_process.pid
+    return os.getpid()
+
+
+class FootprintIndex(Mapping):
+    """
+    Read-only mapping {track file name: (latitude, longitude)} of the downsampled
+    swath edges; the points of all tracks are stored in two memory-mapped
+    arrays, so the workers share the same pages instead of keeping own copies.
+    """
+
+    def __init__(self, index_dir: Path):
+        self.latitude = np.load(index_dir / "footprints_latitude.npy", mmap_mode="r")
+        self.longitude = np.load(index_dir / "footprints_longitude.npy", mmap_mode="r")
+        with open(index_dir / "footprints_offsets.json") as fd:
+            self.offsets = json.load(fd)
+            # ^ fname -> [first point idx, last point idx + 1]
+
+    @staticmethod
+    def write(npz_fpath: Path, index_dir: Path) -> None:
+        """Convert the 'fname_to_downsampled_points.npz' file"""
+        fname_to_downsampled_points = np.load(npz_fpath)
+        latitude_arrs, longitude_arrs, offsets = [], [], {}
+        num_points = 0
+        for fname in fname_to_downsampled_points.files:
+            latitude, longitude = fname_to_downsampled_points[fname]
+            latitude_arrs.append(latitude)
+            longitude_arrs.append(longitude)
+            offsets[fname] = [num_points, num_points + len(latitude)]
+            num_points += len(latitude)
+
+        def save_concatenated(arrs: list[np.ndarray]):
+            def save(fpath: Path) -> None:
+                with open(fpath, "wb") as fd:
+                    np.save(fd, np.concatenate(arrs))
+
+            return save
+
+        write_atomically(
+            index_dir / "footprints_latitude.npy", save_concatenated(latitude_arrs)
+        )
+        write_atomically(
+            index_dir / "footprints_longitude.npy", save_concatenated(longitude_arrs)
+        )
+        write_atomically(
+            index_dir / "footprints_offsets.json",
+            lambda fpath: fpath.write_text(json.dumps(offsets)),
+        )
+
+    def __getitem__(self, fname: str) -> tuple[np.ndarray, np.ndarray]:
+        idx_start, idx_end = self.offsets[fname]
+        return self.latitude[idx_start:idx_end], self.longitude[idx_start:idx_end]
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+def initialize_shared_state_as_leader(config: DictConfig, state_dir: Path) -> None:
+    """Fetch the catalog and the footprint index, write them to the state dir"""
+    npz_fpath = state_dir / "fname_to_downsampled_points.npz"
+    if not npz_fpath.is_file():
+        response = requests.get(config.url_npz_track_to_downsampled_swath_points)
+        response.raise_for_status()
+        write_atomically(npz_fpath, lambda fpath: fpath.write_bytes(response.content))
+    FootprintIndex.write(npz_fpath, state_dir)
+
+    h5_urls = get_all_links_to_hdf5(
+        config.url_webpage_all_tracks,
+        config.use_gcs_bucket,
+        config.hdf_fname_extension,
+    )
+    h5_urls_to_start_timestamps = map_h5_urls_to_start_timestamps(config, h5_urls)
+    start_timestamps_to_h5_urls = map_start_timestamps_to_h5_urls(
+        h5_urls_to_start_timestamps
+    )
+    write_atomically(
+        state_dir / "catalog.json",
+        lambda fpath: fpath.write_text(json.dumps(start_timestamps_to_h5_urls)),
+    )
+
+    SharedCacheIndex(Path(config.hdf_caching.dir)).reconcile(
+        get_cached_fname_suffix(config)
+    )
+
+    for snapshot_fpath in (state_dir / "metrics").glob("*.json"):
+        snapshot_fpath.unlink(missing_ok=True)
+        # ^ the metrics of the previous launch (see 'app/core/metrics_snapshots.py')
+
+
+def load_shared_state(
+    config: DictConfig,
+) -> tuple[dict, FootprintIndex, SharedCacheIndex]:
+    """
+    The first worker of a launch (the leader) initializes the shared state,
+    the others wait for it and then map the same files.
+    """
+    state_dir = Path(config.shared_state.dir)
+    ready_fpath = state_dir / "ready.json"
+    launch_id = get_launch_id()
+
+    with file_lock(state_dir / "init.lock"):
+        try:
+            ready_info = json.loads(ready_fpath.read_text())
+        except (OSError, ValueError):
+            ready_info = {}
+
+        if ready_info.get("launch_id") != launch_id:
+            initialize_shared_state_as_leader(config, state_dir)
+            ready_fpath.write_text(
+                json.dumps({"launch_id": launch_id, "initialized_at": time.time()})
+            )
+
+    with open(state_dir / "catalog.json") as fd:
+        start_timestamps_to_h5_urls = json.load(fd)
+
+    return (
+        start_timestamps_to_h5_urls,
+        FootprintIndex(state_dir),
+        SharedCacheIndex(Path(config.hdf_caching.dir)),
+    )
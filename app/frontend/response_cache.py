@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Approximate memory size of the (nested) decoded backend results"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value)
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+
+class ResponseCache:
+    """
+    LRU cache of the decoded backend results with the time-to-live
+    for each entry and the total memory budget.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # ^ key -> (expiration_time, nbytes, value)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expiration_time, nbytes, value = entry
+            if expiration_time < time.monotonic():
+                del self._entries[key]
+                self._total_bytes -= nbytes
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                _, old_nbytes, _ = self._entries.pop(key)
+                self._total_bytes -= old_nbytes
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, nbytes, value)
+            self._total_bytes += nbytes
+
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted_nbytes, _) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_nbytes
@@ -1,19 +1,26 @@
-import base64
-import io
+import json
 from typing import Any
+from urllib.parse import urljoin
 
 import numpy as np
 import requests
 import streamlit as st
-from bokeh.events import MouseMove
-from bokeh.models import ColorBar, ColumnDataSource, HoverTool, LinearColorMapper
+from bokeh.models import ColorBar, ColumnDataSource, LinearColorMapper
 from bokeh.models.callbacks import CustomJS
 from bokeh.palettes import Turbo256
 from bokeh.transform import transform
 from omegaconf import DictConfig
+from pydantic import ValidationError
+from requests.adapters import HTTPAdapter
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
-from app.utils.map_drawing_bokeh import prepare_bokeh_map
+from app.frontend.response_cache import ResponseCache
+from app.utils.map_drawing_bokeh import (
+    add_nearest_point_hover,
+    add_rasterized_points,
+    prepare_bokeh_map,
+)
+from app.utils.wire_encoding import decode_h5_data
 
 
 def fill_in_form(schema_fields: dict) -> dict:
@@ -47,6 +54,14 @@ def fill_in_form(schema_fields: dict) -> dict:
             schema_fields["longitude_max"]["description"]
         )
 
+    roi_geometry_text = st.text_area(schema_fields["roi_geometry"]["description"])
+    if roi_geometry_text.strip():
+        try:
+            form_data["roi_geometry"] = json.loads(roi_geometry_text)
+        except json.JSONDecodeError:
+            form_data["roi_geometry"] = roi_geometry_text
+            # ^ rejected by the backend with the validation message
+
     return form_data
 
 
@@ -54,7 +69,7 @@ def visualize_single_track(
     form_data: dict[str, str],
     track_number: str,
     track_number_to_start_timestamp: dict[str, str],
-    track_number_to_h5_data: dict[str, str],
+    track_number_to_arrays: dict[str, dict[str, np.ndarray]],
     config: DictConfig,
     vis_settings: dict[str, Any],
 ):
@@ -64,15 +79,13 @@ def visualize_single_track(
         DatesCoordsSelection(**form_data),
     )
 
-    h5_data_npz_base64 = track_number_to_h5_data[track_number]
-    h5_data_npz_bytes = base64.b64decode(h5_data_npz_base64)
-    npz_contents = np.load(io.BytesIO(h5_data_npz_bytes))
-    observable = npz_contents["observable"].flatten()
+    arrays = track_number_to_arrays[track_number]
+    observable = arrays["observable"]
 
     source = ColumnDataSource(
         data=dict(
-            latitude=npz_contents["latitude"].flatten(),
-            longitude=npz_contents["longitude"].flatten(),
+            latitude=arrays["latitude"],
+            longitude=arrays["longitude"],
             observable=observable,
             marker_sizes=np.full_like(observable, 3),
         )
@@ -89,7 +102,7 @@ def visualize_single_track(
 
 def visualize_multiple_tracks(
     form_data: dict[str, str],
-    track_number_to_h5_data: dict[str, str],
+    track_number_to_arrays: dict[str, dict[str, np.ndarray]],
     config: DictConfig,
     vis_settings: dict[str, Any],
 ):
@@ -102,12 +115,10 @@ def visualize_multiple_tracks(
     latitude_arrs = []
     longitude_arrs = []
 
-    for h5_data_npz_base64 in track_number_to_h5_data.values():
-        h5_data_npz_bytes = base64.b64decode(h5_data_npz_base64)
-        npz_contents = np.load(io.BytesIO(h5_data_npz_bytes))
-        observable_arrs.append(npz_contents["observable"].flatten())
-        latitude_arrs.append(npz_contents["latitude"].flatten())
-        longitude_arrs.append(npz_contents["longitude"].flatten())
+    for arrays in track_number_to_arrays.values():
+        observable_arrs.append(arrays["observable"])
+        latitude_arrs.append(arrays["latitude"])
+        longitude_arrs.append(arrays["longitude"])
 
     observable = np.concatenate(observable_arrs)
     latitude = np.concatenate(latitude_arrs)
@@ -131,99 +142,6 @@ def visualize_multiple_tracks(
     )
 
 
-def draw_points_colorbar_hover_experiments(
-    config: DictConfig,
-    p: Any,
-    source: ColumnDataSource,
-    observable: np.ndarray,
-):
-    color_mapper = LinearColorMapper(
-        palette=Turbo256,
-        low=min(observable),
-        high=max(observable),
-    )
-
-    p.scatter(
-        "longitude",
-        "latitude",
-        source=source,
-        marker="circle",
-        size=3,
-        fill_color=transform("observable", color_mapper),
-        fill_alpha=0.5,
-        line_color=None,
-    )
-
-    hover_source = ColumnDataSource(data=dict(x=[0], y=[0]))
-
-    tooltips = [("(lat, lon)", "(@y{0.000}, @x{0.000})"), ("U10", "@observable{0.00}")]
-    hover = HoverTool(
-        tooltips=tooltips,
-        mode="mouse",
-        point_policy="snap_to_data",
-        renderers=[p.renderers[1]],
-    )
-    p.add_tools(hover)
-
-    # Custom JavaScript callback for finding the nearest point
-    custom_js_code = """
-        // Get the current mouse position in data coordinates
-        const x_mouse = cb_obj.x;
-        const y_mouse = cb_obj.y;
-
-        // Get the data points from the source
-        const data = source.data;
-        const x_data = data['longitude'];
-        const y_data = data['latitude'];
-
-        // Initialize variables to track the closest point
-        let min_dist = Infinity;
-        let closest_x = 0;
-        let closest_y = 0;
-
-        // Compute the distance from the mouse to each data point
-        for (let i = 0; i < x_data.length; i++) {
-            const dx = x_data[i] - x_mouse;
-            const dy = y_data[i] - y_mouse;
-            const dist = Math.sqrt(dx * dx + dy * dy);  // Euclidean distance
-
-            if (dist < min_dist) {
-                min_dist = dist;
-                closest_x = x_data[i];
-                closest_y = y_data[i];
-            }
-        }
-
-        // Update the hover_source with the closest point's coordinates
-        hover_source.data = { x: [closest_x], y: [closest_y] };
-        hover_source.change.emit();
-    """
-
-    # Attach the callback to the HoverTool
-    callback = CustomJS(
-        args=dict(source=source, hover_source=hover_source),
-        code=custom_js_code,
-    )
-    p.js_on_event(MouseMove, callback)
-
-    color_bar = ColorBar(
-        color_mapper=color_mapper,
-        label_standoff=12,
-        width=8,
-        location=(0, 0),
-        title="U10, m/s",
-        title_text_font_size="16pt",
-        title_text_font_style="normal",
-        major_label_text_font_size="14pt",
-    )
-    p.add_layout(color_bar, "right")
-
-    st.bokeh_chart(
-        p,
-        use_container_width=False,
-    )
-
-
 def draw_points_colorbar_marker_sizes(
     config: DictConfig,
     p: Any,
@@ -320,24 +238,49 @@ def draw_points_colorbar(
         high=max(observable),
     )
 
-    p.scatter(
-        "longitude",
-        "latitude",
-        source=source,
-        marker="circle",
-        size=3,
-        fill_color=transform("observable", color_mapper),
-        fill_alpha=0.5,
-        line_color=None,
-    )
+    if vis_settings["use_webgl"]:
+        p.output_backend = "webgl"
+
+    if observable.size > config.visualization.rasterize_above_num_points:
+        st.write(
+            f"**{observable.size} points are shown as an aggregated image** "
+            "(the mean U10 value in each pixel)."
+        )
+        add_rasterized_points(
+            p,
+            source.data["latitude"],
+            source.data["longitude"],
+            observable,
+            color_mapper,
+            config.visualization.raster_zoom_levels,
+        )
+    else:
+        p.scatter(
+            "longitude",
+            "latitude",
+            source=source,
+            marker="circle",
+            size=3,
+            fill_color=transform("observable", color_mapper),
+            fill_alpha=0.5,
+            line_color=None,
+        )
 
     if vis_settings["add_hover_tool"]:
-        tooltips = [
-            ("(lat, lon)", "(@latitude{0.000}, @longitude{0.000})"),
-            ("U10", "@observable{0.00}"),
-        ]
-        hover = HoverTool(tooltips=tooltips)
-        p.add_tools(hover)
+        if observable.size > config.visualization.hover_max_num_points:
+            st.write(
+                f"**The hover tool is off**: more than "
+                f"{config.visualization.hover_max_num_points} points are selected."
+            )
+        else:
+            add_nearest_point_hover(
+                p,
+                source.data["latitude"],
+                source.data["longitude"],
+                observable,
+                config.visualization.hover_points_per_cell,
+                config.visualization.hover_max_distance_pixels,
+            )
 
     color_bar = ColorBar(
         color_mapper=color_mapper,
@@ -357,25 +300,148 @@ def draw_points_colorbar(
     )
 
 
-def get_response_and_visualize(
+@st.cache_resource
+def get_backend_session(pool_maxsize: int) -> requests.Session:
+    """Keep-alive session with the connection pool (one per Streamlit server)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_response_cache(ttl_seconds: float, max_bytes: int) -> ResponseCache:
+    """Decoded backend results shared between reruns and sessions"""
+    return ResponseCache(ttl_seconds, max_bytes)
+
+
+def get_response_cache_key(form_data: dict) -> str | None:
+    try:
+        selection = DatesCoordsSelection(**form_data)
+    except ValidationError:
+        return None
+        # ^ don't cache, the backend will report the error
+
+    return selection.model_dump_json()
+
+
+def get_error_message(response: requests.Response, message_part1: str) -> str:
+    """
+    The reason of a failed request: 'message' for the HTTP exceptions (e.g.
+    the rejected queries, with the 'Retry-After' header), 'detail' for the
+    validation errors; the body may also be no JSON (e.g. a proxy error page)
+    """
+    try:
+        response_json = response.json()
+    except ValueError:
+        response_json = None
+
+    reason = ""
+    if isinstance(response_json, dict):
+        if "message" in response_json:
+            reason = str(response_json["message"])
+        elif isinstance(response_json.get("detail"), list):
+            reason = "; ".join(
+                str(error.get("msg", error)) for error in response_json["detail"]
+            )
+        elif "detail" in response_json:
+            reason = str(response_json["detail"])
+
+    message = f"{message_part1} (HTTP {response.status_code})"
+    if reason:
+        message += ": " + reason
+    if "Retry-After" in response.headers:
+        message += f"; retry after {response.headers['Retry-After']} s"
+    return message
+
+
+def get_decoded_results(
     config: DictConfig,
     submit_url: str,
     form_data: dict,
-    vis_settings: dict[str, Any],
-) -> None:
-    response = requests.get(
+) -> tuple[dict | None, str]:
+    """
+    Get the decoded backend results for the form data
+    (from the cache if the same selection has been submitted recently).
+    Returns the results (None in case of an error) and the error message.
+    """
+    response_cache = get_response_cache(
+        config.frontend_caching.ttl_seconds,
+        config.frontend_caching.max_bytes,
+    )
+    cache_key = get_response_cache_key(form_data)
+    if cache_key is not None:
+        decoded_results = response_cache.get(cache_key)
+        if decoded_results is not None:
+            return decoded_results, ""
+
+    session = get_backend_session(config.frontend_caching.pool_maxsize)
+    response = session.get(
         submit_url,
+        params={"encoding": config.wire_encoding.frontend_encoding},
         json=form_data,
     )
-    if response.status_code == 200:
+    if response.status_code != 200:
+        return None, get_error_message(response, "Error submitting data to backend")
+
+    response_json = response.json()
+    decoded_results = {
+        "track_number_to_arrays": {
+            track_number: decode_h5_data(h5_data_npz_base64)
+            for track_number, h5_data_npz_base64 in response_json[
+                "track_number_to_h5_data"
+            ].items()
+        },
+        "track_number_to_start_timestamp": response_json[
+            "track_number_to_start_timestamp"
+        ],
+    }
+    if cache_key is not None:
+        response_cache.put(cache_key, decoded_results)
+
+    return decoded_results, ""
+
+
+def show_query_cost_estimate(
+    config: DictConfig,
+    estimate_url: str,
+    form_data: dict,
+) -> None:
+    """Dry run of the selection: nothing is downloaded by the backend"""
+    session = get_backend_session(config.frontend_caching.pool_maxsize)
+    response = session.get(estimate_url, json=form_data)
+    if response.status_code != 200:
+        st.error(get_error_message(response, "Error estimating the query cost"))
+        return
+
+    estimate = response.json()
+    st.info(
+        f"**{estimate['num_tracks_by_date']} tracks** in the date range, "
+        f"{estimate['num_tracks_by_footprint']} of them reaching the ROI, "
+        f"{estimate['num_tracks_cached']} of them cached; "
+        f"~{estimate['bytes_to_download'] / 1e6:.0f} MB to download, "
+        f"~{estimate['estimated_points']:,} points, "
+        f"~{estimate['estimated_seconds']:.0f} s"
+    )
+
+
+def get_response_and_visualize(
+    config: DictConfig,
+    submit_url: str,
+    form_data: dict,
+    vis_settings: dict[str, Any],
+) -> None:
+    decoded_results, error_message = get_decoded_results(config, submit_url, form_data)
+    if decoded_results is not None:
         st.success("Data submitted successfully!")
 
-        track_number_to_h5_data = response.json()["track_number_to_h5_data"]
-        track_number_to_start_timestamp = response.json()[
+        track_number_to_arrays = decoded_results["track_number_to_arrays"]
+        track_number_to_start_timestamp = decoded_results[
             "track_number_to_start_timestamp"
         ]
 
-        track_numbers = sorted(track_number_to_h5_data)
+        track_numbers = sorted(track_number_to_arrays)
         selected_track_numbers_text = f"**Selected track numbers**: {track_numbers}"
         st.write(f"**There are {len(track_numbers)} selected tracks**.")
         st.write(selected_track_numbers_text)
@@ -386,25 +452,19 @@ def get_response_and_visualize(
                     form_data,
                     track_number,
                     track_number_to_start_timestamp,
-                    track_number_to_h5_data,
+                    track_number_to_arrays,
                     config,
                     vis_settings,
                 )
         else:
             visualize_multiple_tracks(
                 form_data,
-                track_number_to_h5_data,
+                track_number_to_arrays,
                 config,
                 vis_settings,
             )
     else:
-        message_part1 = "Error submitting data to backend"
-        try:
-            message_part2 = ": " + response.json()["detail"][0]["msg"]
-        except (KeyError, IndexError):
-            message_part2 = ""
-
-        st.error(message_part1 + message_part2)
+        st.error(error_message)
 
 
 def streamlit_app(
@@ -423,12 +483,23 @@ def streamlit_app(
             value=False,
         )
         vis_settings["add_hover_tool"] = st.checkbox(
-            "Add hover tool (usable only for a narrow range of zoom level, but can be turned off)",
+            "Add hover tool (the values of the point nearest to the mouse)",
             value=False,
         )
+        vis_settings["use_webgl"] = st.checkbox(
+            "Use WebGL (faster rendering of many points)",
+            value=config.visualization.use_webgl,
+        )
 
+        estimate_button = st.form_submit_button(label="Estimate the query cost")
         submit_button = st.form_submit_button(label="Submit")
 
+        if estimate_button:
+            show_query_cost_estimate(
+                config,
+                urljoin(submit_url, "estimate"),
+                form_data,
+            )
         if submit_button:
             get_response_and_visualize(
                 config,
@@ -0,0 +1,335 @@
+import json
+import os
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.climatology import ClimatologySelection
+
+MONTHLY_DIR_NAME = "monthly"
+CUBES_DIR_NAME = "cubes"
+MONTHS_FNAME = "months.json"
+SUMMED_STATS = ("count", "sum", "sumsq")
+# ^ stored as prefix sums over the months, 'max' is stored per month
+
+
+def get_month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def get_next_month_start(month_start: date) -> date:
+    return (month_start + timedelta(days=32)).replace(day=1)
+
+
+def get_months(date_start: date, date_end: date) -> list[date]:
+    """First days of the months overlapping the date range"""
+    months = []
+    month_start = get_month_start(date_start)
+    while month_start <= date_end:
+        months.append(month_start)
+        month_start = get_next_month_start(month_start)
+    return months
+
+
+def get_grid_shape(resolution_deg: float) -> tuple[int, int]:
+    """(latitude cells, longitude cells) of the global grid"""
+    num_rows = round(180.0 / resolution_deg)
+    num_cols = round(360.0 / resolution_deg)
+    if not np.isclose(num_rows * resolution_deg, 180.0):
+        raise ValueError(f"The resolution must divide 180 degrees: {resolution_deg}")
+    return num_rows, num_cols
+
+
+def get_level_name(resolution_deg: float) -> str:
+    return f"{resolution_deg:g}deg"
+
+
+def get_pyramid_factors(resolutions_deg: list[float]) -> list[int]:
+    """Cells of the finest level per cell (along each axis) of each level"""
+    finest_resolution_deg = resolutions_deg[0]
+    factors = [
+        round(resolution_deg / finest_resolution_deg)
+        for resolution_deg in resolutions_deg
+    ]
+    for factor, resolution_deg in zip(factors, resolutions_deg):
+        if not np.isclose(factor * finest_resolution_deg, resolution_deg):
+            raise ValueError(
+                f"The resolution {resolution_deg} isn't a multiple of "
+                f"the finest one {finest_resolution_deg}"
+            )
+    return factors
+
+
+def make_empty_grids(shape: tuple[int, int]) -> dict[str, np.ndarray]:
+    return {
+        "count": np.zeros(shape, dtype=np.int64),
+        "sum": np.zeros(shape, dtype=np.float64),
+        "sumsq": np.zeros(shape, dtype=np.float64),
+        "max": np.full(shape, -np.inf, dtype=np.float32),
+    }
+
+
+def accumulate_points(
+    grids: dict[str, np.ndarray],
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    resolution_deg: float,
+) -> None:
+    """Add the points to the count/sum/sum-of-squares/max of their cells"""
+    num_rows, num_cols = grids["count"].shape
+    rows = np.clip(
+        ((latitude + 90.0) / resolution_deg).astype(np.int64), 0, num_rows - 1
+    )
+    cols = np.clip(
+        ((longitude + 180.0) / resolution_deg).astype(np.int64), 0, num_cols - 1
+    )
+    # ^ the points on the north pole and on the antimeridian go to the last cells
+    cell_idxs = rows * num_cols + cols
+    num_cells = num_rows * num_cols
+    observable = observable.astype(np.float64)
+    grids["count"] += np.bincount(cell_idxs, minlength=num_cells).reshape(
+        num_rows, num_cols
+    )
+    grids["sum"] += np.bincount(
+        cell_idxs, weights=observable, minlength=num_cells
+    ).reshape(num_rows, num_cols)
+    grids["sumsq"] += np.bincount(
+        cell_idxs, weights=observable**2, minlength=num_cells
+    ).reshape(num_rows, num_cols)
+    np.maximum.at(grids["max"].reshape(-1), cell_idxs, observable.astype(np.float32))
+
+
+def coarsen_grids(grids: dict[str, np.ndarray], factor: int) -> dict[str, np.ndarray]:
+    """The grids of a coarser pyramid level: blocks of 'factor' x 'factor' cells"""
+    if factor == 1:
+        return grids
+    num_rows, num_cols = grids["count"].shape
+    blocks_shape = (num_rows // factor, factor, num_cols // factor, factor)
+    coarse_grids = {
+        stat: grids[stat].reshape(blocks_shape).sum(axis=(1, 3))
+        for stat in SUMMED_STATS
+    }
+    coarse_grids["max"] = grids["max"].reshape(blocks_shape).max(axis=(1, 3))
+    return coarse_grids
+
+
+def get_monthly_fpath(climatology_dir: Path, month_start: date) -> Path:
+    return Path(climatology_dir) / MONTHLY_DIR_NAME / f"{month_start:%Y-%m}.npz"
+
+
+def load_monthly_grids(
+    climatology_dir: Path,
+    month_start: date,
+    shape: tuple[int, int],
+) -> tuple[dict[str, np.ndarray], set[str]]:
+    """The grids of the month (finest level) and the names of their tracks"""
+    fpath = get_monthly_fpath(climatology_dir, month_start)
+    if not fpath.is_file():
+        return make_empty_grids(shape), set()
+    with np.load(fpath) as npz:
+        grids = {stat: npz[stat] for stat in (*SUMMED_STATS, "max")}
+        track_fnames = set(npz["track_fnames"].tolist())
+    if grids["count"].shape != shape:
+        raise ValueError(f"{fpath} has another resolution, rebuild the climatology")
+    return grids, track_fnames
+
+
+def save_monthly_grids(
+    climatology_dir: Path,
+    month_start: date,
+    grids: dict[str, np.ndarray],
+    track_fnames: set[str],
+) -> None:
+    fpath = get_monthly_fpath(climatology_dir, month_start)
+    fpath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fpath = fpath.with_suffix(f".{os.getpid()}.tmp.npz")
+    np.savez(tmp_fpath, track_fnames=np.array(sorted(track_fnames), dtype=str), **grids)
+    os.replace(tmp_fpath, fpath)
+    # ^ a crash leaves the previous version, whose tracks are processed again
+
+
+def materialize_cubes(
+    climatology_dir: Path, resolutions_deg: list[float]
+) -> list[date]:
+    """
+    Write the cubes (month, latitude, longitude) of each pyramid level from
+    the monthly grids: the prefix sums over the months of count/sum/sumsq
+    (so any range of months is a difference of two slices) and the monthly
+    max. The new cubes replace the old ones at once (directory rename).
+    """
+    climatology_dir = Path(climatology_dir)
+    month_fpaths = sorted((climatology_dir / MONTHLY_DIR_NAME).glob("????-??.npz"))
+    if not month_fpaths:
+        raise FileNotFoundError(f"No monthly grids in {climatology_dir}")
+    months = get_months(
+        date.fromisoformat(f"{month_fpaths[0].stem}-01"),
+        date.fromisoformat(f"{month_fpaths[-1].stem}-01"),
+    )
+    # ^ contiguous, the months without tracks are empty
+    factors = get_pyramid_factors(resolutions_deg)
+    shape = get_grid_shape(resolutions_deg[0])
+
+    tmp_dir = climatology_dir / f"{CUBES_DIR_NAME}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    cubes = {}
+    for resolution_deg, factor in zip(resolutions_deg, factors):
+        level_dir = tmp_dir / get_level_name(resolution_deg)
+        level_dir.mkdir(parents=True)
+        level_shape = (shape[0] // factor, shape[1] // factor)
+        empty_grids = make_empty_grids(level_shape)
+        for stat in SUMMED_STATS:
+            cubes[(resolution_deg, stat)] = np.lib.format.open_memmap(
+                level_dir / f"{stat}.npy",
+                mode="w+",
+                dtype=empty_grids[stat].dtype,
+                shape=(len(months) + 1, *level_shape),
+            )
+            cubes[(resolution_deg, stat)][0] = 0
+        cubes[(resolution_deg, "max")] = np.lib.format.open_memmap(
+            level_dir / "max.npy",
+            mode="w+",
+            dtype=empty_grids["max"].dtype,
+            shape=(len(months), *level_shape),
+        )
+
+    for month_idx, month_start in enumerate(months):
+        grids, _ = load_monthly_grids(climatology_dir, month_start, shape)
+        for resolution_deg, factor in zip(resolutions_deg, factors):
+            level_grids = coarsen_grids(grids, factor)
+            for stat in SUMMED_STATS:
+                cube = cubes[(resolution_deg, stat)]
+                cube[month_idx + 1] = cube[month_idx] + level_grids[stat]
+            cubes[(resolution_deg, "max")][month_idx] = level_grids["max"]
+
+    for cube in cubes.values():
+        cube.flush()
+    del cubes
+    with open(tmp_dir / MONTHS_FNAME, "w") as fd:
+        json.dump(
+            {
+                "months": [f"{month_start:%Y-%m}" for month_start in months],
+                "resolutions_deg": list(resolutions_deg),
+            },
+            fd,
+        )
+
+    cubes_dir = climatology_dir / CUBES_DIR_NAME
+    old_dir = climatology_dir / f"{CUBES_DIR_NAME}.{os.getpid()}.old"
+    if cubes_dir.exists():
+        os.rename(cubes_dir, old_dir)
+    os.rename(tmp_dir, cubes_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    # ^ the queries in progress keep reading the old (unlinked) files
+    return months
+
+
+def choose_resolution(
+    selection: ClimatologySelection,
+    resolutions_deg: list[float],
+    max_cells: int,
+) -> float:
+    """The requested level or the finest one with at most 'max_cells' in the box"""
+    if selection.resolution_deg is not None:
+        for resolution_deg in resolutions_deg:
+            if np.isclose(resolution_deg, selection.resolution_deg):
+                return resolution_deg
+        raise ValueError(f"resolution_deg must be one of {list(resolutions_deg)}")
+    for resolution_deg in sorted(resolutions_deg):
+        rows, cols = get_box_slices(selection, resolution_deg)
+        if (rows.stop - rows.start) * (cols.stop - cols.start) <= max_cells:
+            return resolution_deg
+    return max(resolutions_deg)
+
+
+def get_box_slices(
+    selection: ClimatologySelection,
+    resolution_deg: float,
+) -> tuple[slice, slice]:
+    """The rows and the columns of the cells intersecting the box"""
+    num_rows, num_cols = get_grid_shape(resolution_deg)
+    row_first = min(
+        int((selection.latitude_min + 90.0) // resolution_deg), num_rows - 1
+    )
+    row_last = min(int((selection.latitude_max + 90.0) // resolution_deg), num_rows - 1)
+    col_first = min(
+        int((selection.longitude_min + 180.0) // resolution_deg), num_cols - 1
+    )
+    col_last = min(
+        int((selection.longitude_max + 180.0) // resolution_deg), num_cols - 1
+    )
+    return slice(row_first, row_last + 1), slice(col_first, col_last + 1)
+
+
+def query_climatology(
+    climatology_dir: Path,
+    selection: ClimatologySelection,
+    config: DictConfig,
+) -> dict:
+    """
+    Gridded count/mean/std/max over the months overlapping the date range,
+    for the cells intersecting the box. count/sum/sumsq are differences of
+    two slices of the prefix sums whatever the number of months; the max is
+    reduced over the months of the box.
+    """
+    cubes_dir = Path(climatology_dir) / CUBES_DIR_NAME
+    with open(cubes_dir / MONTHS_FNAME) as fd:
+        cubes_metadata = json.load(fd)
+    months = [date.fromisoformat(f"{month}-01") for month in cubes_metadata["months"]]
+    resolution_deg = choose_resolution(
+        selection,
+        cubes_metadata["resolutions_deg"],
+        config.climatology.max_cells,
+    )
+    rows, cols = get_box_slices(selection, resolution_deg)
+    num_rows, num_cols = get_grid_shape(resolution_deg)
+    latitude = -90.0 + (np.arange(num_rows)[rows] + 0.5) * resolution_deg
+    longitude = -180.0 + (np.arange(num_cols)[cols] + 0.5) * resolution_deg
+
+    requested_months = get_months(selection.date_start, selection.date_end)
+    month_idxs = [
+        month_idx
+        for month_idx, month_start in enumerate(months)
+        if month_start in requested_months
+    ]
+    shape = (rows.stop - rows.start, cols.stop - cols.start)
+    if month_idxs:
+        month_first, month_last = month_idxs[0], month_idxs[-1]
+        level_dir = cubes_dir / get_level_name(resolution_deg)
+        grids = {}
+        for stat in SUMMED_STATS:
+            cube = np.load(level_dir / f"{stat}.npy", mmap_mode="r")
+            grids[stat] = (
+                cube[month_last + 1, rows, cols] - cube[month_first, rows, cols]
+            )
+        grids["max"] = np.load(level_dir / "max.npy", mmap_mode="r")[
+            month_first : month_last + 1, rows, cols
+        ].max(axis=0)
+    else:
+        grids = make_empty_grids(shape)
+
+    count = grids["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = grids["sum"] / count
+        std = np.sqrt(np.maximum(grids["sumsq"] / count - mean**2, 0.0))
+    no_points = count == 0
+
+    def to_list(values: np.ndarray) -> list:
+        """Rows of values, None in the cells without points"""
+        values = values.astype(object)
+        values[no_points] = None
+        return values.tolist()
+
+    return {
+        "resolution_deg": resolution_deg,
+        "months": [f"{months[month_idx]:%Y-%m}" for month_idx in month_idxs],
+        "latitude": latitude.tolist(),
+        "longitude": longitude.tolist(),
+        "count": count.tolist(),
+        "mean": to_list(mean),
+        "std": to_list(std),
+        "max": to_list(grids["max"].astype(np.float64)),
+    }
@@ -0,0 +1,274 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from omegaconf import DictConfig
+
+from app.utils.remote_h5 import open_h5_file
+from app.utils.track_file_contents import get_scan_timestamps
+from app.utils.track_file_names import (
+    extract_end_timestamp_from_h5_url,
+    extract_track_number_from_h5_url_or_fpath,
+    get_h5_fname,
+)
+
+EARTH_RADIUS_KM = 6371.0
+SWATH_MARGIN_FACTOR = 1.2
+# ^ the downsampled swath edges are one swath width apart along the track,
+#   so every footprint is within ~1.12 swath widths of the nearest edge point
+
+
+def to_datetime64(timestamps: list[datetime]) -> np.ndarray:
+    """Naive timestamps are UTC, aware ones are converted to UTC"""
+    return np.array(
+        [
+            (
+                timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+                if timestamp.tzinfo is not None
+                else timestamp
+            )
+            for timestamp in timestamps
+        ],
+        dtype="datetime64[ms]",
+    )
+
+
+def haversine_distances_km(
+    latitude_1: np.ndarray,
+    longitude_1: np.ndarray,
+    latitude_2: np.ndarray,
+    longitude_2: np.ndarray,
+) -> np.ndarray:
+    """Broadcasting great-circle distances, coordinates in degrees"""
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(
+        np.radians, (latitude_1, longitude_1, latitude_2, longitude_2)
+    )
+    a = (
+        np.sin((latitude_2 - latitude_1) / 2) ** 2
+        + np.cos(latitude_1)
+        * np.cos(latitude_2)
+        * np.sin((longitude_2 - longitude_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def select_candidate_tracks_by_time(
+    timestamps: np.ndarray,
+    time_window: np.timedelta64,
+    start_timestamps_to_h5_urls: dict[str, list[str]],
+    config: DictConfig,
+) -> dict[str, np.ndarray]:
+    """h5_url -> idxs of the points within the time span of the track +- window"""
+    start_timestamps_isoformat = sorted(start_timestamps_to_h5_urls)
+    start_timestamps = np.array(start_timestamps_isoformat, dtype="datetime64[ms]")
+    max_track_duration = np.timedelta64(
+        int(config.collocation.max_track_duration_minutes), "m"
+    )
+
+    idxs_first = np.searchsorted(
+        start_timestamps, timestamps - time_window - max_track_duration, side="left"
+    )
+    idxs_last = np.searchsorted(
+        start_timestamps, timestamps + time_window, side="right"
+    )
+
+    h5_url_to_point_idxs = defaultdict(list)
+    end_timestamps = {}
+    for point_idx, (idx_first, idx_last) in enumerate(zip(idxs_first, idxs_last)):
+        for start_timestamp_isoformat, start_timestamp in zip(
+            start_timestamps_isoformat[idx_first:idx_last],
+            start_timestamps[idx_first:idx_last],
+        ):
+            for h5_url in start_timestamps_to_h5_urls[start_timestamp_isoformat]:
+                if h5_url not in end_timestamps:
+                    end_timestamps[h5_url] = np.datetime64(
+                        extract_end_timestamp_from_h5_url(h5_url, config), "ms"
+                    ) + np.timedelta64(1, "m")
+                    # ^ the file names have the minute precision
+                if (
+                    start_timestamp <= timestamps[point_idx] + time_window
+                    and timestamps[point_idx] - time_window <= end_timestamps[h5_url]
+                ):
+                    h5_url_to_point_idxs[h5_url].append(point_idx)
+
+    return {
+        h5_url: np.array(point_idxs)
+        for h5_url, point_idxs in h5_url_to_point_idxs.items()
+    }
+
+
+def select_candidate_points_by_footprints(
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    radius_km: float,
+) -> np.ndarray:
+    """Mask of the points that may be within the radius from the swath"""
+    edges_latitude, edges_longitude = swath_edges_coords
+    swath_width_km = np.median(
+        haversine_distances_km(
+            edges_latitude[:, 0],
+            edges_longitude[:, 0],
+            edges_latitude[:, 1],
+            edges_longitude[:, 1],
+        )
+    )
+    distances_km = haversine_distances_km(
+        latitude[:, np.newaxis],
+        longitude[:, np.newaxis],
+        np.ravel(edges_latitude)[np.newaxis, :],
+        np.ravel(edges_longitude)[np.newaxis, :],
+    )
+    return distances_km.min(axis=1) <= SWATH_MARGIN_FACTOR * swath_width_km + radius_km
+
+
+def select_candidate_tracks_by_footprints(
+    h5_url_to_point_idxs: dict[str, np.ndarray],
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    radius_km: float,
+    fname_to_downsampled_points,
+    config: DictConfig,
+) -> dict[str, np.ndarray]:
+    """Same mapping, only the points (and the tracks) that may be near the swath"""
+    selected_h5_url_to_point_idxs = {}
+    for h5_url, point_idxs in h5_url_to_point_idxs.items():
+        point_idxs = point_idxs[
+            select_candidate_points_by_footprints(
+                fname_to_downsampled_points[get_h5_fname(h5_url, config)],
+                latitude[point_idxs],
+                longitude[point_idxs],
+                radius_km,
+            )
+        ]
+        if point_idxs.size > 0:
+            selected_h5_url_to_point_idxs[h5_url] = point_idxs
+    return selected_h5_url_to_point_idxs
+
+
+class CollocationResults:
+    """
+    Nearest footprint and running sum over all footprints within the radius
+    and the time window, for each point (over all tracks)
+    """
+
+    def __init__(self, num_points: int):
+        self.nearest_distance_km = np.full(num_points, np.inf)
+        self.nearest_observable = np.full(num_points, np.nan)
+        self.nearest_time_offset_seconds = np.full(num_points, np.nan)
+        self.nearest_track_number = [None] * num_points
+        self.observable_sum = np.zeros(num_points)
+        self.num_footprints = np.zeros(num_points, dtype=np.int64)
+
+    def update(
+        self,
+        point_idx: int,
+        distances_km: np.ndarray,
+        time_offsets_seconds: np.ndarray,
+        observable: np.ndarray,
+        track_number: str,
+    ) -> None:
+        if distances_km.size == 0:
+            return
+        self.observable_sum[point_idx] += observable.sum()
+        self.num_footprints[point_idx] += observable.size
+        idx_nearest = np.argmin(distances_km)
+        if distances_km[idx_nearest] < self.nearest_distance_km[point_idx]:
+            self.nearest_distance_km[point_idx] = distances_km[idx_nearest]
+            self.nearest_observable[point_idx] = observable[idx_nearest]
+            self.nearest_time_offset_seconds[point_idx] = time_offsets_seconds[
+                idx_nearest
+            ]
+            self.nearest_track_number[point_idx] = track_number
+
+    def to_table(self, aggregation: str) -> dict[str, list]:
+        """Columns of equal length, 'None' where no footprints were found"""
+        if aggregation == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                observable = self.observable_sum / self.num_footprints
+        else:
+            observable = self.nearest_observable
+
+        def to_list(values: np.ndarray) -> list:
+            return [
+                None if not np.isfinite(value) else float(value) for value in values
+            ]
+
+        return {
+            "observable": to_list(observable),
+            "num_footprints": self.num_footprints.tolist(),
+            "nearest_distance_km": to_list(self.nearest_distance_km),
+            "nearest_time_offset_seconds": to_list(self.nearest_time_offset_seconds),
+            "nearest_track_number": self.nearest_track_number,
+        }
+
+
+def collocate_points_with_h5_file(
+    h5_fpath: Path | str,
+    point_idxs: np.ndarray,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    timestamps: np.ndarray,
+    radius_km: float,
+    time_window: np.timedelta64,
+    config: DictConfig,
+    results: CollocationResults,
+) -> None:
+    """The file is read once, its valid footprints are put into a BallTree"""
+    from sklearn.neighbors import BallTree
+
+    # ^ imported on first use: scikit-learn is slow to import
+    with open_h5_file(h5_fpath, config) as h5:
+        scan_timestamps = get_scan_timestamps(h5, h5_fpath, config)
+        points_timestamps = timestamps[point_idxs]
+        idxs_in_interval = np.flatnonzero(
+            np.logical_and(
+                points_timestamps.min() - time_window <= scan_timestamps,
+                scan_timestamps <= points_timestamps.max() + time_window,
+            )
+        )
+        if idxs_in_interval.size == 0:
+            return
+        rows_in_interval = slice(idxs_in_interval[0], idxs_in_interval[-1] + 1)
+
+        footprints_latitude = h5["Latitude"][rows_in_interval]
+        footprints_longitude = h5["Longitude"][rows_in_interval]
+        footprints_observable = h5[config.hdf_observable.value_name][rows_in_interval]
+        footprints_timestamps = np.broadcast_to(
+            scan_timestamps[rows_in_interval, np.newaxis], footprints_latitude.shape
+        )
+    valid_mask = footprints_observable < min(
+        config.hdf_observable.value_invalid,
+        config.hdf_observable.upper_threshold,
+    )
+    footprints_latitude = footprints_latitude[valid_mask]
+    footprints_longitude = footprints_longitude[valid_mask]
+    footprints_observable = footprints_observable[valid_mask]
+    footprints_timestamps = footprints_timestamps[valid_mask]
+    if footprints_observable.size == 0:
+        return
+
+    ball_tree = BallTree(
+        np.radians(np.stack([footprints_latitude, footprints_longitude], axis=1)),
+        metric="haversine",
+    )
+    neighbors_idxs, neighbors_distances = ball_tree.query_radius(
+        np.radians(np.stack([latitude[point_idxs], longitude[point_idxs]], axis=1)),
+        r=radius_km / EARTH_RADIUS_KM,
+        return_distance=True,
+    )
+
+    track_number = extract_track_number_from_h5_url_or_fpath(h5_fpath, config)
+    for point_idx, point_timestamp, idxs, distances in zip(
+        point_idxs, points_timestamps, neighbors_idxs, neighbors_distances
+    ):
+        time_offsets = footprints_timestamps[idxs] - point_timestamp
+        in_time_window = np.abs(time_offsets) <= time_window
+        results.update(
+            point_idx,
+            distances[in_time_window] * EARTH_RADIUS_KM,
+            time_offsets[in_time_window] / np.timedelta64(1, "s"),
+            footprints_observable[idxs[in_time_window]],
+            track_number,
+        )
@@ -0,0 +1,229 @@
+import io
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import h5py
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.h5_extracted_ndarrays import H5ExtractedNdarrays
+from app.core.cancellation import QueryCancelled, raise_if_cancelled
+
+EXPORT_FORMATS_TO_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "netcdf": "application/x-netcdf",
+}
+EXPORT_FORMATS_TO_EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "netcdf": ".nc",
+}
+NETCDF_CHUNK_SIZE = 65536
+FILE_READ_SIZE = 1 << 20
+CSV_ROWS_PER_CHUNK = 65536
+
+ExportSegment = tuple[int, datetime, H5ExtractedNdarrays]
+# ^ track number, start timestamp, points of the track
+
+
+class ChunkBuffer(io.RawIOBase):
+    """Write-only file object, the written bytes are taken out by 'drain'"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def generate_csv_chunks(
+    segments: Iterable[ExportSegment],
+    config: DictConfig,
+) -> Iterator[bytes]:
+    buffer = ChunkBuffer()
+    value_name = config.hdf_observable.value_name
+    buffer.write(
+        f"track_number,start_timestamp,latitude,longitude,{value_name}\n".encode()
+    )
+    for track_number, start_timestamp, h5_data in segments:
+        for idx_start in range(0, h5_data.observable.size, CSV_ROWS_PER_CHUNK):
+            rows = slice(idx_start, idx_start + CSV_ROWS_PER_CHUNK)
+            np.savetxt(
+                buffer,
+                np.column_stack(
+                    [
+                        h5_data.latitude[rows],
+                        h5_data.longitude[rows],
+                        h5_data.observable[rows],
+                    ]
+                ),
+                fmt=f"{track_number},{start_timestamp.isoformat()},%.5f,%.5f,%.3f",
+            )
+            yield buffer.drain()
+            # ^ formatting is slow, so the abandoned exports stop sooner
+    yield buffer.drain()
+
+
+def generate_parquet_chunks(
+    segments: Iterable[ExportSegment],
+    config: DictConfig,
+) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # ^ imported on first use: pyarrow is slow to import
+    schema = pa.schema(
+        [
+            ("track_number", pa.int32()),
+            ("start_timestamp", pa.timestamp("s")),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+            (config.hdf_observable.value_name, pa.float64()),
+        ]
+    )
+    buffer = ChunkBuffer()
+    with pq.ParquetWriter(buffer, schema, compression="zstd") as writer:
+        for track_number, start_timestamp, h5_data in segments:
+            num_points = h5_data.observable.size
+            writer.write_table(
+                pa.table(
+                    [
+                        np.full(num_points, track_number, dtype=np.int32),
+                        np.full(num_points, np.datetime64(start_timestamp, "s")),
+                        h5_data.latitude,
+                        h5_data.longitude,
+                        h5_data.observable,
+                    ],
+                    schema=schema,
+                )
+            )
+            # ^ one row group per track
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def write_netcdf(
+    segments: Iterable[ExportSegment],
+    nc_fpath: Path,
+    config: DictConfig,
+    cancelled: threading.Event | None = None,
+) -> None:
+    """
+    NetCDF-4 (HDF5-based) file with the unlimited dimension 'point',
+    the variables are appended track by track ('cancelled' is checked
+    before each track)
+    """
+    with h5py.File(nc_fpath, "w", track_order=True) as nc:
+        point = nc.create_dataset(
+            "point",
+            shape=(0,),
+            maxshape=(None,),
+            dtype=">f4",
+            chunks=(NETCDF_CHUNK_SIZE,),
+        )
+        point.make_scale(
+            "This is a netCDF dimension but not a netCDF variable.         0"
+        )
+        # ^ a dimension without a coordinate variable, as written by netCDF-4
+        variables_dtypes_attrs = {
+            "track_number": (np.int32, {}),
+            "start_timestamp": (
+                np.int64,
+                {"units": "seconds since 1970-01-01 00:00:00", "calendar": "standard"},
+            ),
+            "latitude": (np.float64, {"units": "degrees_north"}),
+            "longitude": (np.float64, {"units": "degrees_east"}),
+            config.hdf_observable.value_name: (np.float64, {}),
+        }
+        variables = {}
+        for name, (dtype, attrs) in variables_dtypes_attrs.items():
+            variables[name] = nc.create_dataset(
+                name,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=dtype,
+                chunks=(NETCDF_CHUNK_SIZE,),
+                compression="gzip",
+            )
+            variables[name].dims[0].attach_scale(point)
+            variables[name].attrs.update(attrs)
+
+        num_points_written = 0
+        for track_number, start_timestamp, h5_data in segments:
+            raise_if_cancelled(cancelled)
+            num_points = h5_data.observable.size
+            values = {
+                "track_number": np.full(num_points, track_number),
+                "start_timestamp": np.full(
+                    num_points,
+                    np.datetime64(start_timestamp, "s").astype(np.int64),
+                ),
+                "latitude": h5_data.latitude,
+                "longitude": h5_data.longitude,
+                config.hdf_observable.value_name: h5_data.observable,
+            }
+            for name, variable in variables.items():
+                variable.resize((num_points_written + num_points,))
+                variable[num_points_written:] = values[name]
+            num_points_written += num_points
+            point.resize((num_points_written,))
+
+
+def generate_netcdf_chunks(
+    segments: Iterable[ExportSegment],
+    config: DictConfig,
+    cancelled: threading.Event | None = None,
+) -> Iterator[bytes]:
+    """
+    Not streamed: the HDF5 library needs a seekable file, so the whole file
+    is written to a temporary file first (the disk use grows with the
+    selection) and sent afterwards. The writing stops at the next track once
+    'cancelled' is set, and nothing is sent then.
+    """
+    fd, nc_fname = tempfile.mkstemp(suffix=".nc")
+    os.close(fd)
+    nc_fpath = Path(nc_fname)
+    try:
+        write_netcdf(segments, nc_fpath, config, cancelled)
+        raise_if_cancelled(cancelled)
+        with open(nc_fpath, "rb") as fd:
+            while chunk := fd.read(FILE_READ_SIZE):
+                yield chunk
+    except QueryCancelled:
+        return
+    finally:
+        nc_fpath.unlink(missing_ok=True)
+
+
+def generate_export_chunks(
+    segments: Iterable[ExportSegment],
+    export_format: str,
+    config: DictConfig,
+    cancelled: threading.Event | None = None,
+) -> Iterator[bytes]:
+    if export_format == "csv":
+        return generate_csv_chunks(segments, config)
+    if export_format == "parquet":
+        return generate_parquet_chunks(segments, config)
+    if export_format == "netcdf":
+        return generate_netcdf_chunks(segments, config, cancelled)
+    raise ValueError(f"Unknown export format: {export_format}")
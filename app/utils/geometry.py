@@ -1,4 +1,8 @@
+import json
+from functools import lru_cache
+
 import numpy as np
+import shapely
 from shapely.geometry import Polygon
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
@@ -69,3 +73,76 @@ def check_swath_intersects_roi(
             return True
 
     return False
+
+
+def find_swath_fragments_intersecting_roi(
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    selection: DatesCoordsSelection,
+) -> np.ndarray:
+    """
+    Idxs 'i' of the swath fragments between the downsampled
+    edge points 'i' and 'i + 1' that intersect the ROI
+    """
+    latitude, longitude = swath_edges_coords
+    fragments_coords = np.stack(
+        [
+            np.stack([longitude[:-1, 0], latitude[:-1, 0]], axis=1),
+            np.stack([longitude[1:, 0], latitude[1:, 0]], axis=1),
+            np.stack([longitude[1:, 1], latitude[1:, 1]], axis=1),
+            np.stack([longitude[:-1, 1], latitude[:-1, 1]], axis=1),
+        ],
+        axis=1,
+    )
+    polygons_swath_fragments = shapely.polygons(fragments_coords)
+    polygon_roi = shapely.box(
+        selection.longitude_min,
+        selection.latitude_min,
+        selection.longitude_max,
+        selection.latitude_max,
+    )
+    return np.flatnonzero(shapely.intersects(polygons_swath_fragments, polygon_roi))
+
+
+@lru_cache(maxsize=64)
+def parse_roi_geometry(roi_geometry_json: str):
+    try:
+        geometry = shapely.geometry.shape(json.loads(roi_geometry_json))
+    except Exception as exc:
+        raise ValueError(f"roi_geometry is not a GeoJSON geometry: {exc}") from None
+    if geometry.geom_type not in ("Polygon", "MultiPolygon"):
+        raise ValueError("roi_geometry must be a Polygon or a MultiPolygon")
+    if geometry.is_empty or not geometry.is_valid:
+        raise ValueError(
+            f"roi_geometry is invalid: {shapely.is_valid_reason(geometry)}"
+        )
+    shapely.prepare(geometry)
+    # ^ the point-in-polygon tests of all tracks reuse the prepared geometry
+    return geometry
+
+
+def get_roi_geometry(roi_geometry: dict):
+    """Parsed and prepared once per distinct GeoJSON geometry"""
+    return parse_roi_geometry(json.dumps(roi_geometry, sort_keys=True))
+
+
+def mask_points_in_roi(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    selection: DatesCoordsSelection,
+) -> np.ndarray:
+    """The points within the latitude/longitude ranges and the ROI polygon"""
+    mask = (
+        (selection.latitude_min <= latitude)
+        & (latitude <= selection.latitude_max)
+        & (selection.longitude_min <= longitude)
+        & (longitude <= selection.longitude_max)
+    )
+    if selection.roi_geometry is not None:
+        idxs_in_bbox = np.flatnonzero(mask)
+        mask.flat[idxs_in_bbox] = shapely.intersects_xy(
+            get_roi_geometry(selection.roi_geometry),
+            longitude.flat[idxs_in_bbox],
+            latitude.flat[idxs_in_bbox],
+        )
+        # ^ only the points in the bounding box are tested (vectorized)
+    return mask
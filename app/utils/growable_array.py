@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class GrowableArray:
+    """
+    1-D array filled block by block: the selected values are copied right
+    into the free space (no temporary arrays), the capacity doubles when full
+    """
+
+    def __init__(self, dtype, capacity: int = 0):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def reserve(self, num_values: int) -> None:
+        if self.size + num_values <= len(self.data):
+            return
+        data = np.empty(
+            max(self.size + num_values, 2 * len(self.data)), self.data.dtype
+        )
+        data[: self.size] = self.data[: self.size]
+        self.data = data
+
+    def append_selected(
+        self, values: np.ndarray, mask: np.ndarray, num_selected: int
+    ) -> None:
+        """Append 'values[mask]', 'num_selected' is the number of True in 'mask'"""
+        self.reserve(num_selected)
+        np.compress(
+            mask.ravel(),
+            values.ravel(),
+            out=self.data[self.size : self.size + num_selected],
+        )
+        self.size += num_selected
+
+    def truncate(self, size: int) -> None:
+        self.size = min(size, self.size)
+
+    def to_array(self) -> np.ndarray:
+        """The values (the spare capacity is freed), the buffer isn't usable after"""
+        self.data.resize(self.size, refcheck=False)
+        return self.data
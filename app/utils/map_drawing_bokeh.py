@@ -1,11 +1,36 @@
-import cartopy.crs as ccrs
+from functools import lru_cache
+
 import cartopy.feature as cfeature
 import numpy as np
-from bokeh.models import ColumnDataSource, LabelSet, Range1d
+import shapely
+from bokeh.events import MouseLeave, MouseMove
+from bokeh.models import (
+    ColumnDataSource,
+    CustomJS,
+    Label,
+    LabelSet,
+    LinearColorMapper,
+    Range1d,
+)
 from bokeh.plotting import figure
-from shapely.geometry import LineString, MultiLineString, MultiPolygon, Polygon
+from shapely.geometry import LineString, MultiPolygon, Polygon
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.nearest_point_index import build_grid_index
+from app.utils.rasterization import RASTER_EMPTY_VALUE, build_raster_pyramid
+
+BASEMAP_SIMPLIFY_TOLERANCE_PIXELS = 0.5
+# ^ the basemap outlines are simplified with the tolerance equal to
+#   this fraction of the figure's pixel size (in degrees)
+
+
+@lru_cache(maxsize=1)
+def load_basemap_geometries() -> tuple[np.ndarray, np.ndarray]:
+    """Load the Natural Earth coastlines and land polygons (once per process)"""
+    coast_geoms = cfeature.NaturalEarthFeature("physical", "coastline", "50m")
+    coastlines = [geom for geom in coast_geoms.geometries() if not geom.is_empty]
+    land_polygons = get_land_polygons()
+    return np.array(coastlines, dtype=object), np.array(land_polygons, dtype=object)
 
 
 def get_land_polygons():
@@ -22,22 +47,60 @@ def get_land_polygons():
     return polygons
 
 
-def get_polygon_source(polygons, projection):
-    """Convert polygons to Bokeh ColumnDataSource"""
+def clip_and_simplify(
+    geoms: np.ndarray,
+    bbox: tuple[float, float, float, float],
+    tolerance: float,
+) -> np.ndarray:
+    """Keep the parts of the geometries inside the bbox, simplify them"""
+    lon_min, lon_max, lat_min, lat_max = bbox
+    bbox_polygon = shapely.box(lon_min, lat_min, lon_max, lat_max)
+    geoms = geoms[shapely.intersects(geoms, bbox_polygon)]
+    clipped = shapely.clip_by_rect(geoms, lon_min, lat_min, lon_max, lat_max)
+    simplified = shapely.simplify(clipped, tolerance, preserve_topology=True)
+    parts = shapely.get_parts(simplified)
+    return parts[~shapely.is_empty(parts)]
+
+
+def get_lines_data(lines: np.ndarray) -> dict[str, list[np.ndarray]]:
+    """Convert (multi)line strings to the Bokeh 'multi_line' data"""
+    xs, ys = [], []
+
+    for line in lines:
+        if isinstance(line, LineString):
+            coords = shapely.get_coordinates(line)
+            xs.append(coords[:, 0])
+            ys.append(coords[:, 1])
+
+    return dict(xs=xs, ys=ys)
+
+
+def get_polygons_data(polygons: np.ndarray) -> dict[str, list[np.ndarray]]:
+    """Convert polygons to the Bokeh 'patches' data (exteriors only)"""
     xs, ys = [], []
 
     for polygon in polygons:
-        # Extract exterior coordinates
-        x, y = polygon.exterior.xy
-        # Project coordinates if needed
-        if projection:
-            x, y = projection.transform_points(
-                ccrs.PlateCarree(), np.array(x), np.array(y)
-            )[:, :2].T
-        xs.append(x.tolist())
-        ys.append(y.tolist())
+        if isinstance(polygon, Polygon):
+            coords = shapely.get_coordinates(polygon.exterior)
+            xs.append(coords[:, 0])
+            ys.append(coords[:, 1])
+
+    return dict(xs=xs, ys=ys)
 
-    return ColumnDataSource(data=dict(xs=xs, ys=ys))
+
+@lru_cache(maxsize=64)
+def get_basemap_data(
+    bbox: tuple[float, float, float, float],
+    tolerance: float,
+) -> tuple[dict, dict]:
+    """
+    Get the coastlines and land data clipped to the ROI.
+    The result is cached by the ROI and the simplification tolerance.
+    """
+    coastlines, land_polygons = load_basemap_geometries()
+    coastline_data = get_lines_data(clip_and_simplify(coastlines, bbox, tolerance))
+    land_data = get_polygons_data(clip_and_simplify(land_polygons, bbox, tolerance))
+    return coastline_data, land_data
 
 
 def prepare_bokeh_map(
@@ -75,15 +138,25 @@ def prepare_bokeh_map(
     # Configure plot appearance
     p.title.text_font_size = "16pt"
 
-    # Add coastlines (50m resolution)
-    coast_geoms = cfeature.NaturalEarthFeature("physical", "coastline", "50m")
-    coastline_source = get_geojson_source(coast_geoms)
+    # Coastlines and land (50m resolution), clipped to the ROI
+    # and simplified according to the figure's pixel size
+    degrees_per_pixel = max(
+        (lon_max - lon_min) / max(fig_width, 1),
+        (lat_max - lat_min) / max(fig_height, 1),
+    )
+    coastline_data, land_data = get_basemap_data(
+        (lon_min, lon_max, lat_min, lat_max),
+        BASEMAP_SIMPLIFY_TOLERANCE_PIXELS * degrees_per_pixel,
+    )
+    # ^ Bokeh models can't be shared between documents,
+    #   so only the (cached) data is reused
+
+    coastline_source = ColumnDataSource(data=dict(coastline_data))
     p.multi_line(
         xs="xs", ys="ys", source=coastline_source, line_color="black", line_width=1
     )
 
-    land_polygons = get_land_polygons()
-    land_source = get_polygon_source(land_polygons, projection=None)
+    land_source = ColumnDataSource(data=dict(land_data))
     p.patches(
         xs="xs",
         ys="ys",
@@ -97,27 +170,237 @@ def prepare_bokeh_map(
     return p
 
 
-def get_geojson_source(feature):
-    """Convert cartopy feature to Bokeh ColumnDataSource"""
-    geoms = list(feature.geometries())
-    xs, ys = [], []
+def add_rasterized_points(
+    p: figure,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    color_mapper: LinearColorMapper,
+    num_zoom_levels: int,
+) -> None:
+    """
+    Draw the points as an aggregated image instead of separate glyphs.
+    The image is pre-aggregated at several resolutions; when the user zooms,
+    the level matching the visible fraction of the ROI is shown.
+    """
+    lon_min, lon_max = p.x_range.start, p.x_range.end
+    lat_min, lat_max = p.y_range.start, p.y_range.end
+
+    levels = build_raster_pyramid(
+        latitude,
+        longitude,
+        observable,
+        (lon_min, lon_max, lat_min, lat_max),
+        p.width,
+        p.height,
+        num_zoom_levels,
+        color_mapper.low,
+        color_mapper.high,
+    )
+    raster_color_mapper = LinearColorMapper(
+        palette=color_mapper.palette,
+        low=RASTER_EMPTY_VALUE + 1,
+        high=255,
+        low_color=(0, 0, 0, 0),  # transparent empty pixels
+    )
+
+    image_source = ColumnDataSource(data=dict(image=[levels[0]]))
+    levels_source = ColumnDataSource(data=dict(image=levels))
+    p.image(
+        image="image",
+        source=image_source,
+        x=lon_min,
+        y=lat_min,
+        dw=(lon_max - lon_min),
+        dh=(lat_max - lat_min),
+        color_mapper=raster_color_mapper,
+    )
+
+    switch_level_js_code = """
+        const full_width = bounds[1] - bounds[0];
+        const full_height = bounds[3] - bounds[2];
+        const visible_fraction = Math.min(
+            (x_range.end - x_range.start) / full_width,
+            (y_range.end - y_range.start) / full_height,
+        );
+        const num_levels = levels_source.data['image'].length;
+        const level = Math.max(
+            0,
+            Math.min(num_levels - 1, Math.ceil(-Math.log2(visible_fraction) - 1e-6)),
+        );
+        if (image_source.data['image'][0] !== levels_source.data['image'][level]) {
+            image_source.data = {image: [levels_source.data['image'][level]]};
+        }
+    """
+    callback = CustomJS(
+        args=dict(
+            image_source=image_source,
+            levels_source=levels_source,
+            x_range=p.x_range,
+            y_range=p.y_range,
+            bounds=[lon_min, lon_max, lat_min, lat_max],
+        ),
+        code=switch_level_js_code,
+    )
+    p.x_range.js_on_change("start", callback)
+    p.x_range.js_on_change("end", callback)
+    p.y_range.js_on_change("start", callback)
+    p.y_range.js_on_change("end", callback)
+
+
+def add_nearest_point_hover(
+    p: figure,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    points_per_cell: float,
+    max_distance_pixels: float,
+) -> None:
+    """
+    Show the coordinates and the value of the point nearest to the mouse
+    (within 'max_distance_pixels'). The points are shipped bucketed into
+    a uniform grid, so each mouse move searches only the cells around the
+    mouse instead of all points: it works at any zoom level, also for the
+    points drawn as an aggregated image.
+    """
+    index = build_grid_index(
+        latitude,
+        longitude,
+        observable,
+        (p.x_range.start, p.x_range.end, p.y_range.start, p.y_range.end),
+        points_per_cell,
+    )
+    points_source = ColumnDataSource(
+        data=dict(
+            latitude=index.latitude,
+            longitude=index.longitude,
+            observable=index.observable,
+        )
+    )
+    cells_source = ColumnDataSource(data=dict(cell_starts=index.cell_starts))
+
+    nearest_source = ColumnDataSource(data=dict(longitude=[], latitude=[]))
+    p.scatter(
+        "longitude",
+        "latitude",
+        source=nearest_source,
+        marker="circle",
+        size=10,
+        fill_color=None,
+        line_color="black",
+        line_width=2,
+    )
+    label = Label(
+        x=0,
+        y=0,
+        x_offset=8,
+        y_offset=8,
+        text="",
+        visible=False,
+        text_font_size="11pt",
+        background_fill_color="white",
+        background_fill_alpha=0.85,
+        border_line_color="black",
+    )
+    p.add_layout(label)
+
+    nearest_point_js_code = """
+        const latitude = points_source.data['latitude'];
+        const longitude = points_source.data['longitude'];
+        const observable = points_source.data['observable'];
+        const cell_starts = cells_source.data['cell_starts'];
+        const [lon_min, lon_max, lat_min, lat_max, num_rows, num_cols] = grid;
+        const cell_width = (lon_max - lon_min) / num_cols;
+        const cell_height = (lat_max - lat_min) / num_rows;
+        const pixels_per_lon = plot.inner_width / (x_range.end - x_range.start);
+        const pixels_per_lat = plot.inner_height / (y_range.end - y_range.start);
+        const min_cell_pixels = Math.min(
+            cell_width * pixels_per_lon,
+            cell_height * pixels_per_lat,
+        );
+        const x = cb_obj.x;
+        const y = cb_obj.y;
+        const row = Math.min(
+            num_rows - 1, Math.max(0, Math.floor((y - lat_min) / cell_height))
+        );
+        const col = Math.min(
+            num_cols - 1, Math.max(0, Math.floor((x - lon_min) / cell_width))
+        );
+
+        let best_idx = -1;
+        let best_distance2 = max_distance_pixels * max_distance_pixels;
+        for (let ring = 0; ring <= Math.max(num_rows, num_cols); ring++) {
+            const ring_distance = (ring - 1) * min_cell_pixels;
+            if (ring >= 2 && ring_distance * ring_distance > best_distance2) {
+                break;  // the points of this ring are at least (ring - 1) cells away
+            }
+            const row_first = Math.max(row - ring, 0);
+            const row_last = Math.min(row + ring, num_rows - 1);
+            for (let ring_row = row_first; ring_row <= row_last; ring_row++) {
+                const whole_row = Math.abs(ring_row - row) === ring;
+                const col_step = whole_row ? 1 : 2 * ring;
+                for (let ring_col = col - ring; ring_col <= col + ring; ring_col += col_step) {
+                    if (ring_col < 0 || ring_col >= num_cols) {
+                        continue;
+                    }
+                    const cell = ring_row * num_cols + ring_col;
+                    for (let i = cell_starts[cell]; i < cell_starts[cell + 1]; i++) {
+                        const dx = (longitude[i] - x) * pixels_per_lon;
+                        const dy = (latitude[i] - y) * pixels_per_lat;
+                        const distance2 = dx * dx + dy * dy;
+                        if (distance2 < best_distance2) {
+                            best_distance2 = distance2;
+                            best_idx = i;
+                        }
+                    }
+                }
+            }
+        }
 
-    for geom in geoms:
-        if geom.is_empty:
-            continue
-
-        # Handle different geometry types
-        if isinstance(geom, LineString):
-            x, y = geom.xy
-            xs.append(x.tolist())
-            ys.append(y.tolist())
-        elif isinstance(geom, MultiLineString):
-            for line in geom.geoms:
-                x, y = line.xy
-                xs.append(x.tolist())
-                ys.append(y.tolist())
-
-    return ColumnDataSource(data=dict(xs=xs, ys=ys))
+        if (best_idx < 0) {
+            nearest_source.data = {longitude: [], latitude: []};
+            label.visible = false;
+            return;
+        }
+        nearest_source.data = {
+            longitude: [longitude[best_idx]],
+            latitude: [latitude[best_idx]],
+        };
+        label.x = longitude[best_idx];
+        label.y = latitude[best_idx];
+        label.text = (
+            `(lat, lon): (${latitude[best_idx].toFixed(3)}, ${longitude[best_idx].toFixed(3)})\n`
+            + `U10: ${observable[best_idx].toFixed(2)} m/s`
+        );
+        label.visible = true;
+    """
+    p.js_on_event(
+        MouseMove,
+        CustomJS(
+            args=dict(
+                points_source=points_source,
+                cells_source=cells_source,
+                nearest_source=nearest_source,
+                label=label,
+                plot=p,
+                x_range=p.x_range,
+                y_range=p.y_range,
+                grid=[*index.bbox, index.num_rows, index.num_cols],
+                max_distance_pixels=max_distance_pixels,
+            ),
+            code=nearest_point_js_code,
+        ),
+    )
+    p.js_on_event(
+        MouseLeave,
+        CustomJS(
+            args=dict(nearest_source=nearest_source, label=label),
+            code="""
+                nearest_source.data = {longitude: [], latitude: []};
+                label.visible = false;
+            """,
+        ),
+    )
 
 
 def add_geo_grid(p, lon_min, lon_max, lat_min, lat_max):
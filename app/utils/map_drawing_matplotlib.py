@@ -1,3 +1,7 @@
+import base64
+import io
+import threading
+
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 import matplotlib.pyplot as plt
@@ -7,6 +11,8 @@ from cartopy.mpl.gridliner import LATITUDE_FORMATTER, LONGITUDE_FORMATTER
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
 
+RENDERING_LOCK = threading.Lock()
+# ^ pyplot keeps global state, the requests render in the worker threads
 LAND = cfeature.NaturalEarthFeature(
     "physical", "land", "50m", edgecolor="face", facecolor=cfeature.COLORS["land"]
 )
@@ -51,3 +57,22 @@ def draw_points(
         s=7,
         c="r",
     )
+
+
+def render_track_image_base64(
+    track_number: str,
+    selection: DatesCoordsSelection,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+) -> str:
+    """Draw the track's points on the map, return the JPEG image (base64)"""
+    with RENDERING_LOCK:
+        fig, ax = prepare_map(f"Track number {track_number}", selection)
+        draw_points(fig, ax, latitude, longitude)
+
+        with io.BytesIO() as buffer:
+            fig.savefig(buffer, format="jpg")
+            image_base64 = base64.b64encode(buffer.getvalue()).decode()
+
+        plt.close(fig)
+    return image_base64
@@ -0,0 +1,127 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+class GridIndex(NamedTuple):
+    """
+    Points bucketed into a uniform grid over the bbox: the points of the
+    cell 'row * num_cols + col' are [cell_starts[cell], cell_starts[cell + 1])
+    """
+
+    latitude: np.ndarray
+    longitude: np.ndarray
+    observable: np.ndarray
+    cell_starts: np.ndarray
+    bbox: tuple[float, float, float, float]
+    num_rows: int
+    num_cols: int
+
+
+def get_grid_cells(
+    latitude: np.ndarray | float,
+    longitude: np.ndarray | float,
+    bbox: tuple[float, float, float, float],
+    num_rows: int,
+    num_cols: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """(rows, cols) of the cells, the points outside the bbox go to the edge cells"""
+    lon_min, lon_max, lat_min, lat_max = bbox
+    cell_width = (lon_max - lon_min) / num_cols
+    cell_height = (lat_max - lat_min) / num_rows
+    rows = np.clip(np.floor((latitude - lat_min) / cell_height), 0, num_rows - 1)
+    cols = np.clip(np.floor((longitude - lon_min) / cell_width), 0, num_cols - 1)
+    return rows.astype(np.int64), cols.astype(np.int64)
+
+
+def build_grid_index(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    bbox: tuple[float, float, float, float],
+    points_per_cell: float,
+) -> GridIndex:
+    """
+    Sort the points by the cells of a grid with about 'points_per_cell'
+    points per cell (on average), the cells being close to square
+    """
+    lon_min, lon_max, lat_min, lat_max = bbox
+    lon_span = max(lon_max - lon_min, np.finfo(np.float64).eps)
+    lat_span = max(lat_max - lat_min, np.finfo(np.float64).eps)
+    bbox = (lon_min, lon_min + lon_span, lat_min, lat_min + lat_span)
+
+    num_cells = max(latitude.size / points_per_cell, 1.0)
+    num_cols = max(int(np.ceil(np.sqrt(num_cells * lon_span / lat_span))), 1)
+    num_rows = max(int(np.ceil(num_cells / num_cols)), 1)
+
+    rows, cols = get_grid_cells(latitude, longitude, bbox, num_rows, num_cols)
+    cell_idxs = rows * num_cols + cols
+    order = np.argsort(cell_idxs, kind="stable")
+    cell_starts = np.zeros(num_rows * num_cols + 1, dtype=np.int32)
+    np.cumsum(
+        np.bincount(cell_idxs, minlength=num_rows * num_cols), out=cell_starts[1:]
+    )
+
+    return GridIndex(
+        latitude=latitude[order].astype(np.float32),
+        longitude=longitude[order].astype(np.float32),
+        observable=observable[order].astype(np.float32),
+        cell_starts=cell_starts,
+        bbox=bbox,
+        num_rows=num_rows,
+        num_cols=num_cols,
+    )
+
+
+def find_nearest_point(
+    index: GridIndex,
+    latitude: float,
+    longitude: float,
+    pixels_per_degree: tuple[float, float],
+    max_distance_pixels: float,
+) -> int | None:
+    """
+    Index (in the sorted arrays) of the nearest point on the screen within
+    'max_distance_pixels', or None. The rings of cells around the cell of
+    the position are searched until the next ring can't be closer: the cost
+    depends on the number of cells within the distance, not on the number of
+    points. Same algorithm as the hover callback in 'map_drawing_bokeh'.
+    """
+    pixels_per_lon, pixels_per_lat = pixels_per_degree
+    lon_min, lon_max, lat_min, lat_max = index.bbox
+    min_cell_pixels = min(
+        (lon_max - lon_min) / index.num_cols * pixels_per_lon,
+        (lat_max - lat_min) / index.num_rows * pixels_per_lat,
+    )
+    row, col = get_grid_cells(
+        latitude, longitude, index.bbox, index.num_rows, index.num_cols
+    )
+
+    best_idx = None
+    best_distance2 = max_distance_pixels**2
+    for ring in range(max(index.num_rows, index.num_cols) + 1):
+        if (ring >= 2) and ((ring - 1) * min_cell_pixels) ** 2 > best_distance2:
+            break
+            # ^ the points of this ring are at least (ring - 1) cells away
+        for ring_row in range(
+            max(row - ring, 0), min(row + ring, index.num_rows - 1) + 1
+        ):
+            if abs(ring_row - row) == ring:
+                ring_cols = range(col - ring, col + ring + 1)
+            else:
+                ring_cols = (col - ring, col + ring)
+            for ring_col in ring_cols:
+                if not (0 <= ring_col < index.num_cols):
+                    continue
+                cell = ring_row * index.num_cols + ring_col
+                start, end = index.cell_starts[cell], index.cell_starts[cell + 1]
+                if start == end:
+                    continue
+                distances2 = (
+                    (index.longitude[start:end] - longitude) * pixels_per_lon
+                ) ** 2 + ((index.latitude[start:end] - latitude) * pixels_per_lat) ** 2
+                idx = int(np.argmin(distances2))
+                if distances2[idx] < best_distance2:
+                    best_distance2 = distances2[idx]
+                    best_idx = start + idx
+    return best_idx
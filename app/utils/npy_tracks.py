@@ -0,0 +1,65 @@
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+NPY_TRACK_DIR_SUFFIX = ".npy.d"
+SCAN_TIMESTAMPS_NAME = "ScanTimestamps"
+ROW_BOUNDS_NAME = "RowBounds"
+# ^ per row: latitude min, latitude max, longitude min, longitude max
+
+
+class NpyTrack(Mapping):
+    """
+    Read-only track transcoded to '.npy' files (see 'transcode_h5_to_npy'):
+    {dataset name: memory-mapped array}, used in place of an h5py.File
+    """
+
+    def __init__(self, npy_dir: Path):
+        self.npy_dir = npy_dir
+        self.arrays = {
+            npy_fpath.stem: np.load(npy_fpath, mmap_mode="r")
+            for npy_fpath in npy_dir.glob("*.npy")
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __iter__(self):
+        return iter(self.arrays)
+
+    def __len__(self) -> int:
+        return len(self.arrays)
+
+    def close(self) -> None:
+        self.arrays = {}
+
+    def __enter__(self) -> "NpyTrack":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def is_npy_track(fpath_or_url: Path | str) -> bool:
+    return isinstance(fpath_or_url, Path) and fpath_or_url.name.endswith(
+        NPY_TRACK_DIR_SUFFIX
+    )
+
+
+def compute_row_bounds(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    return np.stack(
+        [
+            latitude.min(axis=1),
+            latitude.max(axis=1),
+            longitude.min(axis=1),
+            longitude.max(axis=1),
+        ],
+        axis=1,
+    )
+
+
+def save_npy_track(npy_dir: Path, arrays: dict[str, np.ndarray]) -> None:
+    npy_dir.mkdir(parents=True)
+    for name, values in arrays.items():
+        np.save(npy_dir / f"{name}.npy", values)
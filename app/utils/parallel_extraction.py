@@ -0,0 +1,188 @@
+import asyncio
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import AsyncIterator
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from omegaconf import DictConfig
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.api.schemas.h5_extracted_ndarrays import H5ExtractedNdarrays
+from app.core.metrics import DOWNLOADED_BYTES, RANGE_REQUESTS
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import get_h5_fname
+
+ARRAYS_ALIGNMENT = 64
+# ^ bytes, each array in the shared memory block starts at a multiple of it
+EXTRACTION_COUNTERS = (DOWNLOADED_BYTES, RANGE_REQUESTS)
+# ^ incremented by the extraction (remote reads); the worker processes don't
+#   write metrics snapshots, their counts are sent back with the segments
+
+
+class SharedMemoryArray(np.ndarray):
+    """
+    An array in a shared memory block, which is kept open as long as the array
+    or any view of it is alive (as 'np.memmap' does with its file mapping)
+    """
+
+    def __array_finalize__(self, obj) -> None:
+        self.shm = getattr(obj, "shm", None)
+
+
+def extract_segment_to_shared_memory(
+    h5_fpath: Path | str,
+    selection: DatesCoordsSelection,
+    config: DictConfig,
+    swath_edges_coords: tuple[np.ndarray, np.ndarray] | None,
+) -> tuple[list, tuple[str, list] | None]:
+    """
+    Runs in a worker process: the extracted arrays are copied to a new shared
+    memory block, only its name and the layout of the arrays
+    [(field, dtype, shape, offset), ...] are sent back (None if no points),
+    with the counts of 'EXTRACTION_COUNTERS' since the previous extraction
+    """
+    h5_data = extract_segment_from_h5_file(
+        h5_fpath, selection, config, swath_edges_coords
+    )
+    counter_snapshots = [counter.drain() for counter in EXTRACTION_COUNTERS]
+    if h5_data.latitude is None:
+        return counter_snapshots, None
+
+    layout = []
+    num_bytes = 0
+    for field, array in zip(h5_data._fields, h5_data):
+        layout.append((field, array.dtype.str, array.shape, num_bytes))
+        num_bytes += -(-array.nbytes // ARRAYS_ALIGNMENT) * ARRAYS_ALIGNMENT
+    shm = SharedMemory(create=True, size=max(num_bytes, 1))
+    try:
+        for (_, dtype, shape, offset), array in zip(layout, h5_data):
+            np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = array
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    # ^ unlinked by the server process once it has mapped the block
+    return counter_snapshots, (shm.name, layout)
+
+
+def read_segment_from_shared_memory(
+    extraction_result: tuple[list, tuple[str, list] | None],
+) -> H5ExtractedNdarrays:
+    """
+    Map the shared memory block, the arrays are used in place (not copied);
+    its name is removed right away, the memory is freed with the last array
+    """
+    counter_snapshots, shm_name_and_layout = extraction_result
+    for counter, snapshot in zip(EXTRACTION_COUNTERS, counter_snapshots):
+        counter.add(snapshot)
+    if shm_name_and_layout is None:
+        return H5ExtractedNdarrays()
+
+    shm_name, layout = shm_name_and_layout
+    shm = SharedMemory(name=shm_name)
+    shm.unlink()
+    arrays = {}
+    for field, dtype, shape, offset in layout:
+        arrays[field] = SharedMemoryArray(shape, dtype, buffer=shm.buf, offset=offset)
+        arrays[field].shm = shm
+    return H5ExtractedNdarrays(**arrays)
+
+
+def free_abandoned_segment(future: Future) -> None:
+    """Done callback of the extractions whose results nobody waits for anymore"""
+    if future.cancelled() or (future.exception() is not None):
+        return
+    read_segment_from_shared_memory(future.result())
+
+
+async def read_next_segment(futures: deque[Future]) -> H5ExtractedNdarrays:
+    """The first future leaves the queue only once its block is mapped"""
+    extraction_result = await asyncio.wrap_future(futures[0])
+    futures.popleft()
+    return read_segment_from_shared_memory(extraction_result)
+
+
+def warm_up_worker() -> None:
+    """Nothing: unpickling it imports the extraction modules in the worker"""
+
+
+class ExtractionPool:
+    """
+    Extracts the segments of the tracks in worker processes (each track on a
+    single core), the arrays are returned through shared memory instead of
+    being pickled. The workers are spawned (not forked: the server process
+    runs threads) and warmed up in the background, at most one per CPU.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = min(max_workers, os.cpu_count() or 1)
+        self.max_in_flight = 2 * self.max_workers
+        # ^ submitted extractions, running or with the results not consumed yet
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        for _ in range(self.max_workers):
+            self.executor.submit(warm_up_worker)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def extract_in_order(
+        self,
+        h5_fpaths: list[Path | str],
+        selection: DatesCoordsSelection,
+        config: DictConfig,
+        fname_to_downsampled_points,
+    ) -> AsyncIterator[H5ExtractedNdarrays]:
+        """
+        Yields the segments in the order of 'h5_fpaths'. At most
+        'max_in_flight' tracks are submitted ahead, so the memory held by the
+        results doesn't grow with the selection; the extractions not started
+        yet are cancelled when the generator is closed.
+        """
+        futures = deque()
+        try:
+            for h5_fpath in h5_fpaths:
+                futures.append(
+                    self.executor.submit(
+                        extract_segment_to_shared_memory,
+                        h5_fpath,
+                        selection,
+                        config,
+                        fname_to_downsampled_points[get_h5_fname(h5_fpath, config)],
+                    )
+                )
+                if len(futures) >= self.max_in_flight:
+                    yield await read_next_segment(futures)
+            while futures:
+                yield await read_next_segment(futures)
+        finally:
+            for future in futures:
+                if not future.cancel():
+                    future.add_done_callback(free_abandoned_segment)
+                    # ^ a running extraction can't be cancelled, its block is
+                    #   freed once it is done
+
+
+async def extract_in_order_in_threadpool(
+    h5_fpaths: list[Path | str],
+    selection: DatesCoordsSelection,
+    config: DictConfig,
+    fname_to_downsampled_points,
+) -> AsyncIterator[H5ExtractedNdarrays]:
+    """Same as 'ExtractionPool.extract_in_order', one track at a time in a thread"""
+    for h5_fpath in h5_fpaths:
+        yield await run_in_threadpool(
+            extract_segment_from_h5_file,
+            h5_fpath,
+            selection,
+            config,
+            fname_to_downsampled_points[get_h5_fname(h5_fpath, config)],
+        )
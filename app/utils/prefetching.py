@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from omegaconf import DictConfig
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.admission import AdmissionController
+from app.core.cache_index import SharedCacheIndex
+from app.core.metrics import PREFETCHED_FILES
+from app.utils.track_file_names import (
+    download_h5_file,
+    get_cached_fpath,
+    select_h5_urls_by_coords,
+    select_h5_urls_overlapping_dates,
+)
+
+
+def get_next_period_selection(selection: DatesCoordsSelection) -> DatesCoordsSelection:
+    """Same ROI and duration, starting the day after 'date_end'"""
+    duration = selection.date_end - selection.date_start
+    date_start = selection.date_end + timedelta(days=1)
+    return selection.model_copy(
+        update={"date_start": date_start, "date_end": date_start + duration}
+    )
+
+
+class Prefetcher:
+    """
+    Users mostly step forward in time, so after serving a selection the tracks
+    of the next period that intersect the same ROI are downloaded in a
+    background thread. At most 'max_files_per_query' files are prefetched
+    per selection and the downloads are paced to 'max_bytes_per_second'.
+    The queries come first: a selection is given up when the cache is filled
+    up to 'max_cache_fill' or when the admission budget of the queries has
+    no room for one more track.
+    """
+
+    def __init__(
+        self,
+        config: DictConfig,
+        start_timestamps_to_h5_urls: dict,
+        fname_to_downsampled_points,
+        cached_h5_fpaths: SharedCacheIndex,
+        admission_controller: AdmissionController | None,
+    ):
+        self.config = config
+        self.start_timestamps_to_h5_urls = start_timestamps_to_h5_urls
+        self.fname_to_downsampled_points = fname_to_downsampled_points
+        self.cached_h5_fpaths = cached_h5_fpaths
+        self.admission_controller = admission_controller
+        self.max_cached_files = int(
+            config.prefetching.max_cache_fill * config.hdf_caching.max_num_cached_files
+        )
+        self.selections = queue.Queue(maxsize=config.prefetching.max_queued_selections)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="prefetcher", daemon=True)
+        self.thread.start()
+
+    def schedule(self, selection: DatesCoordsSelection) -> None:
+        """Called after serving 'selection', never blocks"""
+        try:
+            self.selections.put_nowait(get_next_period_selection(selection))
+        except queue.Full:
+            pass
+
+    def stop(self) -> None:
+        self.stopped.set()
+        try:
+            self.selections.put_nowait(None)
+        except queue.Full:
+            pass
+        self.thread.join()
+
+    def select_missing_h5_urls(self, selection: DatesCoordsSelection) -> list[str]:
+        h5_urls = select_h5_urls_overlapping_dates(
+            selection, self.start_timestamps_to_h5_urls, self.config
+        )
+        h5_urls = select_h5_urls_by_coords(
+            h5_urls, selection, self.fname_to_downsampled_points
+        )
+        return [
+            h5_url
+            for h5_url in h5_urls
+            if not get_cached_fpath(h5_url, self.config).exists()
+        ]
+
+    def has_room(self) -> bool:
+        """Room in the cache and in the admission budget for one more track"""
+        if len(self.cached_h5_fpaths) >= self.max_cached_files:
+            return False
+        return (self.admission_controller is None) or (
+            self.admission_controller.has_spare_budget(
+                self.config.query_cost.bytes_per_track
+            )
+        )
+
+    def prefetch(self, selection: DatesCoordsSelection) -> None:
+        h5_urls = self.select_missing_h5_urls(selection)
+        for h5_url in h5_urls[: self.config.prefetching.max_files_per_query]:
+            if self.stopped.is_set() or not self.has_room():
+                return
+            if get_cached_fpath(h5_url, self.config).exists():
+                continue
+                # ^ downloaded by a query (or another worker) in the meantime
+            time_start = time.monotonic()
+            num_bytes = download_h5_file(h5_url, self.config, self.cached_h5_fpaths)
+            PREFETCHED_FILES.inc(1)
+            self.stopped.wait(
+                max(
+                    num_bytes / self.config.prefetching.max_bytes_per_second
+                    - (time.monotonic() - time_start),
+                    0.0,
+                )
+            )
+
+    def run(self) -> None:
+        while (selection := self.selections.get()) is not None:
+            try:
+                self.prefetch(selection)
+            except Exception as exc:
+                print(f"Prefetching failed: {exc!r}")
+                # ^ best effort, the queries download the missing files anyway
@@ -0,0 +1,172 @@
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.api.schemas.query_cost import QueryCost
+from app.api.schemas.time_series import TimeSeriesSelection
+from app.core.cache_index import SharedCacheIndex
+from app.utils.geometry import find_swath_fragments_intersecting_roi
+from app.utils.time_series import find_edge_points_near_site
+from app.utils.track_file_names import (
+    extract_end_timestamp_from_h5_url,
+    extract_start_timestamp_from_h5_url,
+    get_cached_fpath,
+    get_h5_fname,
+)
+
+
+def estimate_fraction_of_track_in_roi(
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    selection: DatesCoordsSelection,
+) -> float:
+    """Fraction of the swath fragments (between the downsampled points) in the ROI"""
+    num_fragments = len(swath_edges_coords[0]) - 1
+    if num_fragments < 1:
+        return 1.0
+    fragment_idxs = find_swath_fragments_intersecting_roi(swath_edges_coords, selection)
+    return fragment_idxs.size / num_fragments
+
+
+def estimate_fraction_of_track_near_site(
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    selection: TimeSeriesSelection,
+) -> float:
+    """Fraction of the swath fragments read for the site (see 'get_rows_near_site')"""
+    num_fragments = len(swath_edges_coords[0]) - 1
+    if num_fragments < 1:
+        return 1.0
+    idxs_near = find_edge_points_near_site(
+        swath_edges_coords,
+        selection.latitude,
+        selection.longitude,
+        selection.radius_km,
+    )
+    if idxs_near.size == 0:
+        return 0.0
+    fragment_idx_first = max(idxs_near[0] - 1, 0)
+    fragment_idx_last = min(idxs_near[-1], num_fragments - 1)
+    return (fragment_idx_last - fragment_idx_first + 1) / num_fragments
+
+
+def estimate_fraction_of_track_in_time_interval(
+    h5_url: str,
+    interval_start: np.datetime64,
+    interval_end: np.datetime64,
+    config: DictConfig,
+) -> float:
+    """Fraction of the track's time span (from the file name) in the interval"""
+    track_start = np.datetime64(extract_start_timestamp_from_h5_url(h5_url, config))
+    track_end = np.datetime64(
+        extract_end_timestamp_from_h5_url(h5_url, config)
+    ) + np.timedelta64(1, "m")
+    # ^ the file names have the minute precision
+    overlap = min(track_end, interval_end) - max(track_start, interval_start)
+    return float(np.clip(overlap / (track_end - track_start), 0.0, 1.0))
+
+
+def estimate_tracks_cost(
+    h5_urls: list[str],
+    fractions_read: list[float],
+    config: DictConfig,
+    cached_h5_fpaths: SharedCacheIndex,
+) -> QueryCost:
+    """
+    'h5_urls' are the tracks selected by footprint (the ones that are read),
+    'fractions_read' are the estimated fractions of the tracks that are read
+    (e.g. the rows near the ROI); the track sizes aren't in the catalog, so
+    the typical sizes from the config are used, and so are the typical rates
+    for the processing time
+    """
+    cached_fnames = cached_h5_fpaths.select_cached(
+        [get_cached_fpath(h5_url, config).name for h5_url in h5_urls]
+    )
+    num_tracks_cached = 0
+    bytes_to_download = 0.0
+    estimated_points = 0.0
+    for h5_url, fraction_read in zip(h5_urls, fractions_read):
+        estimated_points += fraction_read * config.query_cost.points_per_track
+        if config.remote_reading.enabled:
+            bytes_to_download += min(
+                fraction_read * config.query_cost.bytes_per_track
+                + config.query_cost.remote_bytes_per_track,
+                config.query_cost.bytes_per_track,
+            )
+            # ^ all the endpoints read the tracks remotely in this mode: only
+            #   the rows read are fetched, plus the metadata and the blocks
+            #   read ahead
+        elif get_cached_fpath(h5_url, config).name in cached_fnames:
+            num_tracks_cached += 1
+        else:
+            bytes_to_download += config.query_cost.bytes_per_track
+
+    estimated_seconds = (
+        bytes_to_download / config.query_cost.download_bytes_per_second
+        + len(h5_urls) * config.query_cost.seconds_per_track
+        + estimated_points / config.query_cost.points_per_second
+    )
+
+    return QueryCost(
+        num_tracks_by_footprint=len(h5_urls),
+        num_tracks_cached=num_tracks_cached,
+        bytes_to_download=int(bytes_to_download),
+        estimated_points=int(estimated_points),
+        estimated_seconds=estimated_seconds,
+    )
+
+
+def estimate_query_cost(
+    h5_urls: list[str],
+    selection: DatesCoordsSelection,
+    config: DictConfig,
+    fname_to_downsampled_points,
+    cached_h5_fpaths: SharedCacheIndex,
+) -> QueryCost:
+    """'h5_urls' are the tracks selected by date and by footprint"""
+    fractions_read = [
+        estimate_fraction_of_track_in_roi(
+            fname_to_downsampled_points[get_h5_fname(h5_url, config)], selection
+        )
+        for h5_url in h5_urls
+    ]
+    return estimate_tracks_cost(h5_urls, fractions_read, config, cached_h5_fpaths)
+
+
+def estimate_time_series_cost(
+    h5_urls: list[str],
+    selection: TimeSeriesSelection,
+    config: DictConfig,
+    fname_to_downsampled_points,
+    cached_h5_fpaths: SharedCacheIndex,
+) -> QueryCost:
+    """'h5_urls' are the tracks whose swath may reach the site"""
+    fractions_read = [
+        estimate_fraction_of_track_near_site(
+            fname_to_downsampled_points[get_h5_fname(h5_url, config)], selection
+        )
+        for h5_url in h5_urls
+    ]
+    return estimate_tracks_cost(h5_urls, fractions_read, config, cached_h5_fpaths)
+
+
+def estimate_collocation_cost(
+    h5_url_to_point_idxs: dict[str, np.ndarray],
+    timestamps: np.ndarray,
+    time_window: np.timedelta64,
+    config: DictConfig,
+    cached_h5_fpaths: SharedCacheIndex,
+) -> QueryCost:
+    """
+    The rows within the time window of the track's points are read
+    (see 'collocate_points_with_h5_file')
+    """
+    h5_urls = list(h5_url_to_point_idxs)
+    fractions_read = [
+        estimate_fraction_of_track_in_time_interval(
+            h5_url,
+            timestamps[point_idxs].min() - time_window,
+            timestamps[point_idxs].max() + time_window,
+            config,
+        )
+        for h5_url, point_idxs in h5_url_to_point_idxs.items()
+    ]
+    return estimate_tracks_cost(h5_urls, fractions_read, config, cached_h5_fpaths)
@@ -0,0 +1,86 @@
+import numpy as np
+
+RASTER_EMPTY_VALUE = 0
+# ^ the quantized value of the pixels that contain no points
+
+
+def aggregate_points_mean(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    bbox: tuple[float, float, float, float],
+    width: int,
+    height: int,
+) -> np.ndarray:
+    """
+    Aggregate the points into a (height, width) grid covering the bbox
+    (datashader-style); each pixel holds the mean of the observable
+    over the points inside it (NaN if there are no such points).
+    """
+    lon_min, lon_max, lat_min, lat_max = bbox
+    lon_span = max(lon_max - lon_min, np.finfo(np.float64).eps)
+    lat_span = max(lat_max - lat_min, np.finfo(np.float64).eps)
+
+    cols = np.floor((longitude - lon_min) / lon_span * width).astype(np.int64)
+    rows = np.floor((latitude - lat_min) / lat_span * height).astype(np.int64)
+    # the points lying exactly on the max bounds go to the last pixel:
+    cols[cols == width] = width - 1
+    rows[rows == height] = height - 1
+    inside_mask = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+
+    flat_idxs = rows[inside_mask] * width + cols[inside_mask]
+    sums = np.bincount(
+        flat_idxs, weights=observable[inside_mask], minlength=width * height
+    )
+    counts = np.bincount(flat_idxs, minlength=width * height)
+
+    means = np.full(width * height, np.nan)
+    np.divide(sums, counts, out=means, where=(counts > 0))
+    return means.reshape(height, width)
+
+
+def quantize_to_uint8(
+    values: np.ndarray,
+    low: float,
+    high: float,
+) -> np.ndarray:
+    """
+    Map the values from [low, high] to [1, 255] and NaNs to RASTER_EMPTY_VALUE;
+    with a 256-color palette this keeps the colors of the original values.
+    """
+    span = max(high - low, np.finfo(np.float64).eps)
+    scaled = np.clip((values - low) / span, 0.0, 1.0)
+    quantized = 1 + np.rint(scaled * 254)
+    quantized[np.isnan(values)] = RASTER_EMPTY_VALUE
+    return quantized.astype(np.uint8)
+
+
+def build_raster_pyramid(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    bbox: tuple[float, float, float, float],
+    base_width: int,
+    base_height: int,
+    num_levels: int,
+    low: float,
+    high: float,
+) -> list[np.ndarray]:
+    """
+    Aggregate the points at the base resolution and at the resolutions
+    2, 4, ... times finer (each level covers the whole bbox).
+    """
+    levels = []
+    for level in range(num_levels):
+        scale = 2**level
+        means = aggregate_points_mean(
+            latitude,
+            longitude,
+            observable,
+            bbox,
+            base_width * scale,
+            base_height * scale,
+        )
+        levels.append(quantize_to_uint8(means, low, high))
+
+    return levels
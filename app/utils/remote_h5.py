@@ -0,0 +1,246 @@
+import io
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import h5py
+import requests
+from omegaconf import DictConfig
+
+from app.core.metrics import DOWNLOADED_BYTES, RANGE_REQUESTS
+from app.utils.npy_tracks import NpyTrack, is_npy_track
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class BlockCache:
+    """
+    LRU cache {(url, block idx): bytes} shared by all remote files
+    of the process, bounded by the total size of the blocks
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple[str, int]) -> bytes | None:
+        with self.lock:
+            block = self.blocks.get(key)
+            if block is not None:
+                self.blocks.move_to_end(key)
+            return block
+
+    def put(self, key: tuple[str, int], block: bytes) -> None:
+        with self.lock:
+            if key in self.blocks:
+                return
+            self.blocks[key] = block
+            self.nbytes += len(block)
+            while self.nbytes > self.max_bytes:
+                _, old_block = self.blocks.popitem(last=False)
+                self.nbytes -= len(old_block)
+
+
+@lru_cache(maxsize=1)
+def get_block_cache(max_bytes: int) -> BlockCache:
+    return BlockCache(max_bytes)
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    return requests.Session()
+
+
+@lru_cache(maxsize=1)
+def get_storage_client():
+    from google.cloud import storage
+
+    # ^ imported on first use: slow to import
+    return storage.Client()
+
+
+def get_gcs_blob(url: str):
+    """The blob of a gs:// URL with its metadata (the size)"""
+    bucket_name, blob_name = url.replace("gs://", "").split("/", 1)
+    blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+    if blob is None:
+        raise FileNotFoundError(url)
+    return blob
+
+
+def fetch_byte_range(
+    url: str,
+    start: int,
+    end: int,
+    timeout_seconds: float,
+    gcs_blob=None,
+) -> tuple[bytes, int, int]:
+    """
+    Bytes [start, end) of the remote file -> (data, offset of data, file size);
+    a server ignoring the 'Range' header returns the whole file (offset 0).
+    For gs:// URLs, 'gcs_blob' saves the metadata request (see 'get_gcs_blob').
+    """
+    RANGE_REQUESTS.inc(1)
+    if url.startswith("gs://"):
+        if gcs_blob is None:
+            gcs_blob = get_gcs_blob(url)
+        data = gcs_blob.download_as_bytes(
+            start=start, end=min(end, gcs_blob.size) - 1, timeout=timeout_seconds
+        )
+        # ^ 'end' is inclusive here
+        DOWNLOADED_BYTES.inc(len(data))
+        return data, start, gcs_blob.size
+
+    response = get_http_session().get(
+        url, headers={"Range": f"bytes={start}-{end - 1}"}, timeout=timeout_seconds
+    )
+    if response.status_code == 404:
+        raise FileNotFoundError(url)
+    response.raise_for_status()
+    DOWNLOADED_BYTES.inc(len(response.content))
+    if response.status_code == 206:
+        match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+        if match is not None:
+            return response.content, int(match.group(1)), int(match.group(3))
+    return response.content, 0, len(response.content)
+
+
+class RemoteRangeFile(io.RawIOBase):
+    """
+    Read-only file object over HTTP(S) or GCS byte-range requests, for h5py.
+
+    The file is read in blocks through the shared block cache. The track
+    datasets are chunked along the track, so consecutive rows are mostly
+    in consecutive chunks: while the reads stay sequential, the number of
+    blocks fetched ahead doubles (up to 'max_read_ahead_blocks'), a random
+    read resets it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        block_size: int,
+        max_read_ahead_blocks: int,
+        block_cache: BlockCache,
+        timeout_seconds: float,
+    ):
+        self.url = url
+        self.block_size = block_size
+        self.max_read_ahead_blocks = max_read_ahead_blocks
+        self.block_cache = block_cache
+        self.timeout_seconds = timeout_seconds
+        self.gcs_blob = get_gcs_blob(url) if url.startswith("gs://") else None
+        # ^ fetched once, not before each range request
+        self.position = 0
+        self.read_ahead_blocks = 1
+        self.last_block_idx = -1
+        self.size = None
+        self.fetch_blocks(0, 1)
+        # ^ the superblock and the root group are at the beginning of the file
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def fetch_blocks(self, block_idx_first: int, block_idx_last: int) -> dict:
+        """Fetch the blocks [first, last) with a single request -> {idx: block}"""
+        data, offset, self.size = fetch_byte_range(
+            self.url,
+            block_idx_first * self.block_size,
+            block_idx_last * self.block_size,
+            self.timeout_seconds,
+            self.gcs_blob,
+        )
+        blocks = {}
+        for idx in range(-(-len(data) // self.block_size)):
+            block = data[idx * self.block_size : (idx + 1) * self.block_size]
+            if (len(block) == self.block_size) or (
+                offset + idx * self.block_size + len(block) == self.size
+            ):
+                # ^ only the last block of the file may be shorter
+                blocks[offset // self.block_size + idx] = block
+                self.block_cache.put((self.url, offset // self.block_size + idx), block)
+        return blocks
+
+    def get_block(self, block_idx: int) -> bytes:
+        block = self.block_cache.get((self.url, block_idx))
+        if block is None:
+            if block_idx == self.last_block_idx + 1:
+                self.read_ahead_blocks = min(
+                    2 * self.read_ahead_blocks, self.max_read_ahead_blocks
+                )
+            else:
+                self.read_ahead_blocks = 1
+            num_blocks = -(-self.size // self.block_size)
+            block_idx_last = block_idx + 1
+            while (
+                block_idx_last < min(block_idx + self.read_ahead_blocks, num_blocks)
+                and self.block_cache.get((self.url, block_idx_last)) is None
+            ):
+                block_idx_last += 1
+            block = self.fetch_blocks(block_idx, block_idx_last).get(block_idx, b"")
+            # ^ empty beyond the end of the file
+        self.last_block_idx = block_idx
+        return block
+
+    def readinto(self, buffer) -> int:
+        buffer = memoryview(buffer).cast("B")
+        num_bytes = min(len(buffer), max(self.size - self.position, 0))
+        num_read = 0
+        while num_read < num_bytes:
+            block_idx, offset_in_block = divmod(
+                self.position + num_read, self.block_size
+            )
+            block = self.get_block(block_idx)[offset_in_block:]
+            if len(block) == 0:
+                break
+            num_copied = min(len(block), num_bytes - num_read)
+            buffer[num_read : num_read + num_copied] = block[:num_copied]
+            num_read += num_copied
+        self.position += num_read
+        return num_read
+
+
+def open_h5_file(
+    h5_fpath_or_url: Path | str,
+    config: DictConfig,
+    chunk_cache_bytes: int | None = None,
+) -> h5py.File | NpyTrack:
+    """
+    Local files are opened as usual, transcoded tracks are memory-mapped,
+    URLs are read through byte-range requests; 'chunk_cache_bytes' is the size
+    of the HDF5 chunk cache of each dataset (None: the h5py default)
+    """
+    if is_npy_track(h5_fpath_or_url):
+        return NpyTrack(h5_fpath_or_url)
+    if isinstance(h5_fpath_or_url, Path):
+        return h5py.File(h5_fpath_or_url, "r", rdcc_nbytes=chunk_cache_bytes)
+
+    remote_file = RemoteRangeFile(
+        h5_fpath_or_url,
+        block_size=config.remote_reading.block_size,
+        max_read_ahead_blocks=config.remote_reading.max_read_ahead_blocks,
+        block_cache=get_block_cache(config.remote_reading.block_cache_max_bytes),
+        timeout_seconds=config.remote_reading.timeout_seconds,
+    )
+    return h5py.File(remote_file, "r", rdcc_nbytes=chunk_cache_bytes)
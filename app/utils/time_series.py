@@ -0,0 +1,225 @@
+from collections import deque
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import h5py
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.time_series import TimeSeriesSelection
+from app.utils.collocation import (
+    SWATH_MARGIN_FACTOR,
+    haversine_distances_km,
+    select_candidate_points_by_footprints,
+)
+from app.utils.npy_tracks import NpyTrack
+from app.utils.remote_h5 import open_h5_file
+from app.utils.track_file_contents import (
+    get_rows_of_swath_fragments,
+    get_scan_timestamps,
+)
+from app.utils.track_file_names import (
+    extract_start_timestamp_from_h5_url,
+    extract_track_number_from_h5_url_or_fpath,
+    get_h5_fname,
+    get_selection_time_interval,
+)
+
+
+def select_h5_urls_near_site(
+    h5_urls: list[str],
+    selection: TimeSeriesSelection,
+    fname_to_downsampled_points,
+    config: DictConfig,
+) -> list[str]:
+    """The tracks whose swath may reach the site, ordered by time"""
+    site_latitude = np.array([selection.latitude])
+    site_longitude = np.array([selection.longitude])
+    return sorted(
+        (
+            h5_url
+            for h5_url in h5_urls
+            if select_candidate_points_by_footprints(
+                fname_to_downsampled_points[get_h5_fname(h5_url, config)],
+                site_latitude,
+                site_longitude,
+                selection.radius_km,
+            )[0]
+        ),
+        key=lambda h5_url: extract_start_timestamp_from_h5_url(h5_url, config),
+    )
+
+
+def find_edge_points_near_site(
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+) -> np.ndarray:
+    """Idxs of the downsampled swath edge points that may be near the site"""
+    edges_latitude, edges_longitude = swath_edges_coords
+    swath_width_km = np.median(
+        haversine_distances_km(
+            edges_latitude[:, 0],
+            edges_longitude[:, 0],
+            edges_latitude[:, 1],
+            edges_longitude[:, 1],
+        )
+    )
+    distances_km = haversine_distances_km(
+        edges_latitude, edges_longitude, latitude, longitude
+    )
+    return np.flatnonzero(
+        (distances_km <= SWATH_MARGIN_FACTOR * swath_width_km + radius_km).any(axis=1)
+    )
+
+
+def get_rows_near_site(
+    num_scans: int,
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+) -> slice:
+    """
+    Conservative range of the rows that may reach the site, from the
+    downsampled swath edges (without reading the file)
+    """
+    num_edge_points = len(swath_edges_coords[0])
+    if num_edge_points < 2:
+        return slice(0, num_scans)
+
+    idxs_near = find_edge_points_near_site(
+        swath_edges_coords, latitude, longitude, radius_km
+    )
+    if idxs_near.size == 0:
+        return slice(0, 0)
+    return get_rows_of_swath_fragments(
+        num_scans,
+        num_edge_points,
+        max(idxs_near[0] - 1, 0),
+        min(idxs_near[-1], num_edge_points - 2),
+    )
+    # ^ the fragments on both sides of the edge points near the site
+
+
+def find_rows_near_site(
+    h5: h5py.File | NpyTrack,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    rows: slice | None = None,
+) -> slice | None:
+    """
+    Rows (scans) whose cross-track extent may reach the site, among 'rows'
+    (all by default); only the left, the central and the right footprints
+    of each of these scans are read.
+    """
+    num_scans, num_points_across = h5["Latitude"].shape
+    if rows is None:
+        rows = slice(0, num_scans)
+    if rows.stop <= rows.start:
+        return None
+    columns = [0, num_points_across // 2, num_points_across - 1]
+    edges_latitude = h5["Latitude"][rows, columns]
+    edges_longitude = h5["Longitude"][rows, columns]
+
+    scan_half_width_km = (
+        haversine_distances_km(
+            edges_latitude[:, 0],
+            edges_longitude[:, 0],
+            edges_latitude[:, 2],
+            edges_longitude[:, 2],
+        )
+        / 2
+    )
+    distances_to_center_km = haversine_distances_km(
+        edges_latitude[:, 1], edges_longitude[:, 1], latitude, longitude
+    )
+    idxs_near = np.flatnonzero(distances_to_center_km <= scan_half_width_km + radius_km)
+    if idxs_near.size == 0:
+        return None
+    return slice(rows.start + idxs_near[0], rows.start + idxs_near[-1] + 1)
+
+
+def extract_site_overpass(
+    h5_fpath: Path,
+    selection: TimeSeriesSelection,
+    config: DictConfig,
+    swath_edges_coords: tuple[np.ndarray, np.ndarray] | None = None,
+) -> dict | None:
+    """
+    A record (time, distance, observable) or None if the track misses the
+    site; with the downsampled swath edges of the track, only the rows near
+    the site are read.
+    """
+    with open_h5_file(h5_fpath, config) as h5:
+        rows = None
+        if swath_edges_coords is not None:
+            rows = get_rows_near_site(
+                h5["Latitude"].shape[0],
+                swath_edges_coords,
+                selection.latitude,
+                selection.longitude,
+                selection.radius_km,
+            )
+        rows_near_site = find_rows_near_site(
+            h5, selection.latitude, selection.longitude, selection.radius_km, rows
+        )
+        if rows_near_site is None:
+            return None
+        scan_timestamps = get_scan_timestamps(h5, h5_fpath, config)[rows_near_site]
+        latitude = h5["Latitude"][rows_near_site]
+        longitude = h5["Longitude"][rows_near_site]
+        observable = h5[config.hdf_observable.value_name][rows_near_site]
+
+    distances_km = haversine_distances_km(
+        latitude, longitude, selection.latitude, selection.longitude
+    )
+    interval_start, interval_end = get_selection_time_interval(selection)
+    footprints_mask = (
+        (distances_km <= selection.radius_km)
+        & (observable < config.hdf_observable.value_invalid)
+        & (observable < config.hdf_observable.upper_threshold)
+        & (np.datetime64(interval_start, "ms") <= scan_timestamps[:, np.newaxis])
+        & (scan_timestamps[:, np.newaxis] < np.datetime64(interval_end, "ms"))
+    )
+    if not footprints_mask.any():
+        return None
+
+    idxs_rows, idxs_columns = np.nonzero(footprints_mask)
+    idx_nearest = np.argmin(distances_km[idxs_rows, idxs_columns])
+    row_nearest = idxs_rows[idx_nearest]
+    column_nearest = idxs_columns[idx_nearest]
+    if selection.aggregation == "mean":
+        value = observable[footprints_mask].mean()
+    else:
+        value = observable[row_nearest, column_nearest]
+
+    return {
+        "timestamp": str(scan_timestamps[row_nearest]),
+        "distance_km": float(distances_km[row_nearest, column_nearest]),
+        "observable": float(value),
+        "num_footprints": int(footprints_mask.sum()),
+        "track_number": extract_track_number_from_h5_url_or_fpath(h5_fpath, config),
+        "track_start_timestamp": extract_start_timestamp_from_h5_url(
+            h5_fpath, config
+        ).isoformat(),
+    }
+
+
+def map_in_order(
+    executor: Executor,
+    fn: Callable,
+    items: Iterable,
+    max_in_flight: int,
+) -> Iterator:
+    """Like 'executor.map', but submits at most 'max_in_flight' items ahead"""
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(fn, item))
+        if len(futures) >= max_in_flight:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
@@ -3,10 +3,35 @@ from pathlib import Path
 import h5py
 import numpy as np
 from omegaconf import DictConfig
-from sklearn.metrics.pairwise import haversine_distances
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
 from app.api.schemas.h5_extracted_ndarrays import H5ExtractedNdarrays
+from app.utils.geometry import (
+    find_swath_fragments_intersecting_roi,
+    mask_points_in_roi,
+)
+from app.utils.growable_array import GrowableArray
+from app.utils.npy_tracks import (
+    ROW_BOUNDS_NAME,
+    SCAN_TIMESTAMPS_NAME,
+    NpyTrack,
+    compute_row_bounds,
+    save_npy_track,
+)
+from app.utils.remote_h5 import open_h5_file
+from app.utils.track_file_names import (
+    extract_end_timestamp_from_h5_url,
+    extract_start_timestamp_from_h5_url,
+    get_selection_time_interval,
+)
+
+SCAN_TIME_DATASET_NAMES_TO_UNITS = {
+    "DayOfMonth": "D",
+    "Hour": "h",
+    "Minute": "m",
+    "Second": "s",
+    "MilliSecond": "ms",
+}
 
 
 def print_hdf5_schema(file, indent=0):
@@ -35,56 +60,245 @@ def print_hdf5_schema(file, indent=0):
         print()
 
 
+def get_scan_timestamps(
+    h5: h5py.File | NpyTrack,
+    h5_fpath: Path | str,
+    config: DictConfig,
+) -> np.ndarray:
+    """The time of each scan (row), datetime64[ms]"""
+    if isinstance(h5, NpyTrack):
+        return h5[SCAN_TIMESTAMPS_NAME]
+
+    num_scans = h5["Latitude"].shape[0]
+    group_name = config.hdf_scan_time.group_name
+
+    if group_name in h5:
+        scan_time = h5[group_name]
+        year_month = (
+            (scan_time["Year"][:].astype(np.int64) - 1970) * 12
+            + scan_time["Month"][:].astype(np.int64)
+            - 1
+        ).astype("datetime64[M]")
+        scan_timestamps = year_month.astype("datetime64[ms]")
+        for dataset_name, unit in SCAN_TIME_DATASET_NAMES_TO_UNITS.items():
+            if dataset_name in scan_time:
+                values = scan_time[dataset_name][:].astype(np.int64)
+                if dataset_name == "DayOfMonth":
+                    values -= 1
+                scan_timestamps += values.astype(f"timedelta64[{unit}]")
+        return scan_timestamps
+
+    start_timestamp = np.datetime64(
+        extract_start_timestamp_from_h5_url(h5_fpath, config), "ms"
+    )
+    end_timestamp = np.datetime64(
+        extract_end_timestamp_from_h5_url(h5_fpath, config), "ms"
+    )
+    offsets_ms = np.linspace(
+        0, (end_timestamp - start_timestamp).astype(np.int64), num_scans
+    )
+    return start_timestamp + offsets_ms.astype("timedelta64[ms]")
+
+
+def get_rows_of_swath_fragments(
+    num_scans: int,
+    num_edge_points: int,
+    fragment_idx_first: int,
+    fragment_idx_last: int,
+) -> slice:
+    """
+    Conservative range of the rows of the swath fragments between the edge
+    points downsampled with an unknown step (see 'downsample_swath_points')
+    """
+    step_min = -(-num_scans // num_edge_points)
+    step_max = -(-num_scans // (num_edge_points - 1)) - 1
+    # ^ all the steps with 'ceil(num_scans / step) == num_edge_points'
+    row_first = fragment_idx_first * step_min
+    if fragment_idx_last == num_edge_points - 2:
+        row_last = num_scans - 1
+        # ^ the rows after the last edge point belong to the last fragment
+    else:
+        row_last = min((fragment_idx_last + 1) * step_max, num_scans - 1)
+    return slice(row_first, row_last + 1)
+
+
+def get_rows_intersecting_roi(
+    num_scans: int,
+    swath_edges_coords: tuple[np.ndarray, np.ndarray],
+    selection: DatesCoordsSelection,
+) -> slice:
+    """Conservative range of the rows that may intersect the ROI (from the swath edges)"""
+    num_edge_points = len(swath_edges_coords[0])
+    fragments_idxs = find_swath_fragments_intersecting_roi(
+        swath_edges_coords, selection
+    )
+    if (num_edge_points < 2) or (fragments_idxs.size == 0):
+        return slice(0, 0)
+
+    return get_rows_of_swath_fragments(
+        num_scans, num_edge_points, fragments_idxs[0], fragments_idxs[-1]
+    )
+
+
+def get_block_rows(dataset, block_rows: int) -> int:
+    """'block_rows' rounded up to the rows of the dataset chunks (if chunked)"""
+    chunks = getattr(dataset, "chunks", None)
+    if not chunks:
+        return block_rows
+    return -(-block_rows // chunks[0]) * chunks[0]
+
+
 def extract_segment_from_h5_file(
-    h5_fpath: Path,
+    h5_fpath: Path | str,
     selection: DatesCoordsSelection,
     config: DictConfig,
+    swath_edges_coords: tuple[np.ndarray, np.ndarray] | None = None,
 ) -> H5ExtractedNdarrays:
-    h5 = h5py.File(h5_fpath, "r")
+    """
+    'h5_fpath' is a cached file or a URL (read through byte-range requests);
+    with the downsampled swath edges of the track, only the rows near the ROI
+    are read, so the bytes read scale with the ROI size.
+    """
+    h5 = open_h5_file(h5_fpath, config, chunk_cache_bytes=0)
+    # ^ the blocks read below are aligned with the chunks, each chunk is
+    #   decompressed once: the chunk cache would only hold memory
     # print_hdf5_schema(h5)
 
-    latitude = h5["Latitude"][:]
-    longitude = h5["Longitude"][:]
-    observable = h5[config.hdf_observable.value_name][:]
-
-    coords_mask_latitude = np.logical_and(
-        selection.latitude_min <= latitude,
-        latitude <= selection.latitude_max,
-    )
-    coords_mask_longitude = np.logical_and(
-        selection.longitude_min <= longitude,
-        longitude <= selection.longitude_max,
+    interval_start, interval_end = get_selection_time_interval(selection)
+    scan_timestamps = get_scan_timestamps(h5, h5_fpath, config)
+    time_mask = np.logical_and(
+        np.datetime64(interval_start, "ms") <= scan_timestamps,
+        scan_timestamps < np.datetime64(interval_end, "ms"),
     )
-    coords_mask = np.logical_and(coords_mask_latitude, coords_mask_longitude)
-    idxs_pairs = np.argwhere(coords_mask)
-    if idxs_pairs.size == 0:
+    idxs_in_interval = np.flatnonzero(time_mask)
+    if idxs_in_interval.size == 0:
         return H5ExtractedNdarrays()
-
-    distinct_lengthwise_idxs = set(idxs_pairs[:, 0])
-    idx_lengthwise_min = min(distinct_lengthwise_idxs)
-    idx_lengthwise_max = max(distinct_lengthwise_idxs)
-
-    filtered_by_coords = H5ExtractedNdarrays(
-        latitude=latitude[idx_lengthwise_min : idx_lengthwise_max + 1],
-        longitude=longitude[idx_lengthwise_min : idx_lengthwise_max + 1],
-        observable=observable[idx_lengthwise_min : idx_lengthwise_max + 1],
+    row_first = idxs_in_interval[0]
+    row_last = idxs_in_interval[-1]
+    # ^ the scans are ordered by time, only these rows are read from the file
+    if isinstance(h5, NpyTrack):
+        row_bounds = h5[ROW_BOUNDS_NAME][row_first : row_last + 1]
+        idxs_near_roi = np.flatnonzero(
+            (row_bounds[:, 0] <= selection.latitude_max)
+            & (selection.latitude_min <= row_bounds[:, 1])
+            & (row_bounds[:, 2] <= selection.longitude_max)
+            & (selection.longitude_min <= row_bounds[:, 3])
+        )
+        if idxs_near_roi.size == 0:
+            return H5ExtractedNdarrays()
+        row_last = row_first + idxs_near_roi[-1]
+        row_first = row_first + idxs_near_roi[0]
+        # ^ the memory-mapped rows are sliced without copying
+    elif swath_edges_coords is not None:
+        rows_near_roi = get_rows_intersecting_roi(
+            len(scan_timestamps), swath_edges_coords, selection
+        )
+        row_first = max(row_first, rows_near_roi.start)
+        row_last = min(row_last, rows_near_roi.stop - 1)
+        if row_last < row_first:
+            return H5ExtractedNdarrays()
+    datasets = H5ExtractedNdarrays(
+        latitude=h5["Latitude"],
+        longitude=h5["Longitude"],
+        observable=h5[config.hdf_observable.value_name],
+    )
+    buffers = H5ExtractedNdarrays(
+        *(
+            GrowableArray(
+                dataset.dtype,
+                capacity=(row_last - row_first + 1) * dataset.shape[1],
+            )
+            for dataset in datasets
+        )
     )
-    thresholded_observable_mask = filtered_by_coords.observable < min(
+    # ^ the upper bound, the pages that aren't filled aren't backed by memory
+    value_max = min(
         config.hdf_observable.value_invalid,
         config.hdf_observable.upper_threshold,
     )
-    valid_filtered = H5ExtractedNdarrays(
-        latitude=filtered_by_coords.latitude[thresholded_observable_mask],
-        longitude=filtered_by_coords.longitude[thresholded_observable_mask],
-        observable=filtered_by_coords.observable[thresholded_observable_mask],
+    block_rows = get_block_rows(datasets.latitude, config.extraction.block_rows)
+    any_rows_in_roi = False
+    num_points_up_to_last_row_in_roi = 0
+
+    for block_start in range(
+        row_first - row_first % block_rows, row_last + 1, block_rows
+    ):
+        # the blocks are aligned with the chunks of the datasets, so that each
+        # chunk is decompressed once; only a block of each array is in memory
+        rows_to_read = slice(
+            max(block_start, row_first), min(block_start + block_rows, row_last + 1)
+        )
+        latitude, longitude, observable = (
+            dataset[rows_to_read] for dataset in datasets
+        )
+
+        roi_mask = mask_points_in_roi(latitude, longitude, selection)
+        rows_in_roi = np.flatnonzero(roi_mask.any(axis=1))
+        if config.extraction.exact_roi_mask:
+            points_mask = roi_mask
+        elif any_rows_in_roi:
+            points_mask = np.ones_like(roi_mask)
+        elif rows_in_roi.size > 0:
+            points_mask = np.zeros_like(roi_mask)
+            points_mask[rows_in_roi[0] :] = True
+            # ^ all points of the scans from the first one in the ROI
+        else:
+            continue
+        any_rows_in_roi |= rows_in_roi.size > 0
+        points_mask &= observable < value_max
+
+        if rows_in_roi.size > 0:
+            num_points_up_to_last_row_in_roi = buffers.latitude.size + int(
+                np.count_nonzero(points_mask[: rows_in_roi[-1] + 1])
+            )
+        num_selected = int(np.count_nonzero(points_mask))
+        for buffer, values in zip(buffers, (latitude, longitude, observable)):
+            buffer.append_selected(values, points_mask, num_selected)
+
+    if not any_rows_in_roi:
+        return H5ExtractedNdarrays()
+    for buffer in buffers:
+        buffer.truncate(num_points_up_to_last_row_in_roi)
+        # ^ without the scans after the last one in the ROI
+    return H5ExtractedNdarrays(*(buffer.to_array() for buffer in buffers))
+
+
+def transcode_h5_to_npy(
+    h5_fpath: Path,
+    h5_url: str,
+    npy_dir: Path,
+    config: DictConfig,
+) -> None:
+    """
+    Keep only the coordinates and the observable (as float32), the time of
+    each scan and the per-row bounds of the coordinates; 'h5_url' gives
+    the original file name
+    """
+    with h5py.File(h5_fpath, "r") as h5:
+        latitude = h5["Latitude"][:].astype(np.float32)
+        longitude = h5["Longitude"][:].astype(np.float32)
+        observable = h5[config.hdf_observable.value_name][:].astype(np.float32)
+        scan_timestamps = get_scan_timestamps(h5, h5_url, config)
+
+    save_npy_track(
+        npy_dir,
+        {
+            "Latitude": latitude,
+            "Longitude": longitude,
+            config.hdf_observable.value_name: observable,
+            SCAN_TIMESTAMPS_NAME: scan_timestamps,
+            ROW_BOUNDS_NAME: compute_row_bounds(latitude, longitude),
+        },
     )
-    return valid_filtered
 
 
 def downsample_swath_points(
     h5_fpath: Path,
     selection: DatesCoordsSelection,
 ) -> H5ExtractedNdarrays:
+    from sklearn.metrics.pairwise import haversine_distances
+
+    # ^ imported here: only the offline index building needs scikit-learn
     h5 = h5py.File(h5_fpath, "r")
     # print_hdf5_schema(h5)
 
@@ -155,13 +369,12 @@ def downsample_swath_points(
         downsampled_longitude <= selection.longitude_max,
     )
     coords_mask = np.logical_and(coords_mask_latitude, coords_mask_longitude)
-    idxs_pairs = np.argwhere(coords_mask)
-    if idxs_pairs.size == 0:
+    rows_in_roi = np.flatnonzero(coords_mask.any(axis=1))
+    if rows_in_roi.size == 0:
         return H5ExtractedNdarrays()
 
-    distinct_lengthwise_idxs = set(idxs_pairs[:, 0])
-    idx_lengthwise_min = min(distinct_lengthwise_idxs)
-    idx_lengthwise_max = max(distinct_lengthwise_idxs)
+    idx_lengthwise_min = rows_in_roi[0]
+    idx_lengthwise_max = rows_in_roi[-1]
 
     downsampled_swath_bounds = H5ExtractedNdarrays(
         latitude=downsampled_latitude[idx_lengthwise_min : idx_lengthwise_max + 1],
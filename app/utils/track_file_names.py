@@ -1,18 +1,27 @@
 import os
-from collections import OrderedDict, defaultdict, deque
-from datetime import date, datetime, timedelta
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, time, timedelta
+from functools import partial
 from pathlib import Path
+from typing import Iterable
 from urllib.parse import urljoin
 
 import numpy as np
 import requests
-from bs4 import BeautifulSoup
-from google.cloud import storage
 from omegaconf import DictConfig
-from tqdm import tqdm
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.cache_index import SharedCacheIndex
+from app.core.cancellation import QueryCancelled, raise_if_cancelled
+from app.core.metrics import CACHE_LOOKUPS, DOWNLOADED_BYTES
 from app.utils.geometry import check_swath_intersects_roi
+from app.utils.npy_tracks import NPY_TRACK_DIR_SUFFIX
+
+HTTP_DOWNLOAD_CHUNK_SIZE = 1 << 20
+GCS_DOWNLOAD_CHUNK_SIZE = 8 << 20
+# ^ the cancellation of a query is checked between the chunks
 
 
 def get_all_links_to_hdf5(
@@ -20,6 +29,10 @@ def get_all_links_to_hdf5(
     use_gcs_bucket: bool,
     hdf_fname_extension: str,
 ) -> list[str]:
+    from bs4 import BeautifulSoup
+    from google.cloud import storage
+
+    # ^ imported on first use: slow to import, needed only on startup
     response = requests.get(webpage_root_url)
     response.raise_for_status()
     soup = BeautifulSoup(response.text, "html.parser")
@@ -75,6 +88,41 @@ def extract_start_timestamp_from_h5_url(
     return start_timestamp
 
 
+def extract_end_timestamp_from_h5_url(
+    h5_url: str | Path,
+    config: DictConfig,
+) -> datetime:
+    if isinstance(h5_url, Path):
+        fname = h5_url.name
+    else:
+        fname = h5_url.split("/")[-1]
+
+    bname = os.path.splitext(fname)[0]
+    parts = bname.split(config.hdf_fnames_parsing.delimiter)
+    end_timestamp_part = parts[config.hdf_fnames_parsing.end_timestamp_part_idx]
+    assert len(end_timestamp_part) == 4
+    # ^ hh, mm
+    start_timestamp = extract_start_timestamp_from_h5_url(h5_url, config)
+    end_timestamp = start_timestamp.replace(
+        hour=int(end_timestamp_part[0:2]),
+        minute=int(end_timestamp_part[2:4]),
+    )
+    if end_timestamp < start_timestamp:
+        end_timestamp += timedelta(days=1)
+        # ^ the track crosses midnight
+
+    return end_timestamp
+
+
+def get_selection_time_interval(
+    selection: DatesCoordsSelection,
+) -> tuple[datetime, datetime]:
+    """[date_start 00:00, date_end + 1 day 00:00)"""
+    interval_start = datetime.combine(selection.date_start, time())
+    interval_end = datetime.combine(selection.date_end + timedelta(days=1), time())
+    return interval_start, interval_end
+
+
 def extract_track_number_from_h5_url_or_fpath(
     h5_url_or_fpath: str | Path,
     config: DictConfig,
@@ -119,18 +167,58 @@ def select_h5_urls_by_date(
     date_end: date,
     start_timestamps_to_h5_urls: dict[str, list[str]],
 ) -> list[str]:
+    """
+    The tracks started from the day before 'date_start' (they may cross
+    midnight) to 'date_end'; 'select_h5_urls_by_time_span' keeps the ones
+    overlapping the dates
+    """
     h5_urls_output = []
     for timestamp, h5_urls in start_timestamps_to_h5_urls.items():
         if (
-            date_start
+            date_start - timedelta(days=1)
             <= datetime.date(datetime.fromisoformat(timestamp))
-            <= date_end + timedelta(days=1)
+            <= date_end
         ):
             h5_urls_output.extend(h5_urls)
 
     return h5_urls_output
 
 
+def select_h5_urls_by_time_span(
+    h5_urls: list[str],
+    selection: DatesCoordsSelection,
+    config: DictConfig,
+) -> list[str]:
+    """Skip the tracks whose time span lies fully outside the requested interval"""
+    interval_start, interval_end = get_selection_time_interval(selection)
+    h5_urls_output = []
+    for h5_url in h5_urls:
+        start_timestamp = extract_start_timestamp_from_h5_url(h5_url, config)
+        end_timestamp = extract_end_timestamp_from_h5_url(h5_url, config)
+        if (start_timestamp < interval_end) and (
+            interval_start < end_timestamp + timedelta(minutes=1)
+        ):
+            # ^ the file names have the minute precision
+            h5_urls_output.append(h5_url)
+
+    return h5_urls_output
+
+
+def select_h5_urls_overlapping_dates(
+    selection: DatesCoordsSelection,
+    start_timestamps_to_h5_urls: dict[str, list[str]],
+    config: DictConfig,
+) -> list[str]:
+    """'select_h5_urls_by_date' then 'select_h5_urls_by_time_span'"""
+    return select_h5_urls_by_time_span(
+        select_h5_urls_by_date(
+            selection.date_start, selection.date_end, start_timestamps_to_h5_urls
+        ),
+        selection,
+        config,
+    )
+
+
 def select_h5_urls_by_coords(
     h5_urls: list[str],
     selection: DatesCoordsSelection,
@@ -156,44 +244,160 @@ def select_h5_urls_by_coords(
     return output_h5_urls
 
 
+def get_cached_fpath(h5_url: str, config: DictConfig) -> Path:
+    """The cached track: the file itself or its '.npy' transcoding (a directory)"""
+    fname = h5_url.split("/")[-1]
+    if config.hdf_caching.format == "npy":
+        fname = os.path.splitext(fname)[0] + NPY_TRACK_DIR_SUFFIX
+    return Path(config.hdf_caching.dir) / fname
+
+
+def get_cached_fname_suffix(config: DictConfig) -> str:
+    if config.hdf_caching.format == "npy":
+        return NPY_TRACK_DIR_SUFFIX
+    return config.hdf_fname_extension
+
+
+def get_h5_fname(h5_url_or_fpath: str | Path, config: DictConfig) -> str:
+    """The original track file name, also for the cached '.npy' transcodings"""
+    fname = str(h5_url_or_fpath).split("/")[-1]
+    if fname.endswith(NPY_TRACK_DIR_SUFFIX):
+        fname = fname[: -len(NPY_TRACK_DIR_SUFFIX)] + config.hdf_fname_extension
+    return fname
+
+
+def remove_cached_file(fpath: Path) -> None:
+    if fpath.is_dir():
+        shutil.rmtree(fpath, ignore_errors=True)
+    else:
+        fpath.unlink(missing_ok=True)
+
+
+def remove_cached_h5_files(
+    h5_urls: list[str], config: DictConfig, cached_h5_fpaths: SharedCacheIndex
+) -> None:
+    """Remove the cached tracks of the URLs (the ones not downloaded are skipped)"""
+    for h5_url in h5_urls:
+        fpath = get_cached_fpath(h5_url, config)
+        remove_cached_file(fpath)
+        cached_h5_fpaths.remove(fpath)
+
+
+def write_chunks(
+    chunks: Iterable[bytes],
+    fpath: Path,
+    cancelled: threading.Event | None,
+) -> int:
+    """-> number of bytes; stops between the chunks if the query is cancelled"""
+    num_bytes = 0
+    with open(fpath, "wb") as fd:
+        for chunk in chunks:
+            raise_if_cancelled(cancelled)
+            fd.write(chunk)
+            num_bytes += len(chunk)
+            DOWNLOADED_BYTES.inc(len(chunk))
+    return num_bytes
+
+
+def download_h5_file(
+    h5_url: str,
+    config: DictConfig,
+    cached_h5_fpaths: SharedCacheIndex,
+    cancelled: threading.Event | None = None,
+) -> int:
+    """
+    Download a track file to the cache -> number of bytes (0 if failed);
+    if the query is cancelled, the partial file is deleted
+    """
+    fname = h5_url.split("/")[-1]
+    fpath = get_cached_fpath(h5_url, config)
+    os.makedirs(config.hdf_caching.dir, exist_ok=True)
+    tmp_suffix = f"{os.getpid()}.{threading.get_ident()}.part"
+    tmp_fpath = fpath.with_name(f".{fname}.{tmp_suffix}")
+    # ^ the file appears under its name only when complete
+    #   (other workers and threads may be checking for it at the same time)
+    num_bytes = 0
+
+    try:
+        if h5_url.startswith("gs://"):
+            from google.cloud import storage
+
+            try:
+                bucket_name, blob_name = h5_url.replace("gs://", "").split("/", 1)
+                storage_client = storage.Client()
+                bucket = storage_client.bucket(bucket_name)
+                blob = bucket.blob(blob_name)
+                with blob.open("rb", chunk_size=GCS_DOWNLOAD_CHUNK_SIZE) as reader:
+                    num_bytes = write_chunks(
+                        iter(partial(reader.read, GCS_DOWNLOAD_CHUNK_SIZE), b""),
+                        tmp_fpath,
+                        cancelled,
+                    )
+            except QueryCancelled:
+                raise
+            except Exception:
+                num_bytes = 0
+        else:
+            with requests.get(h5_url, stream=True) as response:
+                if response.status_code == 200:
+                    num_bytes = write_chunks(
+                        response.iter_content(HTTP_DOWNLOAD_CHUNK_SIZE),
+                        tmp_fpath,
+                        cancelled,
+                    )
+
+        if num_bytes > 0:
+            if config.hdf_caching.format == "npy":
+                from app.utils.track_file_contents import transcode_h5_to_npy
+
+                # ^ imported here: 'track_file_contents' imports this module
+                tmp_npy_dir = fpath.with_name(f".{fpath.name}.{tmp_suffix}")
+                try:
+                    transcode_h5_to_npy(tmp_fpath, h5_url, tmp_npy_dir, config)
+                    try:
+                        os.rename(tmp_npy_dir, fpath)
+                    except OSError:
+                        pass
+                        # ^ already transcoded by another worker
+                finally:
+                    shutil.rmtree(tmp_npy_dir, ignore_errors=True)
+            else:
+                os.replace(tmp_fpath, fpath)
+            cached_h5_fpaths.append(fpath)
+    finally:
+        tmp_fpath.unlink(missing_ok=True)
+        # ^ failed or cancelled downloads (and transcoded files) don't stay on disk
+
+    for old_h5_fpath in cached_h5_fpaths.evict_over_limit(
+        config.hdf_caching.max_num_cached_files
+    ):
+        remove_cached_file(old_h5_fpath)
+
+    return num_bytes
+
+
 def download_missing_h5_files(
     h5_urls: list[str],
     config: DictConfig,
-    cached_h5_fpaths: deque,
+    cached_h5_fpaths: SharedCacheIndex,
+    cancelled: threading.Event | None = None,
 ) -> list[Path]:
+    from tqdm import tqdm
+
     h5_fpaths = []
 
     for h5_url in tqdm(h5_urls):
-        fname = h5_url.split("/")[-1]
-        fpath = Path(config.hdf_caching.dir) / fname
-
-        if not Path.is_file(fpath):
-            os.makedirs(config.hdf_caching.dir, exist_ok=True)
-
-            if h5_url.startswith("gs://"):
-                try:
-                    bucket_name, blob_name = h5_url.replace("gs://", "").split("/", 1)
-                    storage_client = storage.Client()
-                    bucket = storage_client.bucket(bucket_name)
-                    blob = bucket.blob(blob_name)
-                    blob.download_to_filename(fpath)
-                except Exception:
-                    pass
-                else:
-                    cached_h5_fpaths.append(fpath)
-            else:
-                response = requests.get(h5_url)
-                if response.status_code == 200:
-                    with open(fpath, "wb") as fd:
-                        fd.write(response.content)
-                    cached_h5_fpaths.append(fpath)
+        raise_if_cancelled(cancelled)
+        fpath = get_cached_fpath(h5_url, config)
 
-            if len(cached_h5_fpaths) > config.hdf_caching.max_num_cached_files:
-                old_h5_fpath = cached_h5_fpaths.popleft()
-                old_h5_fpath.unlink()
+        if fpath.exists():
+            CACHE_LOOKUPS.inc(1, "hit")
+        else:
+            CACHE_LOOKUPS.inc(1, "miss")
+            download_h5_file(h5_url, config, cached_h5_fpaths, cancelled)
 
         h5_fpaths.append(fpath)
 
-    h5_fpaths = [fpath for fpath in h5_fpaths if Path.is_file(fpath)]
+    h5_fpaths = [fpath for fpath in h5_fpaths if fpath.exists()]
 
     return h5_fpaths
@@ -0,0 +1,120 @@
+import base64
+import io
+
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.h5_extracted_ndarrays import H5ExtractedNdarrays
+
+WIRE_ENCODINGS = ("npz", "compact")
+# ^ 'npz': float64 arrays as they are extracted from the HDF5 file;
+#   'compact': the observable quantized to uint16, the coordinates quantized
+#   to integers and delta-encoded along the track (small deltas compress well)
+
+
+def quantize_observable(observable: np.ndarray, scale: float) -> np.ndarray:
+    quantized = np.rint(observable / scale)
+    return np.clip(quantized, 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+def delta_encode_coords(
+    coords: np.ndarray,
+    scale: float,
+) -> tuple[np.int64, np.ndarray]:
+    """
+    Quantize the coordinates to integers (in the units of 'scale' degrees),
+    return the first quantized value and the differences between the consecutive
+    ones (int16 if they fit, which is the case along a track, else int32).
+    """
+    quantized = np.rint(coords.ravel() / scale).astype(np.int64)
+    if quantized.size == 0:
+        return np.int64(0), np.empty(0, dtype=np.int16)
+
+    deltas = np.diff(quantized)
+    if np.abs(deltas).max(initial=0) <= np.iinfo(np.int16).max:
+        return quantized[0], deltas.astype(np.int16)
+    return quantized[0], deltas.astype(np.int32)
+
+
+def delta_decode_coords(
+    start: np.int64,
+    deltas: np.ndarray,
+    scale: float,
+) -> np.ndarray:
+    quantized = np.empty(deltas.size + 1, dtype=np.int64)
+    quantized[0] = start
+    np.cumsum(deltas, dtype=np.int64, out=quantized[1:])
+    quantized[1:] += start
+    return quantized * scale
+
+
+def encode_h5_data(
+    h5_data: H5ExtractedNdarrays,
+    encoding: str,
+    config: DictConfig,
+) -> str:
+    """Encode the extracted arrays as a base64 string of the NPZ file"""
+    if encoding == "compact":
+        coords_scale = config.wire_encoding.coords_scale
+        observable_scale = config.wire_encoding.observable_scale
+        latitude_start, latitude_deltas = delta_encode_coords(
+            h5_data.latitude, coords_scale
+        )
+        longitude_start, longitude_deltas = delta_encode_coords(
+            h5_data.longitude, coords_scale
+        )
+        arrays = dict(
+            latitude_start=latitude_start,
+            latitude_deltas=latitude_deltas,
+            longitude_start=longitude_start,
+            longitude_deltas=longitude_deltas,
+            observable_quantized=quantize_observable(
+                h5_data.observable.ravel(), observable_scale
+            ),
+            coords_scale=np.float64(coords_scale),
+            observable_scale=np.float64(observable_scale),
+        )
+    else:
+        arrays = dict(
+            latitude=h5_data.latitude,
+            longitude=h5_data.longitude,
+            observable=h5_data.observable,
+        )
+
+    with io.BytesIO() as buffer:
+        np.savez(buffer, **arrays)
+        return base64.b64encode(buffer.getvalue()).decode()
+
+
+def decode_h5_data(h5_data_npz_base64: str) -> dict[str, np.ndarray]:
+    """Decode the arrays (flattened) encoded by 'encode_h5_data'"""
+    h5_data_npz_bytes = base64.b64decode(h5_data_npz_base64)
+    npz_contents = np.load(io.BytesIO(h5_data_npz_bytes))
+
+    if "observable_quantized" in npz_contents:
+        coords_scale = float(npz_contents["coords_scale"])
+        observable_scale = float(npz_contents["observable_scale"])
+        observable_quantized = npz_contents["observable_quantized"]
+        if observable_quantized.size == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return {"latitude": empty, "longitude": empty, "observable": empty}
+
+        return {
+            "latitude": delta_decode_coords(
+                npz_contents["latitude_start"],
+                npz_contents["latitude_deltas"],
+                coords_scale,
+            ),
+            "longitude": delta_decode_coords(
+                npz_contents["longitude_start"],
+                npz_contents["longitude_deltas"],
+                coords_scale,
+            ),
+            "observable": observable_quantized.astype(np.float64) * observable_scale,
+        }
+
+    return {
+        "latitude": npz_contents["latitude"].flatten(),
+        "longitude": npz_contents["longitude"].flatten(),
+        "observable": npz_contents["observable"].flatten(),
+    }
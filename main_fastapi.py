@@ -1,20 +1,26 @@
-from collections import deque
+import os
+import shlex
 from contextlib import asynccontextmanager
-from pathlib import Path
 
-import numpy as np
-import requests
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from hydra import compose, initialize
 
+from app.api.endpoints.climatology import climatology_router
+from app.api.endpoints.collocation import collocation_router
 from app.api.endpoints.dates_coords_selection import dates_coords_selection_router
-from app.utils.track_file_names import (
-    get_all_links_to_hdf5,
-    map_h5_urls_to_start_timestamps,
-    map_start_timestamps_to_h5_urls,
-)
+from app.api.endpoints.export import export_router
+from app.api.endpoints.metrics import metrics_router
+from app.api.endpoints.time_series import time_series_router
+from app.core.admission import AdmissionController
+from app.core.cancellation import CLIENT_CLOSED_REQUEST, QueryCancelled
+from app.core.compression import CompressionMiddleware
+from app.core.metrics_snapshots import MetricsSnapshots
+from app.core.profiling import ProfilingMiddleware
+from app.core.shared_state import load_shared_state
+from app.utils.parallel_extraction import ExtractionPool
+from app.utils.prefetching import Prefetcher
 
 load_dotenv()
 
@@ -24,47 +30,91 @@ async def app_lifespan(app: FastAPI):
     # Code to run on startup
     # (1) read the config
     with initialize(version_base=None, config_path="./"):
-        config = compose(config_name="config.yaml")
+        config = compose(
+            config_name="config.yaml",
+            overrides=shlex.split(os.getenv("APP_CONFIG_OVERRIDES", "")),
+            # ^ e.g. APP_CONFIG_OVERRIDES="use_gcs_bucket=false hdf_caching.dir=/tmp"
+        )
 
     app.state.config = config
 
-    # (2) get the downsampled swath points for each track:
-    fpath = "fname_to_downsampled_points.npz"
-    if not Path(fpath).is_file():
-        response = requests.get(config.url_npz_track_to_downsampled_swath_points)
-        if response.status_code == 200:
-            with open(fpath, "wb") as fd:
-                fd.write(response.content)
-
-    app.state.fname_to_downsampled_points = np.load(fpath)
-
-    # (3) get the full list of links (or file paths) from the source
-    h5_urls = get_all_links_to_hdf5(
-        config.url_webpage_all_tracks,
-        config.use_gcs_bucket,
-        config.hdf_fname_extension,
-    )
-    # (4) extract the start date for each track
-    h5_urls_to_start_timestamps = map_h5_urls_to_start_timestamps(config, h5_urls)
-
-    # (5) get the list of tracks for each start date
-    app.state.start_timestamps_to_h5_urls = map_start_timestamps_to_h5_urls(
-        h5_urls_to_start_timestamps
-    )
-
-    # (6) initialize a queue for the cached hdf5 files
-    app.state.cached_h5_fpaths = deque()
+    # (2) get the catalog of the tracks (the list of tracks for each start date),
+    #     the downsampled swath points for each track and the index of the cached
+    #     hdf5 files; these are shared by all worker processes and initialized
+    #     once by the first of them (see 'app/core/shared_state.py')
+    (
+        app.state.start_timestamps_to_h5_urls,
+        app.state.fname_to_downsampled_points,
+        app.state.cached_h5_fpaths,
+    ) = load_shared_state(config)
+
+    # (3) the metrics of this worker process, summed over the worker processes
+    #     on '/metrics' (see 'app/core/metrics_snapshots.py')
+    app.state.metrics_snapshots = MetricsSnapshots(config)
+
+    # (4) the admission control of the expensive queries (per worker process)
+    app.state.admission_controller = None
+    if config.admission.enabled:
+        app.state.admission_controller = AdmissionController(config)
+
+    # (5) start the background prefetching of the tracks for the next period
+    #     (pointless if the tracks aren't kept in the cache), within the
+    #     admission budget of the queries
+    app.state.prefetcher = None
+    if (
+        config.prefetching.enabled
+        and not config.remote_reading.enabled
+        and not config.hdf_caching.remove_cached_files
+    ):
+        app.state.prefetcher = Prefetcher(
+            config,
+            app.state.start_timestamps_to_h5_urls,
+            app.state.fname_to_downsampled_points,
+            app.state.cached_h5_fpaths,
+            app.state.admission_controller,
+        )
+
+    # (6) the worker processes extracting the tracks in parallel (spawned
+    #     and warmed up in the background on startup)
+    app.state.extraction_pool = None
+    if config.parallel_extraction.enabled:
+        app.state.extraction_pool = ExtractionPool(
+            config.parallel_extraction.max_workers
+        )
 
     yield
     # Code to run on shutdown (optional)
+    if app.state.prefetcher is not None:
+        app.state.prefetcher.stop()
+    if app.state.extraction_pool is not None:
+        app.state.extraction_pool.shutdown()
+    app.state.metrics_snapshots.stop()
 
 
 app = FastAPI(lifespan=app_lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 
 @app.exception_handler(HTTPException)
 async def custom_http_exception_handler(request, exc):
-    return JSONResponse(status_code=exc.status_code, content={"message": exc.detail})
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"message": exc.detail},
+        headers=exc.headers,
+    )
+    # ^ e.g. 'Retry-After' of the rejected queries
+
+
+@app.exception_handler(QueryCancelled)
+async def query_cancelled_handler(request, exc):
+    return Response(status_code=CLIENT_CLOSED_REQUEST)
+    # ^ nobody receives it, the client has disconnected
 
 
 app.include_router(dates_coords_selection_router)
+app.include_router(collocation_router)
+app.include_router(time_series_router)
+app.include_router(climatology_router)
+app.include_router(export_router)
+app.include_router(metrics_router)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from hydra import compose, initialize
+
+from app.utils.npy_tracks import NPY_TRACK_DIR_SUFFIX
+from app.utils.track_file_contents import (
+    extract_segment_from_h5_file,
+    transcode_h5_to_npy,
+)
+from scripts.benchmark_remote_reads import make_selection
+from scripts.load_test import NPZ_FNAME, prepare_tracks
+
+
+def get_disk_bytes(fpath: Path) -> int:
+    if fpath.is_dir():
+        return sum(sub_fpath.stat().st_size for sub_fpath in fpath.iterdir())
+    return fpath.stat().st_size
+
+
+def time_extraction(fpath: Path, selection, config, swath_edges_coords, repeats: int):
+    elapsed_seconds = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        h5_data = extract_segment_from_h5_file(
+            fpath, selection, config, swath_edges_coords
+        )
+        elapsed_seconds.append(time.perf_counter() - time_start)
+    return statistics.median(elapsed_seconds), h5_data
+
+
+def check_close(npy_data, h5_data) -> bool:
+    """The '.npy' tracks are float32: equal up to the float32 rounding"""
+    if h5_data.latitude is None or npy_data.latitude is None:
+        return h5_data.latitude is None and npy_data.latitude is None
+    return all(
+        (npy_values.shape == h5_values.shape)
+        and np.allclose(npy_values, h5_values, rtol=1e-6, atol=1e-4)
+        for npy_values, h5_values in zip(
+            (npy_data.latitude, npy_data.longitude, npy_data.observable),
+            (h5_data.latitude, h5_data.longitude, h5_data.observable),
+        )
+    )
+
+
+def run_benchmark(args) -> dict:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    tracks_dir = prepare_tracks(
+        Path(args.work_dir).absolute(), 1, num_scans=args.num_scans, seed=args.seed
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    h5_fpaths = h5_fpaths[: args.num_tracks]
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+
+    npy_root_dir = Path(args.work_dir).absolute() / "npy_tracks"
+    shutil.rmtree(npy_root_dir, ignore_errors=True)
+    npy_root_dir.mkdir(parents=True)
+    npy_dirs = []
+    time_start = time.perf_counter()
+    for h5_fpath in h5_fpaths:
+        npy_dir = npy_root_dir / f"{h5_fpath.stem}{NPY_TRACK_DIR_SUFFIX}"
+        transcode_h5_to_npy(h5_fpath, h5_fpath.name, npy_dir, config)
+        npy_dirs.append(npy_dir)
+    transcoding_seconds = (time.perf_counter() - time_start) / len(h5_fpaths)
+
+    h5_bytes = sum(get_disk_bytes(h5_fpath) for h5_fpath in h5_fpaths)
+    npy_bytes = sum(get_disk_bytes(npy_dir) for npy_dir in npy_dirs)
+    print(
+        f"disk: h5 {h5_bytes} bytes, npy {npy_bytes} bytes "
+        f"({npy_bytes / h5_bytes:.2f}x), transcoding {transcoding_seconds:.3f} s/track"
+    )
+
+    results = []
+    num_mismatches = 0
+    for roi_size_deg in args.roi_sizes_deg:
+        seconds = {"h5": 0.0, "npy": 0.0}
+        for h5_fpath, npy_dir in zip(h5_fpaths, npy_dirs):
+            selection = make_selection(h5_fpath, roi_size_deg, config)
+            swath_edges_coords = fname_to_downsampled_points[h5_fpath.name]
+            h5_seconds, h5_data = time_extraction(
+                h5_fpath, selection, config, swath_edges_coords, args.repeats
+            )
+            npy_seconds, npy_data = time_extraction(
+                npy_dir, selection, config, swath_edges_coords, args.repeats
+            )
+            seconds["h5"] += h5_seconds
+            seconds["npy"] += npy_seconds
+            if not check_close(npy_data, h5_data):
+                num_mismatches += 1
+        result = {
+            "roi_size_deg": roi_size_deg,
+            "num_tracks": len(h5_fpaths),
+            "h5_seconds_per_track": seconds["h5"] / len(h5_fpaths),
+            "npy_seconds_per_track": seconds["npy"] / len(h5_fpaths),
+        }
+        results.append(result)
+        print(
+            f"{roi_size_deg:6.1f} deg: h5 {result['h5_seconds_per_track'] * 1e3:8.2f} "
+            f"ms/track, npy {result['npy_seconds_per_track'] * 1e3:8.2f} ms/track"
+        )
+
+    return {
+        "h5_bytes": h5_bytes,
+        "npy_bytes": npy_bytes,
+        "transcoding_seconds_per_track": transcoding_seconds,
+        "results": results,
+        "num_mismatches": num_mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Transcode the synthetic tracks to the '.npy' cache format, compare "
+            "the disk footprint and the extraction latency with the HDF5 files"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-tracks", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5, help="median of N runs")
+    parser.add_argument(
+        "--roi-sizes-deg", type=float, nargs="+", default=[1.0, 5.0, 20.0, 180.0]
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results_cache_formats.json", help="output JSON"
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
+    if benchmark_results["num_mismatches"] > 0:
+        sys.exit(f"{benchmark_results['num_mismatches']} extractions differ")
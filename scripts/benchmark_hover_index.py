@@ -0,0 +1,169 @@
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from app.utils.nearest_point_index import build_grid_index, find_nearest_point
+from scripts.synthetic_tracks import (
+    EARTH_ROTATION_DEG_PER_MINUTE,
+    GPM_ORBIT_PERIOD_MINUTES,
+    make_synthetic_swath,
+)
+
+GLOBAL_BBOX = (-180.0, 180.0, -90.0, 90.0)
+
+
+def make_points(num_tracks: int, seed: int) -> tuple[np.ndarray, ...]:
+    """The valid points of consecutive synthetic orbits"""
+    rng = np.random.default_rng(seed)
+    arrays = []
+    for track_idx in range(num_tracks):
+        start_longitude = (
+            -EARTH_ROTATION_DEG_PER_MINUTE * GPM_ORBIT_PERIOD_MINUTES * track_idx
+        )
+        latitude, longitude, observable = make_synthetic_swath(
+            start_longitude=(start_longitude + 180.0) % 360.0 - 180.0, rng=rng
+        )
+        valid_mask = observable < 9999.0
+        arrays.append(
+            (latitude[valid_mask], longitude[valid_mask], observable[valid_mask])
+        )
+    return tuple(np.concatenate(field_arrays) for field_arrays in zip(*arrays))
+
+
+def find_nearest_point_brute_force(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    mouse_latitude: float,
+    mouse_longitude: float,
+    pixels_per_degree: tuple[float, float],
+    max_distance_pixels: float,
+) -> float | None:
+    """Distance (pixels) to the nearest point over all points, as the old hover"""
+    distances2 = ((longitude - mouse_longitude) * pixels_per_degree[0]) ** 2 + (
+        (latitude - mouse_latitude) * pixels_per_degree[1]
+    ) ** 2
+    min_distance2 = distances2.min()
+    if min_distance2 >= max_distance_pixels**2:
+        return None
+    return float(np.sqrt(min_distance2))
+
+
+def run_benchmark(args) -> dict:
+    latitude, longitude, observable = make_points(args.num_tracks, args.seed)
+    print(f"{latitude.size} points")
+
+    time_start = time.perf_counter()
+    index = build_grid_index(
+        latitude, longitude, observable, GLOBAL_BBOX, args.points_per_cell
+    )
+    build_seconds = time.perf_counter() - time_start
+    print(
+        f"Grid of {index.num_rows} x {index.num_cols} cells "
+        f"built in {build_seconds:.2f} s"
+    )
+    index_latitude = index.latitude.astype(np.float64)
+    index_longitude = index.longitude.astype(np.float64)
+    # ^ the brute force runs over the same (float32) coordinates
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    num_mismatches = 0
+    for zoom in args.zooms:
+        pixels_per_degree = (args.figure_width * zoom / 360.0,) * 2
+        # ^ a global figure (width x width / 2 pixels) zoomed in 'zoom' times
+        offset_deg = 2 * args.max_distance_pixels / pixels_per_degree[0]
+        point_idxs = rng.integers(0, latitude.size, size=args.num_lookups)
+        mouse_positions = zip(
+            latitude[point_idxs]
+            + rng.uniform(-offset_deg, offset_deg, len(point_idxs)),
+            longitude[point_idxs]
+            + rng.uniform(-offset_deg, offset_deg, len(point_idxs)),
+        )
+        # ^ around the points, some of them farther than the hover distance
+
+        index_seconds = []
+        brute_force_seconds = []
+        num_found = 0
+        for mouse_latitude, mouse_longitude in mouse_positions:
+            time_start = time.perf_counter()
+            idx = find_nearest_point(
+                index,
+                mouse_latitude,
+                mouse_longitude,
+                pixels_per_degree,
+                args.max_distance_pixels,
+            )
+            index_seconds.append(time.perf_counter() - time_start)
+
+            time_start = time.perf_counter()
+            distance = find_nearest_point_brute_force(
+                index_latitude,
+                index_longitude,
+                mouse_latitude,
+                mouse_longitude,
+                pixels_per_degree,
+                args.max_distance_pixels,
+            )
+            brute_force_seconds.append(time.perf_counter() - time_start)
+
+            if idx is None:
+                num_mismatches += distance is not None
+                continue
+            num_found += 1
+            index_distance = np.hypot(
+                (index_longitude[idx] - mouse_longitude) * pixels_per_degree[0],
+                (index_latitude[idx] - mouse_latitude) * pixels_per_degree[1],
+            )
+            num_mismatches += (distance is None) or not np.isclose(
+                index_distance, distance, rtol=1e-6, atol=1e-6
+            )
+
+        result = {
+            "zoom": zoom,
+            "num_found": num_found,
+            "index_microseconds": 1e6 * statistics.median(index_seconds),
+            "brute_force_microseconds": 1e6 * statistics.median(brute_force_seconds),
+        }
+        results.append(result)
+        print(
+            f"zoom {zoom:>5g}x: index {result['index_microseconds']:8.1f} us, "
+            f"brute force {result['brute_force_microseconds']:10.1f} us per lookup "
+            f"({num_found}/{args.num_lookups} points within the distance)"
+        )
+
+    print(f"{num_mismatches} mismatches with the brute force")
+    return {
+        "num_points": int(latitude.size),
+        "grid_shape": [index.num_rows, index.num_cols],
+        "build_seconds": build_seconds,
+        "results": results,
+        "num_mismatches": num_mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Look up the point nearest to random mouse positions at several "
+            "zoom levels through the grid index of the hover tool and over "
+            "all points (the results must be the same), compare the times"
+        )
+    )
+    parser.add_argument("--num-tracks", type=int, default=8)
+    parser.add_argument("--num-lookups", type=int, default=200)
+    parser.add_argument("--zooms", type=float, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--figure-width", type=int, default=600, help="pixels")
+    parser.add_argument("--points-per-cell", type=float, default=8)
+    parser.add_argument("--max-distance-pixels", type=float, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", default="benchmark_results_hover_index.json", help="output JSON"
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
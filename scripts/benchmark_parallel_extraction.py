@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.parallel_extraction import ExtractionPool
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import extract_start_timestamp_from_h5_url
+from scripts.load_test import NPZ_FNAME, prepare_tracks
+
+
+async def extract_all(
+    extraction_pool: ExtractionPool,
+    h5_fpaths: list[Path],
+    selection: DatesCoordsSelection,
+    config,
+    fname_to_downsampled_points,
+    transport: str,
+) -> list:
+    """The results in the order of 'h5_fpaths'"""
+    if transport == "shared_memory":
+        return [
+            h5_data
+            async for h5_data in extraction_pool.extract_in_order(
+                h5_fpaths, selection, config, fname_to_downsampled_points
+            )
+        ]
+    futures = [
+        extraction_pool.executor.submit(
+            extract_segment_from_h5_file,
+            h5_fpath,
+            selection,
+            config,
+            fname_to_downsampled_points[h5_fpath.name],
+        )
+        for h5_fpath in h5_fpaths
+    ]
+    # ^ the arrays are pickled and sent back through the pipe
+    return [await asyncio.wrap_future(future) for future in futures]
+
+
+def check_equal(results: list, reference_results: list) -> bool:
+    return all(
+        (result.latitude is None) == (reference.latitude is None)
+        and all(
+            np.array_equal(values, reference_values)
+            for values, reference_values in zip(result, reference)
+            if values is not None
+        )
+        for result, reference in zip(results, reference_results)
+    )
+
+
+def run_benchmark(args) -> dict:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    tracks_dir = prepare_tracks(
+        Path(args.work_dir).absolute(),
+        args.num_days,
+        num_scans=args.num_scans,
+        seed=args.seed,
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+    start_dates = [
+        extract_start_timestamp_from_h5_url(h5_fpath, config).date()
+        for h5_fpath in h5_fpaths
+    ]
+    selection = DatesCoordsSelection(
+        date_start=min(start_dates),
+        date_end=max(start_dates),
+        latitude_min=-args.roi_half_size_deg,
+        latitude_max=args.roi_half_size_deg,
+        longitude_min=-2 * args.roi_half_size_deg,
+        longitude_max=2 * args.roi_half_size_deg,
+    )
+
+    elapsed_seconds = []
+    for _ in range(args.repeats):
+        time_start = time.perf_counter()
+        reference_results = [
+            extract_segment_from_h5_file(
+                h5_fpath,
+                selection,
+                config,
+                fname_to_downsampled_points[h5_fpath.name],
+            )
+            for h5_fpath in h5_fpaths
+        ]
+        elapsed_seconds.append(time.perf_counter() - time_start)
+    serial_seconds = statistics.median(elapsed_seconds)
+    num_points = sum(
+        result.observable.size
+        for result in reference_results
+        if result.observable is not None
+    )
+    print(
+        f"{len(h5_fpaths)} tracks, {num_points} points, "
+        f"serial (in process): {serial_seconds:.3f} s"
+    )
+
+    results = []
+    num_mismatches = 0
+    for num_workers in sorted(
+        {min(num_workers, os.cpu_count() or 1) for num_workers in args.num_workers}
+    ):
+        extraction_pool = ExtractionPool(num_workers)
+        try:
+            for transport in ("shared_memory", "pickle"):
+                asyncio.run(
+                    extract_all(
+                        extraction_pool,
+                        h5_fpaths,
+                        selection,
+                        config,
+                        fname_to_downsampled_points,
+                        transport,
+                    )
+                )
+                # ^ warm-up: the workers are spawned and import the modules
+                elapsed_seconds = []
+                for _ in range(args.repeats):
+                    time_start = time.perf_counter()
+                    pool_results = asyncio.run(
+                        extract_all(
+                            extraction_pool,
+                            h5_fpaths,
+                            selection,
+                            config,
+                            fname_to_downsampled_points,
+                            transport,
+                        )
+                    )
+                    elapsed_seconds.append(time.perf_counter() - time_start)
+                if not check_equal(pool_results, reference_results):
+                    num_mismatches += 1
+                result = {
+                    "num_workers": extraction_pool.max_workers,
+                    "transport": transport,
+                    "seconds": statistics.median(elapsed_seconds),
+                    "speedup": serial_seconds / statistics.median(elapsed_seconds),
+                }
+                results.append(result)
+                print(
+                    f"{result['num_workers']:>3} workers, {transport:>13}: "
+                    f"{result['seconds']:.3f} s ({result['speedup']:.2f}x)"
+                )
+        finally:
+            extraction_pool.shutdown()
+
+    return {
+        "num_cpus": os.cpu_count(),
+        "num_tracks": len(h5_fpaths),
+        "num_points": num_points,
+        "serial_seconds": serial_seconds,
+        "results": results,
+        "num_mismatches": num_mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Extract the synthetic tracks in a process pool with 1 to N workers, "
+            "returning the arrays through shared memory (in order, a bounded "
+            "number of tracks ahead) or pickled, compare with the serial "
+            "extraction (the results must be the same)"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-days", type=int, default=1)
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="median of N runs")
+    parser.add_argument(
+        "--roi-half-size-deg",
+        type=float,
+        default=45.0,
+        help="the ROI is [-h, h] in latitude and [-2h, 2h] in longitude",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, 8, 16, os.cpu_count() or 1}),
+        help="capped at the number of CPUs",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results_parallel_extraction.json",
+        help="output JSON",
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
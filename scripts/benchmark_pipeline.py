@@ -0,0 +1,309 @@
+import argparse
+import ctypes
+import json
+import platform
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from fastapi.testclient import TestClient
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.cache_index import SharedCacheIndex
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    map_h5_urls_to_start_timestamps,
+    map_start_timestamps_to_h5_urls,
+    select_h5_urls_by_coords,
+    select_h5_urls_by_date,
+    select_h5_urls_by_time_span,
+)
+from app.utils.wire_encoding import WIRE_ENCODINGS, encode_h5_data
+from main_fastapi import app
+from scripts.synthetic_tracks import (
+    generate_synthetic_tracks,
+    save_downsampled_points_index,
+)
+
+SYNTHETIC_TRACKS_URL_PREFIX = "https://synthetic-tracks.invalid/GPM_Ku_mss_U10"
+ARCHIVE_DATE_START = date(year=2018, month=3, day=1)
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def time_stage(func, num_repeats: int):
+    """Run the stage several times, return its result and the min duration"""
+    durations = []
+    for _ in range(num_repeats):
+        time_start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - time_start)
+    return result, min(durations)
+
+
+def read_memory_status() -> dict:
+    """{'VmRSS': bytes, 'VmHWM': bytes} of this process (Linux)"""
+    memory_status = {}
+    with open("/proc/self/status") as fd:
+        for line in fd:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                memory_status[name] = int(value.split()[0]) * 1024
+    return memory_status
+
+
+M_MMAP_THRESHOLD = -3
+# ^ the 'mallopt' parameter (glibc)
+
+
+def allocate_large_arrays_with_mmap() -> None:
+    """
+    Without a fixed threshold, glibc reuses the freed (still resident) memory
+    for the large arrays and their peak isn't visible in the resident memory
+    """
+    ctypes.CDLL("libc.so.6").mallopt(M_MMAP_THRESHOLD, 128 * 1024)
+
+
+def measure_peak_rss_bytes(func):
+    """
+    Run 'func', return its result and the peak increase of the resident memory
+    while it ran (Linux: the peak is reset through '/proc/self/clear_refs')
+    """
+    with open("/proc/self/clear_refs", "w") as fd:
+        fd.write("5")
+    rss_before = read_memory_status()["VmRSS"]
+    result = func()
+    return result, read_memory_status()["VmHWM"] - rss_before
+
+
+def prepare_archive(work_dir: Path, num_days: int, seed: int, num_scans: int):
+    """
+    Generate the synthetic tracks right in the cache directory
+    (so that nothing is downloaded) and the downsampled points index.
+    """
+    with initialize(version_base=None, config_path="../"):
+        config = compose(
+            config_name="config.yaml",
+            overrides=[
+                f"hdf_caching.dir={work_dir / 'cached_h5_files'}",
+                "hdf_caching.remove_cached_files=false",
+            ],
+        )
+
+    h5_fpaths = generate_synthetic_tracks(
+        Path(config.hdf_caching.dir),
+        ARCHIVE_DATE_START,
+        num_days,
+        config,
+        seed=seed,
+        num_scans=num_scans,
+    )
+    npz_fpath = work_dir / "fname_to_downsampled_points.npz"
+    if not npz_fpath.is_file():
+        save_downsampled_points_index(h5_fpaths, npz_fpath)
+
+    h5_urls = [f"{SYNTHETIC_TRACKS_URL_PREFIX}/{fpath.name}" for fpath in h5_fpaths]
+    start_timestamps_to_h5_urls = map_start_timestamps_to_h5_urls(
+        map_h5_urls_to_start_timestamps(config, h5_urls)
+    )
+    fname_to_downsampled_points = np.load(npz_fpath)
+    return config, start_timestamps_to_h5_urls, fname_to_downsampled_points
+
+
+def benchmark_selection(
+    selection: DatesCoordsSelection,
+    config,
+    start_timestamps_to_h5_urls: dict,
+    fname_to_downsampled_points,
+    client: TestClient,
+    num_repeats: int,
+) -> dict:
+    stages = {}
+
+    h5_urls_by_date, stages["select_h5_urls_by_date"] = time_stage(
+        lambda: select_h5_urls_by_time_span(
+            select_h5_urls_by_date(
+                selection.date_start, selection.date_end, start_timestamps_to_h5_urls
+            ),
+            selection,
+            config,
+        ),
+        num_repeats,
+    )
+    h5_urls_by_coords, stages["select_h5_urls_by_coords"] = time_stage(
+        lambda: select_h5_urls_by_coords(
+            h5_urls_by_date, selection, fname_to_downsampled_points
+        ),
+        num_repeats,
+    )
+    h5_fpaths = download_missing_h5_files(
+        h5_urls_by_coords, config, SharedCacheIndex(config.hdf_caching.dir)
+    )
+
+    segments, stages["extract_segment_from_h5_file"] = time_stage(
+        lambda: [
+            extract_segment_from_h5_file(h5_fpath, selection, config)
+            for h5_fpath in h5_fpaths
+        ],
+        num_repeats,
+    )
+    segments = [
+        h5_data
+        for h5_data in segments
+        if (h5_data.latitude is not None) and (h5_data.latitude.size > 0)
+    ]
+    peak_rss_bytes_per_track = 0
+    output_bytes_per_track = 0
+    for h5_fpath in h5_fpaths:
+        h5_data, peak_bytes = measure_peak_rss_bytes(
+            lambda: extract_segment_from_h5_file(h5_fpath, selection, config)
+        )
+        if peak_bytes > peak_rss_bytes_per_track:
+            peak_rss_bytes_per_track = peak_bytes
+            output_bytes_per_track = sum(
+                values.nbytes for values in h5_data if values is not None
+            )
+    # ^ each track is extracted again, apart from the timed runs
+
+    for encoding in WIRE_ENCODINGS:
+        _, stages[f"encode_{encoding}"] = time_stage(
+            lambda: [encode_h5_data(h5_data, encoding, config) for h5_data in segments],
+            num_repeats,
+        )
+
+    response, stages["endpoint_end_to_end"] = time_stage(
+        lambda: client.request(
+            "GET",
+            "/dates_coords_selection/",
+            json=json.loads(selection.model_dump_json()),
+        ),
+        num_repeats,
+    )
+    response.raise_for_status()
+
+    return {
+        "date_start": selection.date_start.isoformat(),
+        "date_end": selection.date_end.isoformat(),
+        "roi": [
+            selection.latitude_min,
+            selection.latitude_max,
+            selection.longitude_min,
+            selection.longitude_max,
+        ],
+        "num_tracks_by_date": len(h5_urls_by_date),
+        "num_tracks_by_coords": len(h5_urls_by_coords),
+        "num_points": int(sum(h5_data.observable.size for h5_data in segments)),
+        "response_nbytes": len(response.content),
+        "extract_peak_rss_bytes_per_track": peak_rss_bytes_per_track,
+        "extract_output_bytes_per_track": output_bytes_per_track,
+        # ^ of the track with the highest peak
+        "stages_seconds": stages,
+    }
+
+
+def run_benchmarks(args) -> dict:
+    allocate_large_arrays_with_mmap()
+    work_dir = Path(args.work_dir)
+    archive_num_days = max(args.date_range_days) + 2
+    # ^ the tracks starting on 'date_end + 1' are selected too
+    config, start_timestamps_to_h5_urls, fname_to_downsampled_points = prepare_archive(
+        work_dir, archive_num_days, args.seed, args.num_scans
+    )
+
+    app.state.config = config
+    app.state.fname_to_downsampled_points = fname_to_downsampled_points
+    app.state.start_timestamps_to_h5_urls = start_timestamps_to_h5_urls
+    app.state.cached_h5_fpaths = SharedCacheIndex(config.hdf_caching.dir)
+    client = TestClient(app)
+    # ^ without the lifespan (it would scrape the real webpage)
+
+    results = []
+    for date_range_days in args.date_range_days:
+        for roi_size_deg in args.roi_sizes_deg:
+            selection = DatesCoordsSelection(
+                date_start=ARCHIVE_DATE_START,
+                date_end=ARCHIVE_DATE_START + timedelta(days=date_range_days - 1),
+                latitude_min=max(args.roi_center[0] - roi_size_deg / 2, -90.0),
+                latitude_max=min(args.roi_center[0] + roi_size_deg / 2, 90.0),
+                longitude_min=max(args.roi_center[1] - roi_size_deg / 2, -180.0),
+                longitude_max=min(args.roi_center[1] + roi_size_deg / 2, 180.0),
+            )
+            result = benchmark_selection(
+                selection,
+                config,
+                start_timestamps_to_h5_urls,
+                fname_to_downsampled_points,
+                client,
+                args.num_repeats,
+            )
+            result["date_range_days"] = date_range_days
+            result["roi_size_deg"] = roi_size_deg
+            results.append(result)
+            print(
+                f"{date_range_days:3d} days, {roi_size_deg:6.1f} deg: "
+                f"{result['num_tracks_by_coords']:4d} tracks, "
+                f"{result['num_points']:9d} points, "
+                f"peak RSS "
+                f"{result['extract_peak_rss_bytes_per_track'] / 2**20:.1f} MiB/track "
+                f"(output {result['extract_output_bytes_per_track'] / 2**20:.1f} MiB), "
+                + ", ".join(
+                    f"{stage}={seconds:.3f}s"
+                    for stage, seconds in result["stages_seconds"].items()
+                )
+            )
+
+    return {
+        "metadata": {
+            "git_commit": get_git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "num_scans_per_track": args.num_scans,
+            "num_repeats": args.num_repeats,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time each stage of the pipeline on the synthetic tracks"
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--date-range-days", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--roi-sizes-deg", type=float, nargs="+", default=[5.0, 20.0, 60.0]
+    )
+    parser.add_argument(
+        "--roi-center",
+        type=float,
+        nargs=2,
+        default=[20.0, -30.0],
+        metavar=("LATITUDE", "LONGITUDE"),
+    )
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", default="benchmark_results.json", help="output JSON file"
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmarks(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import h5py
+import numpy as np
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.metrics import DOWNLOADED_BYTES, RANGE_REQUESTS
+from app.utils.remote_h5 import get_block_cache
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import extract_start_timestamp_from_h5_url
+from scripts.load_test import NPZ_FNAME, prepare_tracks
+from scripts.local_stand_ins import (
+    FakeGCSBucketHandler,
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+
+
+def make_selection(h5_fpath: Path, roi_size_deg: float, config) -> DatesCoordsSelection:
+    """ROI centered at a footprint in the middle of the track"""
+    with h5py.File(h5_fpath, "r") as h5:
+        num_scans, num_rays = h5["Latitude"].shape
+        latitude = float(h5["Latitude"][num_scans // 2, num_rays // 2])
+        longitude = float(h5["Longitude"][num_scans // 2, num_rays // 2])
+    start_date = extract_start_timestamp_from_h5_url(h5_fpath, config).date()
+    return DatesCoordsSelection(
+        date_start=start_date,
+        date_end=start_date + timedelta(days=1),
+        latitude_min=max(latitude - roi_size_deg / 2, -90.0),
+        latitude_max=min(latitude + roi_size_deg / 2, 90.0),
+        longitude_min=max(longitude - roi_size_deg / 2, -180.0),
+        longitude_max=min(longitude + roi_size_deg / 2, 180.0),
+    )
+
+
+def run_benchmark(args) -> dict:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(
+            config_name="config.yaml",
+            overrides=[
+                f"remote_reading.{name}={value}"
+                for name, value in (
+                    ("block_size", args.block_size),
+                    ("max_read_ahead_blocks", args.max_read_ahead_blocks),
+                )
+                if value is not None
+            ],
+        )
+
+    tracks_dir = prepare_tracks(
+        Path(args.work_dir).absolute(), 1, num_scans=args.num_scans, seed=args.seed
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    h5_fpaths = h5_fpaths[: args.num_tracks]
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+
+    webpage_server = start_http_server(TracksWebpageHandler, tracks_dir)
+    bucket_server = start_http_server(FakeGCSBucketHandler, tracks_dir)
+    os.environ["STORAGE_EMULATOR_HOST"] = get_server_url(bucket_server)
+    url_prefixes = {
+        "http": get_server_url(webpage_server),
+        "gs": f"gs://{FakeGCSBucketHandler.bucket_name}",
+    }
+
+    results = []
+    num_mismatches = 0
+    for source in args.sources:
+        for roi_size_deg in args.roi_sizes_deg:
+            get_block_cache.cache_clear()
+            # ^ cold block cache for each ROI size
+            fetched_bytes_before = DOWNLOADED_BYTES.get()
+            range_requests_before = RANGE_REQUESTS.get()
+            file_bytes = 0
+            time_start = time.perf_counter()
+            for h5_fpath in h5_fpaths:
+                selection = make_selection(h5_fpath, roi_size_deg, config)
+                swath_edges_coords = fname_to_downsampled_points[h5_fpath.name]
+                remote_data = extract_segment_from_h5_file(
+                    f"{url_prefixes[source]}/{h5_fpath.name}",
+                    selection,
+                    config,
+                    swath_edges_coords,
+                )
+                local_data = extract_segment_from_h5_file(h5_fpath, selection, config)
+                # ^ reference: the whole file, without the swath edges
+                if not all(
+                    np.array_equal(remote, local)
+                    for remote, local in zip(remote_data, local_data)
+                ):
+                    num_mismatches += 1
+                file_bytes += h5_fpath.stat().st_size
+            result = {
+                "source": source,
+                "roi_size_deg": roi_size_deg,
+                "num_tracks": len(h5_fpaths),
+                "file_bytes": file_bytes,
+                "fetched_bytes": DOWNLOADED_BYTES.get() - fetched_bytes_before,
+                "range_requests": RANGE_REQUESTS.get() - range_requests_before,
+                "elapsed_seconds": time.perf_counter() - time_start,
+            }
+            result["fetched_fraction"] = result["fetched_bytes"] / file_bytes
+            results.append(result)
+            print(
+                f"{source:>4}, {roi_size_deg:6.1f} deg: fetched "
+                f"{result['fetched_fraction']:6.1%} of {file_bytes} bytes "
+                f"in {result['range_requests']} requests"
+            )
+
+    webpage_server.shutdown()
+    bucket_server.shutdown()
+    return {"results": results, "num_mismatches": num_mismatches}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Read the synthetic tracks through byte-range requests to local "
+            "stand-ins, compare with the local reads, report the fetched bytes"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-tracks", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--block-size", type=int, default=None, help="overrides the config value"
+    )
+    parser.add_argument(
+        "--max-read-ahead-blocks",
+        type=int,
+        default=None,
+        help="overrides the config value",
+    )
+    parser.add_argument(
+        "--roi-sizes-deg", type=float, nargs="+", default=[1.0, 5.0, 20.0, 180.0]
+    )
+    parser.add_argument(
+        "--sources", nargs="+", choices=["http", "gs"], default=["http", "gs"]
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results_remote_reads.json", help="output JSON"
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
+    if benchmark_results["num_mismatches"] > 0:
+        sys.exit(f"{benchmark_results['num_mismatches']} remote reads differ")
@@ -0,0 +1,176 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.wire_encoding import encode_h5_data
+from scripts.benchmark_remote_reads import make_selection
+from scripts.load_test import NPZ_FNAME, prepare_tracks
+
+SQUARES_SCAN_OFFSET = 300
+# ^ the squares are centered at footprints this many scans around the middle
+
+
+def make_rois(h5_fpath: Path, roi_sizes_deg: list[float], config) -> dict:
+    """{ROI name: selection}: boxes, a diamond and two squares on the track"""
+    rois = {
+        f"box {roi_size_deg:g} deg": make_selection(h5_fpath, roi_size_deg, config)
+        for roi_size_deg in roi_sizes_deg
+    }
+    box = rois[f"box {max(roi_sizes_deg):g} deg"]
+    latitude_center = (box.latitude_min + box.latitude_max) / 2
+    longitude_center = (box.longitude_min + box.longitude_max) / 2
+    half_size = min(
+        box.latitude_max - latitude_center, box.longitude_max - longitude_center
+    )
+
+    with h5py.File(h5_fpath, "r") as h5:
+        num_scans, num_rays = h5["Latitude"].shape
+        squares_centers = [
+            (
+                float(h5["Longitude"][scan_idx, num_rays // 2]),
+                float(h5["Latitude"][scan_idx, num_rays // 2]),
+            )
+            for scan_idx in (
+                num_scans // 2 - SQUARES_SCAN_OFFSET,
+                num_scans // 2 + SQUARES_SCAN_OFFSET,
+            )
+        ]
+
+    def square(longitude: float, latitude: float, half_size: float) -> list:
+        return [
+            [
+                [longitude - half_size, latitude - half_size],
+                [longitude + half_size, latitude - half_size],
+                [longitude + half_size, latitude + half_size],
+                [longitude - half_size, latitude + half_size],
+                [longitude - half_size, latitude - half_size],
+            ]
+        ]
+
+    polygons = {
+        "diamond": {
+            "type": "Polygon",
+            "coordinates": [
+                [
+                    [longitude_center - half_size, latitude_center],
+                    [longitude_center, latitude_center - half_size],
+                    [longitude_center + half_size, latitude_center],
+                    [longitude_center, latitude_center + half_size],
+                    [longitude_center - half_size, latitude_center],
+                ]
+            ],
+        },
+        "two squares": {
+            "type": "MultiPolygon",
+            "coordinates": [
+                square(longitude, latitude, 1.0)
+                for longitude, latitude in squares_centers
+            ],
+        },
+    }
+    for name, roi_geometry in polygons.items():
+        rois[name] = DatesCoordsSelection(
+            date_start=box.date_start,
+            date_end=box.date_end,
+            roi_geometry=roi_geometry,
+        )
+    return rois
+
+
+def run_benchmark(args) -> dict:
+    configs = {}
+    for exact_roi_mask in (False, True):
+        with initialize(version_base=None, config_path="../"):
+            configs[exact_roi_mask] = compose(
+                config_name="config.yaml",
+                overrides=[f"extraction.exact_roi_mask={str(exact_roi_mask).lower()}"],
+            )
+    config = configs[True]
+
+    tracks_dir = prepare_tracks(
+        Path(args.work_dir).absolute(), 1, num_scans=args.num_scans, seed=args.seed
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    h5_fpaths = h5_fpaths[: args.num_tracks]
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+
+    totals = {}
+    for h5_fpath in h5_fpaths:
+        swath_edges_coords = fname_to_downsampled_points[h5_fpath.name]
+        for roi_name, selection in make_rois(
+            h5_fpath, args.roi_sizes_deg, config
+        ).items():
+            for exact_roi_mask, mode_config in configs.items():
+                time_start = time.perf_counter()
+                h5_data = extract_segment_from_h5_file(
+                    h5_fpath, selection, mode_config, swath_edges_coords
+                )
+                elapsed_seconds = time.perf_counter() - time_start
+                total = totals.setdefault(
+                    (roi_name, exact_roi_mask),
+                    {"num_points": 0, "compact_bytes": 0, "elapsed_seconds": 0.0},
+                )
+                total["elapsed_seconds"] += elapsed_seconds
+                if (h5_data.latitude is not None) and (h5_data.latitude.size > 0):
+                    total["num_points"] += h5_data.observable.size
+                    total["compact_bytes"] += len(
+                        encode_h5_data(h5_data, "compact", config)
+                    )
+
+    results = []
+    for (roi_name, exact_roi_mask), total in totals.items():
+        if exact_roi_mask:
+            continue
+        exact_total = totals[(roi_name, True)]
+        result = {
+            "roi": roi_name,
+            "num_tracks": len(h5_fpaths),
+            "rows_num_points": total["num_points"],
+            "exact_num_points": exact_total["num_points"],
+            "rows_compact_bytes": total["compact_bytes"],
+            "exact_compact_bytes": exact_total["compact_bytes"],
+            "rows_seconds_per_track": total["elapsed_seconds"] / len(h5_fpaths),
+            "exact_seconds_per_track": exact_total["elapsed_seconds"] / len(h5_fpaths),
+        }
+        results.append(result)
+        print(
+            f"{roi_name:>12}: {result['rows_num_points']:>9} -> "
+            f"{result['exact_num_points']:>9} points, "
+            f"{result['rows_compact_bytes']:>10} -> "
+            f"{result['exact_compact_bytes']:>10} bytes (compact), "
+            f"{result['rows_seconds_per_track'] * 1e3:7.2f} -> "
+            f"{result['exact_seconds_per_track'] * 1e3:7.2f} ms/track"
+        )
+    return {"results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare the payload (points, encoded bytes) and the extraction time "
+            "of the whole scans crossing the ROI with the exact ROI masking, "
+            "for boxes and polygons"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-tracks", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--roi-sizes-deg", type=float, nargs="+", default=[1.0, 5.0, 20.0]
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results_roi_masking.json", help="output JSON"
+    )
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(benchmark_results, fd, indent=2)
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from scripts.load_test import NPZ_FNAME, REPO_DIR, prepare_tracks
+from scripts.local_stand_ins import (
+    FakeGCSBucketHandler,
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+
+HEAVY_MODULES = (
+    "bs4",
+    "cartopy",
+    "google.cloud.storage",
+    "matplotlib",
+    "sklearn",
+    "tqdm",
+)
+# ^ must not be imported by the backend until a request needs them
+
+MEASURE_IMPORT_CODE = f"""
+import json, sys, time
+time_start = time.perf_counter()
+import main_fastapi
+import_seconds = time.perf_counter() - time_start
+heavy_modules = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print(json.dumps({{"import_seconds": import_seconds, "heavy_modules": heavy_modules}}))
+"""
+
+MEASURE_LIFESPAN_CODE = """
+import asyncio, json, time
+from main_fastapi import app
+
+async def run_lifespan():
+    time_start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        return time.perf_counter() - time_start
+
+print(json.dumps({"lifespan_seconds": asyncio.run(run_lifespan())}))
+"""
+
+
+def run_in_fresh_interpreter(code: str, cwd: Path, env: dict) -> dict:
+    """Every measurement needs a cold 'sys.modules'"""
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        env=dict(env, PYTHONPATH=str(REPO_DIR)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(args) -> dict:
+    work_dir = Path(args.work_dir).absolute()
+    tracks_dir = prepare_tracks(
+        work_dir, args.num_days, num_scans=args.num_scans, seed=args.seed
+    )
+    webpage_server = start_http_server(TracksWebpageHandler, tracks_dir)
+    bucket_server = start_http_server(FakeGCSBucketHandler, tracks_dir)
+    webpage_url = get_server_url(webpage_server)
+
+    with tempfile.TemporaryDirectory() as app_run_dir:
+        env = dict(
+            os.environ,
+            STORAGE_EMULATOR_HOST=get_server_url(bucket_server),
+            GCS_BUCKET_NAME=FakeGCSBucketHandler.bucket_name,
+            APP_CONFIG_OVERRIDES=" ".join(
+                [
+                    f"url_webpage_all_tracks={webpage_url}/",
+                    f"url_npz_track_to_downsampled_swath_points={webpage_url}/{NPZ_FNAME}",
+                    f"use_gcs_bucket={str(args.use_gcs_bucket).lower()}",
+                    f"hdf_caching.dir={Path(app_run_dir) / 'cached_h5_files'}",
+                    f"shared_state.dir={Path(app_run_dir) / 'shared_state'}",
+                ]
+            ),
+        )
+        runs = []
+        for _ in range(args.num_repeats):
+            run = run_in_fresh_interpreter(MEASURE_IMPORT_CODE, REPO_DIR, env)
+            run.update(run_in_fresh_interpreter(MEASURE_LIFESPAN_CODE, REPO_DIR, env))
+            runs.append(run)
+            print(run)
+            for shared_state_fpath in (Path(app_run_dir) / "shared_state").glob("*"):
+                shared_state_fpath.unlink()
+            # ^ every replica of a fresh deployment initializes the shared state
+
+    webpage_server.shutdown()
+    bucket_server.shutdown()
+
+    return {
+        "import_seconds": min(run["import_seconds"] for run in runs),
+        "lifespan_seconds": min(run["lifespan_seconds"] for run in runs),
+        "heavy_modules": sorted({m for run in runs for m in run["heavy_modules"]}),
+        "runs": runs,
+    }
+
+
+def find_regressions(result: dict, args) -> list[str]:
+    regressions = [
+        f"{module} is imported on startup" for module in result["heavy_modules"]
+    ]
+    max_seconds = {
+        "import_seconds": args.max_import_seconds,
+        "lifespan_seconds": args.max_lifespan_seconds,
+    }
+    if args.baseline is not None:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        for key in max_seconds:
+            max_seconds[key] = baseline[key] * (1 + args.tolerance)
+    for key, max_value in max_seconds.items():
+        if result[key] > max_value:
+            regressions.append(f"{key} = {result[key]:.3f} > {max_value:.3f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the backend import and lifespan, fail on regressions"
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-days", type=int, default=2)
+    parser.add_argument("--num-scans", type=int, default=800)
+    parser.add_argument("--num-repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--use-gcs-bucket", action="store_true")
+    parser.add_argument("--max-import-seconds", type=float, default=1.5)
+    parser.add_argument("--max-lifespan-seconds", type=float, default=5.0)
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="JSON output of a previous run, replaces the '--max-*' thresholds",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown against the baseline treated as a regression",
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results_startup.json", help="output JSON file"
+    )
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    with open(args.output, "w") as fd:
+        json.dump(result, fd, indent=2)
+
+    regressions = find_regressions(result, args)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,117 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from hydra import compose, initialize
+
+from app.api.schemas.h5_extracted_ndarrays import H5ExtractedNdarrays
+from app.core.compression import compress, zstandard
+from app.utils.wire_encoding import WIRE_ENCODINGS, decode_h5_data, encode_h5_data
+from scripts.synthetic_tracks import make_synthetic_swath
+
+
+def make_segment(config, num_scans: int, seed: int) -> H5ExtractedNdarrays:
+    rng = np.random.default_rng(seed)
+    latitude, longitude, u10 = make_synthetic_swath(
+        num_scans,
+        start_longitude=rng.uniform(-180.0, 180.0),
+        value_invalid=config.hdf_observable.value_invalid,
+        rng=rng,
+    )
+    valid_mask = u10 < min(
+        config.hdf_observable.value_invalid,
+        config.hdf_observable.upper_threshold,
+    )
+    return H5ExtractedNdarrays(
+        latitude=latitude[valid_mask],
+        longitude=longitude[valid_mask],
+        observable=u10[valid_mask],
+    )
+
+
+def time_call(func, num_repeats: int):
+    durations = []
+    for _ in range(num_repeats):
+        time_start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - time_start)
+    return result, min(durations)
+
+
+def benchmark_wire_encoding(num_scans: int, num_repeats: int, seed: int) -> list:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    h5_data = make_segment(config, num_scans, seed)
+    raw_nbytes = sum(arr.nbytes for arr in h5_data)
+    content_encodings = ["identity", "gzip"] + (["zstd"] if zstandard else [])
+
+    results = []
+    reference_nbytes = None
+    for encoding in WIRE_ENCODINGS:
+        encoded, encode_seconds = time_call(
+            lambda: encode_h5_data(h5_data, encoding, config), num_repeats
+        )
+        body = json.dumps({"track_number_to_h5_data": {"0": encoded}}).encode()
+        decoded, decode_seconds = time_call(
+            lambda: decode_h5_data(encoded), num_repeats
+        )
+        max_errors = {
+            name: float(np.abs(decoded[name] - getattr(h5_data, name).ravel()).max())
+            for name in ("latitude", "longitude", "observable")
+        }
+
+        for content_encoding in content_encodings:
+            if content_encoding == "identity":
+                compressed, compress_seconds = body, 0.0
+            else:
+                compressed, compress_seconds = time_call(
+                    lambda: compress(body, content_encoding), num_repeats
+                )
+            if reference_nbytes is None:
+                reference_nbytes = len(compressed)
+
+            results.append(
+                {
+                    "encoding": encoding,
+                    "content_encoding": content_encoding,
+                    "num_points": int(h5_data.observable.size),
+                    "body_nbytes": len(compressed),
+                    "compression_ratio": reference_nbytes / len(compressed),
+                    "encode_seconds": encode_seconds + compress_seconds,
+                    "encode_throughput_mb_per_s": (
+                        raw_nbytes / 1e6 / (encode_seconds + compress_seconds)
+                    ),
+                    "decode_seconds": decode_seconds,
+                    "max_abs_errors": max_errors,
+                }
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the sizes and the speed of the wire encodings"
+    )
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="path to the output JSON file")
+    args = parser.parse_args()
+
+    results = benchmark_wire_encoding(args.num_scans, args.num_repeats, args.seed)
+
+    for result in results:
+        print(
+            f"{result['encoding']:>8} + {result['content_encoding']:<8} "
+            f"{result['body_nbytes'] / 1e6:8.2f} MB  "
+            f"ratio {result['compression_ratio']:6.2f}  "
+            f"encode {result['encode_throughput_mb_per_s']:8.1f} MB/s  "
+            f"max errors {result['max_abs_errors']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2)
@@ -0,0 +1,174 @@
+import argparse
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from hydra import compose, initialize
+from omegaconf import DictConfig
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.shared_state import load_shared_state
+from app.utils.climatology import (
+    accumulate_points,
+    get_grid_shape,
+    get_months,
+    get_next_month_start,
+    load_monthly_grids,
+    materialize_cubes,
+    save_monthly_grids,
+)
+from app.utils.time_series import map_in_order
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    get_h5_fname,
+    remove_cached_file,
+    select_h5_urls_by_date,
+    select_h5_urls_by_time_span,
+)
+
+
+def add_month_tracks(
+    month_start: date,
+    config: DictConfig,
+    start_timestamps_to_h5_urls: dict,
+    fname_to_downsampled_points,
+    cached_h5_fpaths,
+) -> tuple[int, int]:
+    """
+    Add the points of the month of the tracks not added yet to the monthly
+    grids (a track crossing the month boundary is added to both months,
+    with the points of each). Returns the numbers of new and skipped tracks.
+    """
+    climatology_dir = Path(config.climatology.dir)
+    resolution_deg = config.climatology.resolutions_deg[0]
+    grids, track_fnames = load_monthly_grids(
+        climatology_dir, month_start, get_grid_shape(resolution_deg)
+    )
+
+    selection = DatesCoordsSelection(
+        date_start=month_start,
+        date_end=get_next_month_start(month_start) - timedelta(days=1),
+    )
+    h5_urls = select_h5_urls_by_time_span(
+        select_h5_urls_by_date(
+            selection.date_start, selection.date_end, start_timestamps_to_h5_urls
+        ),
+        selection,
+        config,
+    )
+    # ^ including the tracks started on the last day of the previous month
+    #   and ending in this month
+    new_h5_urls = [
+        h5_url for h5_url in h5_urls if get_h5_fname(h5_url, config) not in track_fnames
+    ]
+    if not new_h5_urls:
+        return 0, len(h5_urls)
+
+    def download_and_extract(h5_url: str):
+        if config.remote_reading.enabled:
+            h5_fpath = h5_url
+            # ^ read remotely by 'extract_segment_from_h5_file'
+        else:
+            h5_fpaths = download_missing_h5_files([h5_url], config, cached_h5_fpaths)
+            if len(h5_fpaths) == 0:
+                return h5_url, None
+            h5_fpath = h5_fpaths[0]
+        try:
+            h5_data = extract_segment_from_h5_file(
+                h5_fpath,
+                selection,
+                config,
+                fname_to_downsampled_points.get(get_h5_fname(h5_url, config)),
+            )
+            # ^ the tracks newer than the footprint index are read whole
+        except FileNotFoundError:
+            return h5_url, None
+            # ^ missing on the server
+        if config.hdf_caching.remove_cached_files and not config.remote_reading.enabled:
+            remove_cached_file(h5_fpath)
+            cached_h5_fpaths.remove(h5_fpath)
+        return h5_url, h5_data
+
+    num_workers = config.climatology.num_workers
+    num_added = 0
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for h5_url, h5_data in map_in_order(
+            executor, download_and_extract, new_h5_urls, 2 * num_workers
+        ):
+            if h5_data is None:
+                continue
+                # ^ not downloaded, retried by the next run
+            if h5_data.latitude is not None:
+                accumulate_points(
+                    grids,
+                    h5_data.latitude,
+                    h5_data.longitude,
+                    h5_data.observable,
+                    resolution_deg,
+                )
+            track_fnames.add(get_h5_fname(h5_url, config))
+            num_added += 1
+
+    save_monthly_grids(climatology_dir, month_start, grids, track_fnames)
+    return num_added, len(h5_urls) - len(new_h5_urls)
+
+
+def build_climatology(args) -> None:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(
+            config_name="config.yaml", overrides=shlex.split(args.overrides)
+        )
+
+    (
+        start_timestamps_to_h5_urls,
+        fname_to_downsampled_points,
+        cached_h5_fpaths,
+    ) = load_shared_state(config)
+
+    for month_start in get_months(
+        date.fromisoformat(args.date_start), date.fromisoformat(args.date_end)
+    ):
+        num_added, num_skipped = add_month_tracks(
+            month_start,
+            config,
+            start_timestamps_to_h5_urls,
+            fname_to_downsampled_points,
+            cached_h5_fpaths,
+        )
+        print(
+            f"{month_start:%Y-%m}: {num_added} tracks added, "
+            f"{num_skipped} already in the climatology"
+        )
+
+    months = materialize_cubes(
+        Path(config.climatology.dir), list(config.climatology.resolutions_deg)
+    )
+    print(
+        f"Cubes of {len(months)} months ({months[0]:%Y-%m} to {months[-1]:%Y-%m}) "
+        f"written to {Path(config.climatology.dir).absolute()}"
+    )
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Add the tracks of the months of a date range to the monthly "
+            "climatology grids (the tracks added by the previous runs are "
+            "skipped) and rebuild the cubes served by the '/climatology/' endpoint"
+        )
+    )
+    parser.add_argument("--date-start", required=True, help="yyyy-mm-dd")
+    parser.add_argument("--date-end", required=True, help="yyyy-mm-dd")
+    parser.add_argument(
+        "--overrides",
+        default="",
+        help="config overrides as for the backend, e.g. 'climatology.dir=/data'",
+    )
+    args = parser.parse_args()
+
+    build_climatology(args)
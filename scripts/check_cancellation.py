@@ -0,0 +1,209 @@
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlparse
+
+import h5py
+import requests
+
+from scripts.load_test import (
+    ARCHIVE_DATE_START,
+    parse_metrics,
+    prepare_tracks,
+    start_backend,
+)
+from scripts.local_stand_ins import (
+    ThrottledTracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+
+DOWNLOADED_BYTES_METRIC = "gpm_downloaded_bytes_total"
+
+
+def get_cpu_seconds(pid: int) -> float:
+    """User + system CPU time of the process (Linux)"""
+    with open(f"/proc/{pid}/stat") as fd:
+        fields = fd.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    # ^ 'utime' and 'stime', the 14th and 15th fields of the whole line
+
+
+def get_downloaded_bytes(backend_url: str) -> float:
+    metrics = parse_metrics(requests.get(f"{backend_url}/metrics").text)
+    return metrics.get(DOWNLOADED_BYTES_METRIC, 0.0)
+
+
+def send_and_abandon(backend_url: str, path: str, body: dict, seconds: float):
+    """Send the query, close the connection after 'seconds' without reading"""
+    url = urlparse(backend_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port)
+    connection.request(
+        "GET", path, body=json.dumps(body), headers={"Content-Type": "application/json"}
+    )
+    time.sleep(seconds)
+    connection.close()
+
+
+def observe(backend_url: str, pid: int, seconds: float, interval: float) -> list:
+    """[(time, downloaded bytes, CPU seconds), ...] sampled every 'interval'"""
+    samples = []
+    time_end = time.monotonic() + seconds
+    while time.monotonic() < time_end:
+        samples.append(
+            (time.monotonic(), get_downloaded_bytes(backend_url), get_cpu_seconds(pid))
+        )
+        time.sleep(interval)
+    return samples
+
+
+def run_check(args) -> dict:
+    work_dir = Path(args.work_dir).absolute()
+    tracks_dir = prepare_tracks(
+        work_dir, len(args.endpoints), num_scans=args.num_scans, seed=args.seed
+    )
+    ThrottledTracksWebpageHandler.bytes_per_second = args.bytes_per_second
+    webpage_server = start_http_server(ThrottledTracksWebpageHandler, tracks_dir)
+    webpage_url = get_server_url(webpage_server)
+
+    app_run_dir = work_dir / "app_run_cancellation"
+    shutil.rmtree(app_run_dir, ignore_errors=True)
+    backend_process, backend_url = start_backend(
+        app_run_dir,
+        webpage_url,
+        webpage_url,
+        use_gcs_bucket=False,
+        num_workers=1,
+        config_overrides=("prefetching.enabled=false",),
+        # ^ the prefetching downloads would be mistaken for the query's ones
+    )
+
+    results = {}
+    try:
+        for day_idx, path in enumerate(args.endpoints):
+            query_date = ARCHIVE_DATE_START + timedelta(days=day_idx)
+            selection = {
+                "date_start": query_date.isoformat(),
+                "date_end": query_date.isoformat(),
+                "latitude_min": -90.0,
+                "latitude_max": 90.0,
+                "longitude_min": -180.0,
+                "longitude_max": 180.0,
+            }
+            # ^ a day of its own for each endpoint: nothing is cached yet
+            bytes_before = get_downloaded_bytes(backend_url)
+            send_and_abandon(backend_url, path, selection, args.disconnect_after)
+            time_disconnect = time.monotonic()
+            samples = observe(
+                backend_url,
+                backend_process.pid,
+                args.observe_seconds,
+                args.sample_interval,
+            )
+            time_last_download = time_disconnect
+            for (_, bytes_prev, _), (time_sample, bytes_sample, _) in zip(
+                samples, samples[1:]
+            ):
+                if bytes_sample > bytes_prev:
+                    time_last_download = time_sample
+            idx_quiet = next(
+                idx
+                for idx, sample in enumerate(samples)
+                if sample[0] >= time_disconnect + args.max_stop_seconds
+            )
+            cpu_quiet = (samples[-1][2] - samples[idx_quiet][2]) / (
+                samples[-1][0] - samples[idx_quiet][0]
+            )
+            results[path] = {
+                "downloaded_bytes_before_disconnect": samples[0][1] - bytes_before,
+                "downloaded_bytes_after_disconnect": samples[-1][1] - samples[0][1],
+                "download_stop_seconds": time_last_download - time_disconnect,
+                "cpu_cores_after_stop": cpu_quiet,
+            }
+            print(
+                f"{path}: downloads stopped {results[path]['download_stop_seconds']:.2f} "
+                f"s after the disconnect, then {cpu_quiet:.3f} CPU cores used"
+            )
+
+        cache_dir = app_run_dir / "cached_h5_files"
+        partial_fpaths = sorted(cache_dir.glob(".*.part"))
+        num_corrupt = 0
+        for h5_fpath in sorted(cache_dir.glob("*.h5")):
+            try:
+                with h5py.File(h5_fpath, "r") as h5:
+                    h5["Latitude"][-1]
+            except OSError:
+                num_corrupt += 1
+        results["num_partial_files"] = len(partial_fpaths)
+        results["num_corrupt_files"] = num_corrupt
+        results["backend_still_serving"] = (
+            requests.get(
+                f"{backend_url}/dates_coords_selection/",
+                json=dict(selection, latitude_min=0.0, latitude_max=1.0),
+                timeout=600,
+            ).status_code
+            == 200
+        )
+        # ^ e.g. the admission slots of the abandoned queries were released
+    finally:
+        backend_process.terminate()
+        backend_process.wait()
+        webpage_server.shutdown()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Abandon heavy queries (slow downloads from a throttled stand-in), "
+            "check that the downloads and the CPU use stop soon after the "
+            "disconnect and that no partial files are left in the cache"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--bytes-per-second",
+        type=int,
+        default=4_000_000,
+        help="download rate of the throttled stand-in",
+    )
+    parser.add_argument(
+        "--endpoints",
+        nargs="+",
+        default=["/dates_coords_selection/", "/export/?export_format=csv"],
+    )
+    parser.add_argument("--disconnect-after", type=float, default=3.0)
+    parser.add_argument("--observe-seconds", type=float, default=5.0)
+    parser.add_argument("--sample-interval", type=float, default=0.1)
+    parser.add_argument("--max-stop-seconds", type=float, default=1.0)
+    parser.add_argument("--max-cpu-cores", type=float, default=0.1)
+    parser.add_argument(
+        "--output", default="check_results_cancellation.json", help="output JSON"
+    )
+    args = parser.parse_args()
+
+    check_results = run_check(args)
+    with open(args.output, "w") as fd:
+        json.dump(check_results, fd, indent=2)
+
+    problems = []
+    for path in args.endpoints:
+        if check_results[path]["download_stop_seconds"] > args.max_stop_seconds:
+            problems.append(f"{path}: the downloads continued after the disconnect")
+        if check_results[path]["cpu_cores_after_stop"] > args.max_cpu_cores:
+            problems.append(f"{path}: the processing continued after the disconnect")
+    if check_results["num_partial_files"] or check_results["num_corrupt_files"]:
+        problems.append("partial or corrupt files are left in the cache")
+    if not check_results["backend_still_serving"]:
+        problems.append("the backend doesn't serve the queries after the disconnects")
+    if problems:
+        sys.exit("\n".join(problems))
@@ -0,0 +1,320 @@
+import argparse
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from hydra import compose, initialize
+
+from app.api.schemas.climatology import ClimatologySelection
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.climatology import (
+    get_grid_shape,
+    get_months,
+    get_next_month_start,
+    query_climatology,
+)
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from scripts.load_test import NPZ_FNAME, REPO_DIR
+from scripts.local_stand_ins import (
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+from scripts.synthetic_tracks import (
+    generate_synthetic_tracks,
+    save_downsampled_points_index,
+)
+
+TRACKS_DATE_START = date(year=2018, month=3, day=31)
+# ^ the tracks of the first day go to March, of the second day to April
+STD_ATOL = 1.0e-3
+# ^ m/s, the std from the sums of squares loses precision (cancellation)
+#   when the variance is tiny compared with the squared mean
+
+
+def run_builder(
+    date_start: date,
+    date_end: date,
+    work_dir: Path,
+    webpage_url: str,
+    climatology_dir: Path,
+) -> str:
+    """Run 'scripts.build_climatology' as a new process (fresh catalog)"""
+    (work_dir / "shared_state" / NPZ_FNAME).unlink(missing_ok=True)
+    # ^ the footprint index is downloaded again with the new tracks
+    overrides = [
+        f"url_webpage_all_tracks={webpage_url}/",
+        f"url_npz_track_to_downsampled_swath_points={webpage_url}/{NPZ_FNAME}",
+        "use_gcs_bucket=false",
+        f"hdf_caching.dir={work_dir / 'hdf_cache'}",
+        f"shared_state.dir={work_dir / 'shared_state'}",
+        f"climatology.dir={climatology_dir}",
+    ]
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "scripts.build_climatology",
+            f"--date-start={date_start}",
+            f"--date-end={date_end}",
+            f"--overrides={' '.join(overrides)}",
+        ],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return completed.stdout
+
+
+def compute_brute_force(
+    h5_fpaths: list[Path], fname_to_downsampled_points, config
+) -> dict:
+    """{month: (latitude, longitude, observable)} extracted from every track"""
+    month_to_points = {}
+    for month_start in get_months(
+        TRACKS_DATE_START, TRACKS_DATE_START + timedelta(days=1)
+    ):
+        selection = DatesCoordsSelection(
+            date_start=month_start,
+            date_end=get_next_month_start(month_start) - timedelta(days=1),
+        )
+        arrays = [
+            extract_segment_from_h5_file(
+                h5_fpath,
+                selection,
+                config,
+                fname_to_downsampled_points[h5_fpath.name],
+            )
+            for h5_fpath in h5_fpaths
+        ]
+        month_to_points[month_start] = tuple(
+            np.concatenate(
+                [
+                    getattr(h5_data, field)
+                    for h5_data in arrays
+                    if h5_data.latitude is not None
+                ]
+            )
+            for field in ("latitude", "longitude", "observable")
+        )
+    return month_to_points
+
+
+def grid_brute_force(
+    month_to_points: dict, selection: ClimatologySelection, resolution_deg: float
+) -> dict:
+    """The statistics of the cells of the box, computed from the points"""
+    points = [
+        month_to_points[month_start]
+        for month_start in get_months(selection.date_start, selection.date_end)
+        if month_start in month_to_points
+    ]
+    latitude, longitude, observable = (
+        (
+            np.concatenate([month_points[idx] for month_points in points])
+            if points
+            else np.array([])
+        )
+        for idx in range(3)
+    )
+    num_rows, num_cols = get_grid_shape(resolution_deg)
+    latitude_edges = np.linspace(-90.0, 90.0, num_rows + 1)
+    longitude_edges = np.linspace(-180.0, 180.0, num_cols + 1)
+    rows = np.clip(
+        np.searchsorted(latitude_edges, latitude, side="right") - 1, 0, num_rows - 1
+    )
+    cols = np.clip(
+        np.searchsorted(longitude_edges, longitude, side="right") - 1, 0, num_cols - 1
+    )
+
+    row_first = min(
+        np.searchsorted(latitude_edges, selection.latitude_min, side="right") - 1,
+        num_rows - 1,
+    )
+    row_last = min(
+        np.searchsorted(latitude_edges, selection.latitude_max, side="right") - 1,
+        num_rows - 1,
+    )
+    col_first = min(
+        np.searchsorted(longitude_edges, selection.longitude_min, side="right") - 1,
+        num_cols - 1,
+    )
+    col_last = min(
+        np.searchsorted(longitude_edges, selection.longitude_max, side="right") - 1,
+        num_cols - 1,
+    )
+    shape = (row_last - row_first + 1, col_last - col_first + 1)
+    in_box = (
+        (rows >= row_first)
+        & (rows <= row_last)
+        & (cols >= col_first)
+        & (cols <= col_last)
+    )
+    cell_idxs = (rows[in_box] - row_first) * shape[1] + (cols[in_box] - col_first)
+    values = observable[in_box].astype(np.float64)
+
+    count = np.zeros(shape[0] * shape[1], dtype=np.int64)
+    mean = np.full(shape[0] * shape[1], np.nan)
+    std = np.full(shape[0] * shape[1], np.nan)
+    max_values = np.full(shape[0] * shape[1], np.nan)
+    order = np.argsort(cell_idxs, kind="stable")
+    unique_idxs, starts = np.unique(cell_idxs[order], return_index=True)
+    for cell_idx, cell_values in zip(unique_idxs, np.split(values[order], starts[1:])):
+        count[cell_idx] = cell_values.size
+        mean[cell_idx] = cell_values.mean()
+        std[cell_idx] = cell_values.std()
+        max_values[cell_idx] = np.float32(cell_values.max())
+    return {
+        "count": count.reshape(shape),
+        "mean": mean.reshape(shape),
+        "std": std.reshape(shape),
+        "max": max_values.reshape(shape),
+    }
+
+
+def check_equal(result: dict, reference: dict) -> bool:
+    if not np.array_equal(np.array(result["count"]), reference["count"]):
+        return False
+    return all(
+        np.allclose(
+            np.array(result[stat], dtype=np.float64),
+            reference[stat],
+            rtol=1e-6,
+            atol=STD_ATOL if stat == "std" else 1e-6,
+            equal_nan=True,
+        )
+        for stat in ("mean", "std", "max")
+    )
+
+
+def make_selections(rng: np.random.Generator, num_random_boxes: int) -> list:
+    month_ranges = [
+        (date(2018, 3, 1), date(2018, 3, 31)),
+        (date(2018, 4, 10), date(2018, 4, 10)),
+        (date(2018, 2, 1), date(2018, 5, 31)),
+        (date(2019, 1, 1), date(2019, 12, 31)),
+    ]
+    boxes = [(-90.0, 90.0, -180.0, 180.0)]
+    for _ in range(num_random_boxes):
+        latitude_min, latitude_max = np.sort(rng.uniform(-70.0, 70.0, size=2))
+        longitude_min, longitude_max = np.sort(rng.uniform(-180.0, 180.0, size=2))
+        boxes.append((latitude_min, latitude_max, longitude_min, longitude_max))
+    return [
+        dict(
+            date_start=date_start,
+            date_end=date_end,
+            latitude_min=latitude_min,
+            latitude_max=latitude_max,
+            longitude_min=longitude_min,
+            longitude_max=longitude_max,
+        )
+        for date_start, date_end in month_ranges
+        for latitude_min, latitude_max, longitude_min, longitude_max in boxes
+    ]
+
+
+def run_check(args) -> int:
+    work_dir = Path(args.work_dir).absolute()
+    tracks_dir = work_dir / "tracks"
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    webpage_server = start_http_server(TracksWebpageHandler, tracks_dir)
+    webpage_url = get_server_url(webpage_server)
+    incremental_dir = work_dir / "climatology_incremental"
+    full_dir = work_dir / "climatology_full"
+    num_failures = 0
+    try:
+        h5_fpaths = generate_synthetic_tracks(
+            tracks_dir, TRACKS_DATE_START, 1, config, num_scans=args.num_scans
+        )
+        save_downsampled_points_index(h5_fpaths, tracks_dir / NPZ_FNAME)
+        print(
+            run_builder(
+                date(2018, 3, 1),
+                date(2018, 3, 31),
+                work_dir,
+                webpage_url,
+                incremental_dir,
+            ),
+            end="",
+        )
+
+        h5_fpaths = generate_synthetic_tracks(
+            tracks_dir, TRACKS_DATE_START, 2, config, num_scans=args.num_scans
+        )
+        save_downsampled_points_index(h5_fpaths, tracks_dir / NPZ_FNAME)
+        # ^ the tracks of the second day are added to the archive
+        output = run_builder(
+            date(2018, 3, 1), date(2018, 4, 30), work_dir, webpage_url, incremental_dir
+        )
+        print(output, end="")
+        if not output.startswith("2018-03: 0 tracks added"):
+            print("FAILED: the tracks of March were processed again")
+            num_failures += 1
+        print(
+            run_builder(
+                date(2018, 3, 1), date(2018, 4, 30), work_dir, webpage_url, full_dir
+            ),
+            end="",
+        )
+    finally:
+        webpage_server.shutdown()
+
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+    time_start = time.perf_counter()
+    month_to_points = compute_brute_force(
+        h5_fpaths, fname_to_downsampled_points, config
+    )
+    extraction_seconds = time.perf_counter() - time_start
+    print(
+        f"{len(h5_fpaths)} tracks, "
+        f"{sum(points[0].size for points in month_to_points.values())} points "
+        f"extracted in {extraction_seconds:.2f} s"
+    )
+
+    query_seconds = []
+    num_checked = 0
+    rng = np.random.default_rng(args.seed)
+    for selection_fields in make_selections(rng, args.num_random_boxes):
+        for resolution_deg in config.climatology.resolutions_deg:
+            selection = ClimatologySelection(
+                resolution_deg=resolution_deg, **selection_fields
+            )
+            reference = grid_brute_force(month_to_points, selection, resolution_deg)
+            for climatology_dir in (incremental_dir, full_dir):
+                time_start = time.perf_counter()
+                result = query_climatology(climatology_dir, selection, config)
+                query_seconds.append(time.perf_counter() - time_start)
+                num_checked += 1
+                if not check_equal(result, reference):
+                    print(f"FAILED: {climatology_dir.name} {selection}")
+                    num_failures += 1
+
+    print(
+        f"{num_checked} queries checked against the brute force, "
+        f"{num_failures} failures; query time median "
+        f"{1000 * np.median(query_seconds):.1f} ms, max {1000 * max(query_seconds):.1f} ms"
+    )
+    return num_failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build the climatology of synthetic tracks (incrementally: one day, "
+            "then the next one in another month; and at once), compare the "
+            "queries with the statistics computed from the extracted points"
+        )
+    )
+    parser.add_argument("--work-dir", default="./climatology_check_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-random-boxes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sys.exit(1 if run_check(args) else 0)
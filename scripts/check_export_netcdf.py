@@ -0,0 +1,185 @@
+import argparse
+import sys
+import tempfile
+import threading
+from datetime import date
+from pathlib import Path
+
+import netCDF4
+import numpy as np
+import xarray as xr
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.export import generate_export_chunks
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from app.utils.track_file_names import (
+    extract_start_timestamp_from_h5_url,
+    extract_track_number_from_h5_url_or_fpath,
+)
+from scripts.load_test import NPZ_FNAME
+from scripts.synthetic_tracks import (
+    NUM_SCANS_PER_ORBIT,
+    generate_synthetic_tracks,
+    save_downsampled_points_index,
+)
+
+TRACKS_DATE_START = date(year=2018, month=3, day=1)
+
+
+def extract_segments(h5_fpaths: list[Path], selection, config) -> list:
+    """The (track number, start timestamp, points) as passed by '/export/'"""
+    fname_to_downsampled_points = np.load(h5_fpaths[0].parent / NPZ_FNAME)
+    segments = []
+    for h5_fpath in h5_fpaths:
+        h5_data = extract_segment_from_h5_file(
+            h5_fpath, selection, config, fname_to_downsampled_points[h5_fpath.name]
+        )
+        if (h5_data.latitude is not None) and (h5_data.latitude.size > 0):
+            segments.append(
+                (
+                    int(extract_track_number_from_h5_url_or_fpath(h5_fpath, config)),
+                    extract_start_timestamp_from_h5_url(h5_fpath, config),
+                    h5_data,
+                )
+            )
+    return segments
+
+
+def get_expected_columns(segments: list, config) -> dict[str, np.ndarray]:
+    return {
+        "track_number": np.concatenate(
+            [
+                np.full(h5_data.observable.size, number)
+                for number, _, h5_data in segments
+            ]
+        ),
+        "start_timestamp": np.concatenate(
+            [
+                np.full(h5_data.observable.size, np.datetime64(timestamp, "s"))
+                for _, timestamp, h5_data in segments
+            ]
+        ),
+        "latitude": np.concatenate([h5_data.latitude for *_, h5_data in segments]),
+        "longitude": np.concatenate([h5_data.longitude for *_, h5_data in segments]),
+        config.hdf_observable.value_name: np.concatenate(
+            [h5_data.observable for *_, h5_data in segments]
+        ),
+    }
+
+
+def check_netcdf4_read(nc_fpath: Path, expected: dict) -> list[str]:
+    failures = []
+    with netCDF4.Dataset(nc_fpath) as nc:
+        if nc.data_model != "NETCDF4":
+            failures.append(f"netCDF4: data model {nc.data_model}")
+        if not nc.dimensions["point"].isunlimited():
+            failures.append("netCDF4: 'point' is not unlimited")
+        for name, values in expected.items():
+            variable = nc.variables[name]
+            if variable.dimensions != ("point",):
+                failures.append(f"netCDF4: {name} has dimensions {variable.dimensions}")
+            read_values = variable[:]
+            if name == "start_timestamp":
+                read_values = netCDF4.num2date(
+                    read_values,
+                    variable.units,
+                    variable.calendar,
+                    only_use_cftime_datetimes=False,
+                    only_use_python_datetimes=True,
+                ).astype("datetime64[s]")
+            if not np.array_equal(np.asarray(read_values), values):
+                failures.append(f"netCDF4: {name} differs")
+    return failures
+
+
+def check_xarray_read(nc_fpath: Path, expected: dict) -> list[str]:
+    failures = []
+    with xr.open_dataset(nc_fpath) as dataset:
+        for name, values in expected.items():
+            read_values = dataset[name].values
+            if name == "start_timestamp":
+                read_values = read_values.astype("datetime64[s]")
+            if not np.array_equal(read_values, values):
+                failures.append(f"xarray: {name} differs")
+    return failures
+
+
+def check_cancellation(segments: list, config) -> list[str]:
+    """Cancelled after the first track: nothing is sent, no file is left"""
+    cancelled = threading.Event()
+
+    def generate_segments():
+        for segment in segments:
+            yield segment
+            cancelled.set()
+
+    tmp_dir = Path(tempfile.gettempdir())
+    nc_fpaths_before = set(tmp_dir.glob("*.nc"))
+    chunks = list(
+        generate_export_chunks(generate_segments(), "netcdf", config, cancelled)
+    )
+    failures = []
+    if chunks:
+        failures.append(f"cancelled export: {len(chunks)} chunks sent")
+    if set(tmp_dir.glob("*.nc")) - nc_fpaths_before:
+        failures.append("cancelled export: the temporary file is left")
+    return failures
+
+
+def run_check(args) -> int:
+    work_dir = Path(args.work_dir).absolute()
+    tracks_dir = work_dir / "tracks"
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    h5_fpaths = generate_synthetic_tracks(
+        tracks_dir, TRACKS_DATE_START, 1, config, num_scans=args.num_scans
+    )
+    save_downsampled_points_index(h5_fpaths, tracks_dir / NPZ_FNAME)
+    selection = DatesCoordsSelection(
+        date_start=TRACKS_DATE_START,
+        date_end=TRACKS_DATE_START,
+        latitude_min=-40.0,
+        latitude_max=40.0,
+        longitude_min=-120.0,
+        longitude_max=60.0,
+    )
+    segments = extract_segments(h5_fpaths, selection, config)
+    expected = get_expected_columns(segments, config)
+
+    nc_fpath = work_dir / "export.nc"
+    with open(nc_fpath, "wb") as fd:
+        for chunk in generate_export_chunks(iter(segments), "netcdf", config):
+            fd.write(chunk)
+
+    failures = (
+        check_netcdf4_read(nc_fpath, expected)
+        + check_xarray_read(nc_fpath, expected)
+        + check_cancellation(segments, config)
+    )
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    print(
+        f"{len(segments)} tracks, {expected['latitude'].size} points exported "
+        f"({nc_fpath.stat().st_size / 1e6:.1f} MB), read back with netCDF4 "
+        f"{netCDF4.__version__} and xarray {xr.__version__}: "
+        f"{len(failures)} failures"
+    )
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Export synthetic tracks to NetCDF, check that netCDF4 and xarray "
+            "read back the same values and that a cancelled export sends nothing"
+        )
+    )
+    parser.add_argument("--work-dir", default="./export_check_data")
+    parser.add_argument("--num-scans", type=int, default=NUM_SCANS_PER_ORBIT)
+    sys.exit(run_check(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
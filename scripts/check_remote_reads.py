@@ -0,0 +1,207 @@
+import argparse
+import os
+import socket
+import sys
+import time
+from http.server import SimpleHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+from hydra import compose, initialize
+
+from app.utils.remote_h5 import RemoteRangeFile, fetch_byte_range, get_block_cache
+from app.utils.track_file_contents import extract_segment_from_h5_file
+from scripts.benchmark_remote_reads import make_selection
+from scripts.load_test import NPZ_FNAME, prepare_tracks
+from scripts.local_stand_ins import (
+    FakeGCSBucketHandler,
+    QuietHandlerMixin,
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+
+STALL_TIMEOUT_SECONDS = 0.5
+
+
+class NoRangeRequestsHandler(QuietHandlerMixin, SimpleHTTPRequestHandler):
+    """A server ignoring the 'Range' header: the whole file is returned"""
+
+
+class CountingGCSBucketHandler(FakeGCSBucketHandler):
+    """Counts the metadata requests of the blobs (not the media downloads)"""
+
+    num_metadata_requests = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if "/o/" in url.path and parse_qs(url.query).get("alt") != ["media"]:
+            CountingGCSBucketHandler.num_metadata_requests += 1
+        super().do_GET()
+
+
+def check_byte_ranges(
+    url: str, h5_fpath: Path, block_size: int, rng: np.random.Generator
+) -> int:
+    """Random reads (across the blocks and past the end) against the local file"""
+    local_bytes = h5_fpath.read_bytes()
+    remote_file = RemoteRangeFile(
+        url,
+        block_size=block_size,
+        max_read_ahead_blocks=8,
+        block_cache=get_block_cache(1 << 30),
+        timeout_seconds=10.0,
+    )
+    num_mismatches = 0
+    for _ in range(50):
+        offset = int(rng.integers(0, len(local_bytes) + block_size))
+        num_bytes = int(rng.integers(1, 4 * block_size))
+        remote_file.seek(offset)
+        if remote_file.read(num_bytes) != local_bytes[offset : offset + num_bytes]:
+            num_mismatches += 1
+    remote_file.seek(0)
+    if remote_file.read() != local_bytes:
+        num_mismatches += 1
+    return num_mismatches
+
+
+def check_extraction(url: str, h5_fpath: Path, swath_edges_coords, config) -> int:
+    num_mismatches = 0
+    for roi_size_deg in (1.0, 20.0, 180.0):
+        selection = make_selection(h5_fpath, roi_size_deg, config)
+        remote_data = extract_segment_from_h5_file(
+            url, selection, config, swath_edges_coords
+        )
+        local_data = extract_segment_from_h5_file(h5_fpath, selection, config)
+        if not all(
+            np.array_equal(remote, local)
+            for remote, local in zip(remote_data, local_data)
+        ):
+            num_mismatches += 1
+    return num_mismatches
+
+
+def check_stalled_server() -> str | None:
+    """A server accepting the connection but never answering"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        host, port = sock.getsockname()
+        time_start = time.perf_counter()
+        try:
+            fetch_byte_range(
+                f"http://{host}:{port}/track.h5", 0, 1024, STALL_TIMEOUT_SECONDS
+            )
+        except requests.Timeout:
+            elapsed_seconds = time.perf_counter() - time_start
+            if elapsed_seconds > 5 * STALL_TIMEOUT_SECONDS:
+                return f"the timeout took {elapsed_seconds:.1f} s"
+            return None
+        return "no timeout"
+
+
+def run_check(args) -> int:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    tracks_dir = prepare_tracks(
+        Path(args.work_dir).absolute(), 1, num_scans=args.num_scans, seed=args.seed
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    h5_fpaths = h5_fpaths[: args.num_tracks]
+    fname_to_downsampled_points = np.load(tracks_dir / NPZ_FNAME)
+
+    servers = {
+        "http": start_http_server(TracksWebpageHandler, tracks_dir),
+        "http_no_range": start_http_server(NoRangeRequestsHandler, tracks_dir),
+        "gs": start_http_server(CountingGCSBucketHandler, tracks_dir),
+    }
+    os.environ["STORAGE_EMULATOR_HOST"] = get_server_url(servers["gs"])
+    url_prefixes = {
+        "http": get_server_url(servers["http"]),
+        "http_no_range": get_server_url(servers["http_no_range"]),
+        "gs": f"gs://{FakeGCSBucketHandler.bucket_name}",
+    }
+
+    failures = []
+    rng = np.random.default_rng(args.seed)
+    try:
+        for source, url_prefix in url_prefixes.items():
+            for block_size in (4096, config.remote_reading.block_size):
+                get_block_cache.cache_clear()
+                num_mismatches = sum(
+                    check_byte_ranges(
+                        f"{url_prefix}/{h5_fpath.name}", h5_fpath, block_size, rng
+                    )
+                    for h5_fpath in h5_fpaths
+                )
+                if num_mismatches > 0:
+                    failures.append(
+                        f"{source}, {block_size} B blocks: "
+                        f"{num_mismatches} byte ranges differ"
+                    )
+
+            get_block_cache.cache_clear()
+            metadata_requests_before = CountingGCSBucketHandler.num_metadata_requests
+            num_mismatches = sum(
+                check_extraction(
+                    f"{url_prefix}/{h5_fpath.name}",
+                    h5_fpath,
+                    fname_to_downsampled_points[h5_fpath.name],
+                    config,
+                )
+                for h5_fpath in h5_fpaths
+            )
+            if num_mismatches > 0:
+                failures.append(f"{source}: {num_mismatches} extractions differ")
+            num_metadata_requests = (
+                CountingGCSBucketHandler.num_metadata_requests
+                - metadata_requests_before
+            )
+            if (source == "gs") and (num_metadata_requests > 3 * len(h5_fpaths)):
+                failures.append(
+                    f"gs: {num_metadata_requests} metadata requests "
+                    f"for {3 * len(h5_fpaths)} opened files"
+                )
+
+            try:
+                fetch_byte_range(f"{url_prefix}/missing.h5", 0, 1024, 10.0)
+                failures.append(f"{source}: no error for a missing file")
+            except FileNotFoundError:
+                pass
+    finally:
+        for server in servers.values():
+            server.shutdown()
+
+    stalled_failure = check_stalled_server()
+    if stalled_failure is not None:
+        failures.append(f"stalled server: {stalled_failure}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    print(
+        f"{len(h5_fpaths)} tracks read through {', '.join(url_prefixes)} and "
+        f"compared with the local reads: {len(failures)} failures"
+    )
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check the remote reads of the synthetic tracks (random byte ranges "
+            "and extractions) against the local reads, through local stand-ins "
+            "of the webpage, of a server ignoring 'Range' and of the GCS bucket"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data")
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--num-tracks", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(run_check(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
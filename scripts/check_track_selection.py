@@ -0,0 +1,131 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.track_file_names import (
+    extract_end_timestamp_from_h5_url,
+    extract_start_timestamp_from_h5_url,
+    get_selection_time_interval,
+    map_start_timestamps_to_h5_urls,
+    select_h5_urls_by_date,
+    select_h5_urls_by_time_span,
+)
+from scripts.synthetic_tracks import GPM_ORBIT_PERIOD_MINUTES, make_track_fname
+
+ARCHIVE_DATE_START = date(year=2018, month=3, day=1)
+WEBPAGE_URL = "https://example.com/tracks"
+
+
+def make_catalog(num_days: int) -> dict[str, list[str]]:
+    """The consecutive orbits of 'synthetic_tracks' (names only, no files)"""
+    orbit_duration = timedelta(minutes=GPM_ORBIT_PERIOD_MINUTES)
+    start_timestamp = datetime.combine(ARCHIVE_DATE_START, datetime.min.time())
+    end_of_archive = start_timestamp + timedelta(days=num_days)
+    h5_urls_to_start_timestamps = {}
+    track_number = 15_000
+    while start_timestamp < end_of_archive:
+        start_timestamp = start_timestamp.replace(second=0, microsecond=0)
+        # ^ the file names have the minute precision
+        fname = make_track_fname(
+            start_timestamp, start_timestamp + orbit_duration, track_number
+        )
+        h5_urls_to_start_timestamps[f"{WEBPAGE_URL}/{fname}"] = (
+            start_timestamp.isoformat()
+        )
+        start_timestamp += orbit_duration
+        track_number += 1
+    return map_start_timestamps_to_h5_urls(h5_urls_to_start_timestamps)
+
+
+def select_overlapping_h5_urls(
+    selection: DatesCoordsSelection, start_timestamps_to_h5_urls: dict, config
+) -> set[str]:
+    """Brute force: every track of the archive overlapping the dates"""
+    interval_start, interval_end = get_selection_time_interval(selection)
+    return {
+        h5_url
+        for h5_urls in start_timestamps_to_h5_urls.values()
+        for h5_url in h5_urls
+        if (extract_start_timestamp_from_h5_url(h5_url, config) < interval_end)
+        and (
+            interval_start
+            < extract_end_timestamp_from_h5_url(h5_url, config) + timedelta(minutes=1)
+        )
+    }
+
+
+def run_check(args) -> int:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    start_timestamps_to_h5_urls = make_catalog(args.num_days)
+    failures = []
+    num_selections = 0
+    for first_day in range(args.num_days):
+        for num_days in (1, 2, 7):
+            selection = DatesCoordsSelection(
+                date_start=ARCHIVE_DATE_START + timedelta(days=first_day),
+                date_end=ARCHIVE_DATE_START + timedelta(days=first_day + num_days - 1),
+            )
+            h5_urls = select_h5_urls_by_time_span(
+                select_h5_urls_by_date(
+                    selection.date_start,
+                    selection.date_end,
+                    start_timestamps_to_h5_urls,
+                ),
+                selection,
+                config,
+            )
+            expected_h5_urls = select_overlapping_h5_urls(
+                selection, start_timestamps_to_h5_urls, config
+            )
+            num_selections += 1
+            if set(h5_urls) != expected_h5_urls:
+                failures.append(
+                    f"{selection.date_start} to {selection.date_end}: "
+                    f"{len(expected_h5_urls - set(h5_urls))} tracks missing, "
+                    f"{len(set(h5_urls) - expected_h5_urls)} extra"
+                )
+
+            crossing_h5_urls = [
+                h5_url
+                for h5_url in expected_h5_urls
+                if extract_start_timestamp_from_h5_url(h5_url, config).date()
+                < selection.date_start
+            ]
+            if (first_day > 0) and (len(crossing_h5_urls) != 1):
+                failures.append(
+                    f"{selection.date_start}: {len(crossing_h5_urls)} tracks "
+                    "crossing the midnight before, expected 1"
+                )
+            if not set(crossing_h5_urls) <= set(h5_urls):
+                failures.append(
+                    f"{selection.date_start}: the track crossing the midnight "
+                    "before is missing"
+                )
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    print(
+        f"{num_selections} date ranges selected from {args.num_days} days of "
+        f"orbits and compared with the overlapping tracks: {len(failures)} failures"
+    )
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check that the selection by date returns exactly the tracks "
+            "overlapping the dates, including the ones crossing midnight"
+        )
+    )
+    parser.add_argument("--num-days", type=int, default=10)
+    sys.exit(run_check(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
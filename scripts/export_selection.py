@@ -0,0 +1,57 @@
+import argparse
+import sys
+
+import requests
+
+from app.utils.export import EXPORT_FORMATS_TO_EXTENSIONS
+
+CHUNK_SIZE = 1 << 20
+
+
+def export_selection(args) -> None:
+    selection = {
+        "date_start": args.date_start,
+        "date_end": args.date_end,
+        "latitude_min": args.latitude_min,
+        "latitude_max": args.latitude_max,
+        "longitude_min": args.longitude_min,
+        "longitude_max": args.longitude_max,
+    }
+    output = args.output or (
+        f"export_{args.date_start}_{args.date_end}"
+        f"{EXPORT_FORMATS_TO_EXTENSIONS[args.format]}"
+    )
+    with requests.get(
+        f"{args.backend_url.rstrip('/')}/export/",
+        params={"export_format": args.format},
+        json=selection,
+        stream=True,
+    ) as response:
+        if response.status_code != 200:
+            sys.exit(f"Error {response.status_code}: {response.text}")
+        num_bytes = 0
+        with open(output, "wb") as fd:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                fd.write(chunk)
+                num_bytes += len(chunk)
+    print(f"Written {num_bytes} bytes to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the points of a selection to a CSV, Parquet or NetCDF file"
+    )
+    parser.add_argument("--backend-url", default="http://localhost:8000")
+    parser.add_argument("--date-start", required=True, help="yyyy-mm-dd")
+    parser.add_argument("--date-end", required=True, help="yyyy-mm-dd")
+    parser.add_argument("--latitude-min", type=float, default=-90.0)
+    parser.add_argument("--latitude-max", type=float, default=90.0)
+    parser.add_argument("--longitude-min", type=float, default=-180.0)
+    parser.add_argument("--longitude-max", type=float, default=180.0)
+    parser.add_argument(
+        "--format", choices=list(EXPORT_FORMATS_TO_EXTENSIONS), default="parquet"
+    )
+    parser.add_argument("--output", default=None, help="output file")
+    args = parser.parse_args()
+
+    export_selection(args)
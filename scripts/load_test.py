@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import requests
+from hydra import compose, initialize
+
+from scripts.local_stand_ins import (
+    FakeGCSBucketHandler,
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+from scripts.synthetic_tracks import (
+    generate_synthetic_tracks,
+    save_downsampled_points_index,
+)
+
+REPO_DIR = Path(__file__).absolute().parent.parent
+ARCHIVE_DATE_START = date(year=2018, month=3, day=1)
+NPZ_FNAME = "fname_to_downsampled_points.npz"
+METRICS_SETTLE_SECONDS = 1.5
+# ^ longer than 'metrics.snapshot_interval_seconds', so that '/metrics' includes
+#   the latest counts of all worker processes
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_metrics(metrics_text: str) -> dict[str, float]:
+    """'name{labels} value' lines of the Prometheus text format -> dict"""
+    samples = {}
+    for line in metrics_text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def prepare_tracks(work_dir: Path, num_days: int, num_scans: int, seed: int) -> Path:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(config_name="config.yaml")
+
+    tracks_dir = work_dir / "tracks"
+    generate_synthetic_tracks(
+        tracks_dir,
+        ARCHIVE_DATE_START,
+        num_days,
+        config,
+        seed=seed,
+        num_scans=num_scans,
+    )
+    h5_fpaths = sorted(tracks_dir.glob(f"*{config.hdf_fname_extension}"))
+    # ^ all the served tracks, including those of previous runs with more days
+    npz_fpath = tracks_dir / NPZ_FNAME
+    if not npz_fpath.is_file() or set(np.load(npz_fpath).files) != {
+        h5_fpath.name for h5_fpath in h5_fpaths
+    }:
+        save_downsampled_points_index(h5_fpaths, npz_fpath)
+    return tracks_dir
+
+
+def start_backend(
+    app_run_dir: Path,
+    webpage_url: str,
+    bucket_url: str,
+    use_gcs_bucket: bool,
+    num_workers: int,
+    config_overrides: tuple[str, ...] = (),
+) -> tuple[subprocess.Popen, str]:
+    """Boot the app against the local stand-ins, wait until it is ready"""
+    app_run_dir.mkdir(parents=True, exist_ok=True)
+    (app_run_dir / "shared_state" / NPZ_FNAME).unlink(missing_ok=True)
+    # ^ the app downloads the index from the stand-in on startup
+
+    port = get_free_port()
+    env = dict(
+        os.environ,
+        STORAGE_EMULATOR_HOST=bucket_url,
+        GCS_BUCKET_NAME=FakeGCSBucketHandler.bucket_name,
+        APP_CONFIG_OVERRIDES=" ".join(
+            [
+                f"url_webpage_all_tracks={webpage_url}/",
+                f"url_npz_track_to_downsampled_swath_points={webpage_url}/{NPZ_FNAME}",
+                f"use_gcs_bucket={str(use_gcs_bucket).lower()}",
+                f"hdf_caching.dir={app_run_dir / 'cached_h5_files'}",
+                f"shared_state.dir={app_run_dir / 'shared_state'}",
+                *config_overrides,
+            ]
+        ),
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main_fastapi:app",
+            "--app-dir",
+            str(REPO_DIR),
+            "--port",
+            str(port),
+            "--workers",
+            str(num_workers),
+            "--log-level",
+            "warning",
+        ],
+        cwd=app_run_dir,
+        env=env,
+    )
+
+    backend_url = f"http://127.0.0.1:{port}"
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError("The backend has exited during startup")
+        try:
+            if requests.get(f"{backend_url}/metrics", timeout=1).status_code == 200:
+                return process, backend_url
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+
+
+def make_random_queries(
+    num_queries: int,
+    archive_num_days: int,
+    max_date_span_days: int,
+    roi_sizes_deg: list[float],
+    rng: np.random.Generator,
+) -> list[dict]:
+    queries = []
+    for _ in range(num_queries):
+        date_span_days = int(
+            rng.integers(1, min(max_date_span_days, archive_num_days) + 1)
+        )
+        first_day = int(rng.integers(0, archive_num_days - date_span_days + 1))
+        date_start = ARCHIVE_DATE_START + timedelta(days=first_day)
+        roi_size_deg = float(rng.choice(roi_sizes_deg))
+        latitude_center = rng.uniform(-60.0, 60.0)
+        longitude_center = rng.uniform(-170.0, 170.0)
+        queries.append(
+            {
+                "date_start": date_start.isoformat(),
+                "date_end": (
+                    date_start + timedelta(days=date_span_days - 1)
+                ).isoformat(),
+                "latitude_min": max(latitude_center - roi_size_deg / 2, -90.0),
+                "latitude_max": min(latitude_center + roi_size_deg / 2, 90.0),
+                "longitude_min": max(longitude_center - roi_size_deg / 2, -180.0),
+                "longitude_max": min(longitude_center + roi_size_deg / 2, 180.0),
+            }
+        )
+    return queries
+
+
+def run_load_level(
+    backend_url: str,
+    queries: list[dict],
+    concurrency: int,
+    encoding: str,
+) -> dict:
+    thread_local = threading.local()
+
+    def send_query(query: dict) -> tuple[float, int]:
+        if not hasattr(thread_local, "session"):
+            thread_local.session = requests.Session()
+        time_start = time.perf_counter()
+        response = thread_local.session.get(
+            f"{backend_url}/dates_coords_selection/",
+            params={"encoding": encoding},
+            json=query,
+        )
+        return time.perf_counter() - time_start, response.status_code
+
+    time.sleep(METRICS_SETTLE_SECONDS)
+    metrics_before = parse_metrics(requests.get(f"{backend_url}/metrics").text)
+    time_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(send_query, queries))
+    elapsed_seconds = time.perf_counter() - time_start
+    time.sleep(METRICS_SETTLE_SECONDS)
+    metrics_after = parse_metrics(requests.get(f"{backend_url}/metrics").text)
+
+    def metric_delta(name: str) -> float:
+        return metrics_after.get(name, 0.0) - metrics_before.get(name, 0.0)
+
+    latencies = np.array([latency for latency, _ in outcomes])
+    num_ok = sum(status == 200 for _, status in outcomes)
+    return {
+        "concurrency": concurrency,
+        "num_requests": len(queries),
+        "num_ok": num_ok,
+        "elapsed_seconds": elapsed_seconds,
+        "throughput_rps": len(queries) / elapsed_seconds,
+        "latency_p50_seconds": float(np.percentile(latencies, 50)),
+        "latency_p95_seconds": float(np.percentile(latencies, 95)),
+        "latency_p99_seconds": float(np.percentile(latencies, 99)),
+        "cache_hits": metric_delta('gpm_cache_lookups_total{result="hit"}'),
+        "cache_misses": metric_delta('gpm_cache_lookups_total{result="miss"}'),
+        "downloaded_bytes": metric_delta("gpm_downloaded_bytes_total"),
+    }
+
+
+def run_load_test(args) -> dict:
+    work_dir = Path(args.work_dir)
+    tracks_dir = prepare_tracks(work_dir, args.num_days, args.num_scans, args.seed)
+    app_run_dir = work_dir / "app_run"
+    if args.cold_cache:
+        shutil.rmtree(app_run_dir / "cached_h5_files", ignore_errors=True)
+
+    webpage_server = start_http_server(TracksWebpageHandler, tracks_dir)
+    bucket_server = start_http_server(FakeGCSBucketHandler, tracks_dir)
+
+    time_start = time.perf_counter()
+    backend_process, backend_url = start_backend(
+        app_run_dir,
+        get_server_url(webpage_server),
+        get_server_url(bucket_server),
+        args.use_gcs_bucket,
+        args.workers,
+    )
+    startup_seconds = time.perf_counter() - time_start
+
+    rng = np.random.default_rng(args.seed)
+    levels = []
+    try:
+        for concurrency in args.concurrency:
+            queries = make_random_queries(
+                args.requests_per_level,
+                args.num_days,
+                args.max_date_span_days,
+                args.roi_sizes_deg,
+                rng,
+            )
+            level = run_load_level(backend_url, queries, concurrency, args.encoding)
+            levels.append(level)
+            print(
+                f"concurrency {concurrency:3d}: "
+                f"{level['throughput_rps']:6.2f} req/s, "
+                f"p50 {level['latency_p50_seconds']:6.2f} s, "
+                f"p95 {level['latency_p95_seconds']:6.2f} s, "
+                f"p99 {level['latency_p99_seconds']:6.2f} s, "
+                f"ok {level['num_ok']}/{level['num_requests']}, "
+                f"cache hits/misses {level['cache_hits']:.0f}/"
+                f"{level['cache_misses']:.0f}, "
+                f"downloaded {level['downloaded_bytes'] / 1e6:.1f} MB"
+            )
+    finally:
+        backend_process.terminate()
+        backend_process.wait()
+        webpage_server.shutdown()
+        bucket_server.shutdown()
+
+    return {
+        "startup_seconds": startup_seconds,
+        "workers": args.workers,
+        "use_gcs_bucket": args.use_gcs_bucket,
+        "levels": levels,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Load-test the backend against local stand-ins "
+            "for the tracks' webpage and the GCS bucket"
+        )
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data/load_test")
+    parser.add_argument("--num-days", type=int, default=6)
+    parser.add_argument("--num-scans", type=int, default=7934)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests-per-level", type=int, default=16)
+    parser.add_argument("--max-date-span-days", type=int, default=3)
+    parser.add_argument(
+        "--roi-sizes-deg", type=float, nargs="+", default=[5.0, 20.0, 60.0]
+    )
+    parser.add_argument("--encoding", default="compact", choices=["npz", "compact"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--use-gcs-bucket", action="store_true")
+    parser.add_argument(
+        "--cold-cache", action="store_true", help="empty the track files cache first"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="output JSON file")
+    args = parser.parse_args()
+
+    load_test_results = run_load_test(args)
+    print(f"startup: {load_test_results['startup_seconds']:.1f} s")
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(load_test_results, fd, indent=2)
@@ -0,0 +1,158 @@
+import io
+import json
+import os
+import re
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class QuietHandlerMixin:
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeRequestsMixin:
+    """Answers 'Range: bytes=<start>-<end>' requests for files with 206"""
+
+    def send_head(self):
+        fpath = self.translate_path(self.path)
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if (match is None) or not os.path.isfile(fpath):
+            return super().send_head()
+
+        size = os.path.getsize(fpath)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        if start >= size:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+        with open(fpath, "rb") as fd:
+            fd.seek(start)
+            data = fd.read(end - start + 1)
+
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(fpath))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+class ThrottlingMixin:
+    """Sends the files at 'bytes_per_second' (a slow network stand-in)"""
+
+    bytes_per_second = 4_000_000
+
+    def copyfile(self, source, outputfile):
+        chunk_size = max(self.bytes_per_second // 20, 1)
+        try:
+            while chunk := source.read(chunk_size):
+                outputfile.write(chunk)
+                time.sleep(len(chunk) / self.bytes_per_second)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+            # ^ the client has given up
+
+
+class TracksWebpageHandler(
+    QuietHandlerMixin, RangeRequestsMixin, SimpleHTTPRequestHandler
+):
+    """
+    Stand-in for the tracks' webpage: the directory listing is the HTML page
+    with the links to the track files, which are served as they are.
+    """
+
+
+class FakeGCSBucketHandler(
+    QuietHandlerMixin, RangeRequestsMixin, SimpleHTTPRequestHandler
+):
+    """
+    Stand-in for the GCS JSON API (the subset used by google-cloud-storage
+    for getting the bucket, listing its blobs and downloading them);
+    the blobs are the files in the served directory. The clients find it
+    through the STORAGE_EMULATOR_HOST env. variable.
+    """
+
+    bucket_name = "fake-bucket"
+
+    def send_json(self, content: dict, status: int = 200) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def blob_resource(self, fpath: Path) -> dict:
+        return {
+            "kind": "storage#object",
+            "bucket": self.bucket_name,
+            "name": fpath.name,
+            "size": str(fpath.stat().st_size),
+        }
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        directory = Path(self.directory)
+
+        if parts[:3] == ["download", "storage", "v1"]:
+            parts = parts[3:]
+            # ^ media downloads: /download/storage/v1/b/<bucket>/o/<blob>?alt=media
+        elif parts[:2] == ["storage", "v1"]:
+            parts = parts[2:]
+        else:
+            self.send_json({"error": {"code": 404}}, status=404)
+            return
+
+        if (len(parts) < 2) or (parts[0] != "b") or (parts[1] != self.bucket_name):
+            self.send_json({"error": {"code": 404, "message": "No such bucket"}}, 404)
+        elif len(parts) == 2:
+            self.send_json({"kind": "storage#bucket", "name": self.bucket_name})
+        elif len(parts) == 3 and parts[2] == "o":
+            items = [
+                self.blob_resource(fpath)
+                for fpath in sorted(directory.iterdir())
+                if fpath.is_file()
+            ]
+            self.send_json({"kind": "storage#objects", "items": items})
+        elif len(parts) >= 4 and parts[2] == "o":
+            fpath = directory / "/".join(parts[3:])
+            if not fpath.is_file():
+                self.send_json({"error": {"code": 404}}, status=404)
+            elif parse_qs(url.query).get("alt") == ["media"]:
+                self.path = "/" + fpath.name
+                super().do_GET()
+            else:
+                self.send_json(self.blob_resource(fpath))
+        else:
+            self.send_json({"error": {"code": 404}}, status=404)
+
+
+class ThrottledTracksWebpageHandler(ThrottlingMixin, TracksWebpageHandler):
+    pass
+
+
+def start_http_server(
+    handler_class,
+    directory: Path,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ThreadingHTTPServer:
+    """Serve the directory in a background thread (port 0: any free port)"""
+    server = ThreadingHTTPServer(
+        (host, port), partial(handler_class, directory=str(directory))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def get_server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
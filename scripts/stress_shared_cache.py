@@ -0,0 +1,107 @@
+import argparse
+import multiprocessing
+import shutil
+from pathlib import Path
+
+import numpy as np
+from hydra import compose, initialize
+
+from app.core.cache_index import SharedCacheIndex
+from app.utils.track_file_names import download_missing_h5_files
+from scripts.load_test import ARCHIVE_DATE_START
+from scripts.local_stand_ins import (
+    TracksWebpageHandler,
+    get_server_url,
+    start_http_server,
+)
+from scripts.synthetic_tracks import generate_synthetic_tracks
+
+
+def run_worker(worker_args: tuple) -> int:
+    """Download random subsets of the tracks as the endpoint does"""
+    config, h5_urls, num_iterations, subset_size, seed = worker_args
+    rng = np.random.default_rng(seed)
+    cached_h5_fpaths = SharedCacheIndex(Path(config.hdf_caching.dir))
+
+    num_files = 0
+    for _ in range(num_iterations):
+        subset = list(rng.choice(h5_urls, size=subset_size, replace=False))
+        num_files += len(download_missing_h5_files(subset, config, cached_h5_fpaths))
+    return num_files
+
+
+def check_cache_consistency(cache_dir: Path, fname_extension: str, max_num: int):
+    indexed_fnames = SharedCacheIndex(cache_dir).fnames()
+    fnames_on_disk = sorted(
+        fpath.name for fpath in cache_dir.glob(f"*{fname_extension}")
+    )
+    partial_fnames = sorted(fpath.name for fpath in cache_dir.glob(".*.part"))
+
+    problems = []
+    if len(indexed_fnames) != len(set(indexed_fnames)):
+        problems.append("duplicate entries in the index")
+    if sorted(indexed_fnames) != fnames_on_disk:
+        problems.append(
+            f"index/disk mismatch: {len(indexed_fnames)} indexed files, "
+            f"{len(fnames_on_disk)} files on disk"
+        )
+    if len(indexed_fnames) > max_num:
+        problems.append(f"{len(indexed_fnames)} cached files > the limit {max_num}")
+    if partial_fnames:
+        problems.append(f"partial files left: {partial_fnames}")
+    return indexed_fnames, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the cache accounting with several concurrent processes"
+    )
+    parser.add_argument("--work-dir", default="./benchmark_data/stress_shared_cache")
+    parser.add_argument("--num-workers", type=int, default=8)
+    parser.add_argument("--num-iterations", type=int, default=20)
+    parser.add_argument("--subset-size", type=int, default=5)
+    parser.add_argument("--max-num-cached-files", type=int, default=10)
+    parser.add_argument("--num-days", type=int, default=2)
+    parser.add_argument("--num-scans", type=int, default=500)
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir)
+    cache_dir = work_dir / "cached_h5_files"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    with initialize(version_base=None, config_path="../"):
+        config = compose(
+            config_name="config.yaml",
+            overrides=[
+                f"hdf_caching.dir={cache_dir}",
+                f"hdf_caching.max_num_cached_files={args.max_num_cached_files}",
+            ],
+        )
+
+    tracks_dir = work_dir / "tracks"
+    h5_fpaths = generate_synthetic_tracks(
+        tracks_dir, ARCHIVE_DATE_START, args.num_days, config, num_scans=args.num_scans
+    )
+    webpage_server = start_http_server(TracksWebpageHandler, tracks_dir)
+    h5_urls = [f"{get_server_url(webpage_server)}/{fpath.name}" for fpath in h5_fpaths]
+
+    with multiprocessing.get_context("spawn").Pool(args.num_workers) as pool:
+        nums_files = pool.map(
+            run_worker,
+            [
+                (config, h5_urls, args.num_iterations, args.subset_size, seed)
+                for seed in range(args.num_workers)
+            ],
+        )
+    webpage_server.shutdown()
+
+    indexed_fnames, problems = check_cache_consistency(
+        cache_dir, config.hdf_fname_extension, args.max_num_cached_files
+    )
+    print(
+        f"{args.num_workers} workers got {sum(nums_files)} files, "
+        f"{len(indexed_fnames)} files are cached and indexed"
+    )
+    if problems:
+        raise SystemExit("Inconsistent cache accounting: " + "; ".join(problems))
+    print("The cache accounting is consistent")
@@ -0,0 +1,188 @@
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import h5py
+import numpy as np
+from omegaconf import DictConfig
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.utils.track_file_contents import downsample_swath_points
+
+GPM_INCLINATION_DEG = 65.0
+GPM_ORBIT_PERIOD_MINUTES = 92.6
+NUM_SCANS_PER_ORBIT = 7934
+NUM_RAYS_PER_SCAN = 49
+SWATH_WIDTH_KM = 245.0
+EARTH_RADIUS_KM = 6371.0
+EARTH_ROTATION_DEG_PER_MINUTE = 360.0 / 1436.07
+
+INVALID_POINTS_FRACTION = 0.05
+# ^ fraction of the points with the observable set to 'value_invalid'
+
+
+def make_synthetic_swath(
+    num_scans: int = NUM_SCANS_PER_ORBIT,
+    start_longitude: float = 0.0,
+    start_argument_of_latitude: float = 0.0,
+    value_invalid: float = 9999.0,
+    rng: np.random.Generator | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generate the (num_scans, NUM_RAYS_PER_SCAN) arrays of the latitude,
+    longitude and U10 for a GPM-like orbit: the circular orbit with
+    the 65 deg inclination, the ~245 km wide swath across the ground track,
+    the Earth rotating underneath; the wind speed is a smooth field with noise.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    inclination = np.radians(GPM_INCLINATION_DEG)
+    scan_idxs = np.arange(num_scans)
+    argument_of_latitude = (
+        np.radians(start_argument_of_latitude)
+        + 2 * np.pi * scan_idxs / NUM_SCANS_PER_ORBIT
+    )
+    minutes = scan_idxs * GPM_ORBIT_PERIOD_MINUTES / NUM_SCANS_PER_ORBIT
+
+    # nadir points and the orbit normal in the inertial frame:
+    nadir = np.stack(
+        [
+            np.cos(argument_of_latitude),
+            np.cos(inclination) * np.sin(argument_of_latitude),
+            np.sin(inclination) * np.sin(argument_of_latitude),
+        ],
+        axis=-1,
+    )
+    orbit_normal = np.array([0.0, -np.sin(inclination), np.cos(inclination)])
+
+    half_swath_angle = SWATH_WIDTH_KM / 2 / EARTH_RADIUS_KM
+    cross_track_angles = np.linspace(
+        -half_swath_angle, half_swath_angle, NUM_RAYS_PER_SCAN
+    )
+    footprints = (
+        np.cos(cross_track_angles)[None, :, None] * nadir[:, None, :]
+        + np.sin(cross_track_angles)[None, :, None] * orbit_normal[None, None, :]
+    )
+
+    latitude = np.degrees(np.arcsin(np.clip(footprints[..., 2], -1.0, 1.0)))
+    longitude = (
+        np.degrees(np.arctan2(footprints[..., 1], footprints[..., 0]))
+        + start_longitude
+        - EARTH_ROTATION_DEG_PER_MINUTE * minutes[:, None]
+    )
+    longitude = (longitude + 180.0) % 360.0 - 180.0
+
+    u10 = (
+        7.0
+        + 4.0 * np.sin(np.radians(3 * latitude)) * np.cos(np.radians(2 * longitude))
+        + rng.gamma(shape=2.0, scale=1.0, size=latitude.shape)
+    )
+    u10 = np.clip(u10, 0.0, None)
+    invalid_mask = rng.random(latitude.shape) < INVALID_POINTS_FRACTION
+    u10[invalid_mask] = value_invalid
+
+    return latitude, longitude, u10
+
+
+def make_track_fname(
+    start_timestamp: datetime,
+    end_timestamp: datetime,
+    track_number: int,
+) -> str:
+    """E.g. 'mss_U10_NGPMCOR_DPR_1803020045_0217_022766_L2S_DD2_06A.h5'"""
+    return (
+        f"mss_U10_NGPMCOR_DPR_{start_timestamp:%y%m%d%H%M}_{end_timestamp:%H%M}_"
+        f"{track_number:06d}_L2S_DD2_06A.h5"
+    )
+
+
+def write_synthetic_track(
+    fpath: Path,
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    observable: np.ndarray,
+    observable_name: str,
+) -> None:
+    """Write the datasets with the same names and layout as in the real tracks"""
+    chunks = (min(512, latitude.shape[0]), latitude.shape[1])
+    with h5py.File(fpath, "w") as h5:
+        for name, values in (
+            ("Latitude", latitude),
+            ("Longitude", longitude),
+            (observable_name, observable),
+        ):
+            h5.create_dataset(
+                name, data=values, chunks=chunks, compression="gzip", compression_opts=4
+            )
+
+
+def generate_synthetic_tracks(
+    output_dir: Path,
+    date_start: date,
+    num_days: int,
+    config: DictConfig,
+    seed: int = 0,
+    num_scans: int = NUM_SCANS_PER_ORBIT,
+) -> list[Path]:
+    """
+    Write the consecutive orbits (one track file per orbit) covering
+    'num_days' days starting from 'date_start'.
+    """
+    rng = np.random.default_rng(seed)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    orbit_duration = timedelta(minutes=GPM_ORBIT_PERIOD_MINUTES)
+    scans_duration = orbit_duration * num_scans / NUM_SCANS_PER_ORBIT
+    start_timestamp = datetime.combine(date_start, datetime.min.time())
+    end_of_period = start_timestamp + timedelta(days=num_days)
+    start_longitude = rng.uniform(-180.0, 180.0)
+    track_number = int(rng.integers(10_000, 20_000))
+
+    h5_fpaths = []
+    while start_timestamp < end_of_period:
+        end_timestamp = start_timestamp + scans_duration
+        latitude, longitude, observable = make_synthetic_swath(
+            num_scans,
+            start_longitude=start_longitude,
+            value_invalid=config.hdf_observable.value_invalid,
+            rng=rng,
+        )
+        fpath = output_dir / make_track_fname(
+            start_timestamp, end_timestamp, track_number
+        )
+        if not fpath.is_file():
+            write_synthetic_track(
+                fpath,
+                latitude,
+                longitude,
+                observable,
+                config.hdf_observable.value_name,
+            )
+        h5_fpaths.append(fpath)
+
+        start_timestamp += orbit_duration
+        start_longitude -= EARTH_ROTATION_DEG_PER_MINUTE * GPM_ORBIT_PERIOD_MINUTES
+        start_longitude = (start_longitude + 180.0) % 360.0 - 180.0
+        track_number += 1
+
+    return h5_fpaths
+
+
+def save_downsampled_points_index(
+    h5_fpaths: list[Path],
+    npz_fpath: Path,
+) -> None:
+    """Same contents as the 'fname_to_downsampled_points.npz' for the real tracks"""
+    selection = DatesCoordsSelection(
+        date_start=date(year=2018, month=3, day=2),
+        date_end=date(year=2018, month=3, day=2),
+    )
+    fname_to_downsampled_points = {}
+    for h5_fpath in h5_fpaths:
+        downsampled_swath_bounds = downsample_swath_points(h5_fpath, selection)
+        fname_to_downsampled_points[h5_fpath.name] = (
+            downsampled_swath_bounds.latitude,
+            downsampled_swath_bounds.longitude,
+        )
+
+    np.savez(npz_fpath, **fname_to_downsampled_points)
@@ -1,5 +1,4 @@
 import os
-from collections import deque
 from datetime import date
 
 import matplotlib.pyplot as plt
@@ -9,6 +8,7 @@ from dotenv import load_dotenv
 from hydra import compose, initialize
 
 from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.cache_index import SharedCacheIndex
 from app.utils.map_drawing_matplotlib import draw_points, prepare_map
 from app.utils.track_file_contents import extract_segment_from_h5_file
 from app.utils.track_file_names import (
@@ -56,7 +56,9 @@ def draw_points_matplotlib():
         "https://sat.ipfran.ru/GPM_Ku_mss_U10/mss_U10_NGPMCOR_DPR_1803032301_0034_022796_L2S_DD2_06A.h5",
     ]
 
-    h5_fpaths = download_missing_h5_files(selected_h5_urls, config, deque())
+    h5_fpaths = download_missing_h5_files(
+        selected_h5_urls, config, SharedCacheIndex(config.hdf_caching.dir)
+    )
 
     if False:
         selection = DatesCoordsSelection(
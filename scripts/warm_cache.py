@@ -0,0 +1,104 @@
+import argparse
+import shlex
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+from hydra import compose, initialize
+
+from app.api.schemas.dates_coords_selection import DatesCoordsSelection
+from app.core.shared_state import load_shared_state
+from app.utils.track_file_names import (
+    download_missing_h5_files,
+    get_cached_fpath,
+    select_h5_urls_by_coords,
+    select_h5_urls_by_date,
+    select_h5_urls_by_time_span,
+)
+
+MAX_SELECTION_DAYS = 31
+
+
+def split_date_range(date_start: date, date_end: date) -> list[tuple[date, date]]:
+    """Consecutive ranges within the selection limit of 31 days"""
+    ranges = []
+    while date_start <= date_end:
+        range_end = min(date_start + timedelta(days=MAX_SELECTION_DAYS - 1), date_end)
+        ranges.append((date_start, range_end))
+        date_start = range_end + timedelta(days=1)
+    return ranges
+
+
+def warm_cache(args) -> None:
+    with initialize(version_base=None, config_path="../"):
+        config = compose(
+            config_name="config.yaml", overrides=shlex.split(args.overrides)
+        )
+
+    (
+        start_timestamps_to_h5_urls,
+        fname_to_downsampled_points,
+        cached_h5_fpaths,
+    ) = load_shared_state(config)
+
+    h5_urls = []
+    for range_start, range_end in split_date_range(
+        date.fromisoformat(args.date_start), date.fromisoformat(args.date_end)
+    ):
+        selection = DatesCoordsSelection(
+            date_start=range_start,
+            date_end=range_end,
+            latitude_min=args.latitude_min,
+            latitude_max=args.latitude_max,
+            longitude_min=args.longitude_min,
+            longitude_max=args.longitude_max,
+        )
+        h5_urls_in_range = select_h5_urls_by_time_span(
+            select_h5_urls_by_date(
+                selection.date_start, selection.date_end, start_timestamps_to_h5_urls
+            ),
+            selection,
+            config,
+        )
+        h5_urls.extend(
+            select_h5_urls_by_coords(
+                h5_urls_in_range, selection, fname_to_downsampled_points
+            )
+        )
+    h5_urls = list(dict.fromkeys(h5_urls))
+
+    max_num_cached_files = config.hdf_caching.max_num_cached_files
+    print(f"{len(h5_urls)} tracks intersect the region in the date range")
+    if len(h5_urls) > max_num_cached_files:
+        print(
+            f"Only the last {max_num_cached_files} of them fit in the cache "
+            "(see 'hdf_caching.max_num_cached_files')"
+        )
+        h5_urls = h5_urls[-max_num_cached_files:]
+
+    num_missing = sum(
+        not get_cached_fpath(h5_url, config).exists() for h5_url in h5_urls
+    )
+    h5_fpaths = download_missing_h5_files(h5_urls, config, cached_h5_fpaths)
+    print(f"{len(h5_fpaths)} tracks are in the cache ({num_missing} were missing)")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Download the tracks of a date range and a region to the cache"
+    )
+    parser.add_argument("--date-start", required=True, help="yyyy-mm-dd")
+    parser.add_argument("--date-end", required=True, help="yyyy-mm-dd")
+    parser.add_argument("--latitude-min", type=float, default=-90.0)
+    parser.add_argument("--latitude-max", type=float, default=90.0)
+    parser.add_argument("--longitude-min", type=float, default=-180.0)
+    parser.add_argument("--longitude-max", type=float, default=180.0)
+    parser.add_argument(
+        "--overrides",
+        default="",
+        help="config overrides as for the backend, e.g. 'hdf_caching.dir=/data'",
+    )
+    args = parser.parse_args()
+
+    warm_cache(args)